@@ -1,12 +1,32 @@
 import streamlit as st
-import tempfile
-import os
 from typing import Dict, List, Any
 from dotenv import load_dotenv
 load_dotenv()
 
-from graph import app  
-from constants import STATE_SUBSIDY_DOMAINS
+from streamlit.runtime import Runtime, exists as runtime_exists
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from graph import build_initial_state
+from constants import get_state_subsidy_domains
+from warmup import start_background_warmup
+from deadline import DEFAULT_BUDGET_S
+from diagnosis_runner import DIAGNOSIS_RUNNER, RunnerBusy, DONE, CANCELLED, PIPELINE_NODES
+from reference_data import start_reference_watcher
+
+# Compile the graph and open clients in the background while the page renders
+start_background_warmup()
+# Pick up edits to schemes.json / pests.json / state_domains.json without a restart
+start_reference_watcher()
+
+
+def session_alive(session_id: str) -> bool:
+    """False once the browser tab of the session is closed (its diagnosis is then cancelled)."""
+    return not runtime_exists() or Runtime.instance().is_active_session(session_id)
+
+# Diagnoses run on the runner's thread pool, not on the script thread (see diagnosis_runner.py)
+DIAGNOSIS_RUNNER.session_alive = session_alive
+ctx = get_script_run_ctx()
+session_id = ctx.session_id if ctx else "local"
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
@@ -160,12 +180,13 @@ with st.sidebar:
     st.markdown("### Field Data Input")
 
     with st.form("analysis_form"):
-        uploaded_file = st.file_uploader(
-            "Upload Crop Image", 
-            type=["jpg", "jpeg", "png"]
+        uploaded_files = st.file_uploader(
+            "Upload Crop Images (one or more photos of the same field)", 
+            type=["jpg", "jpeg", "png"],
+            accept_multiple_files=True
         )
 
-        state_list = sorted(list(STATE_SUBSIDY_DOMAINS.keys()))
+        state_list = sorted(list(get_state_subsidy_domains().keys()))
         default_index = state_list.index("Punjab") if "Punjab" in state_list else 0
         location = st.selectbox("State / Region", state_list, index=default_index)
 
@@ -186,6 +207,7 @@ with st.sidebar:
         )
 
     if st.button("🔄 New Session"):
+        DIAGNOSIS_RUNNER.cancel_session(session_id)
         st.session_state.clear()
         st.rerun()
 
@@ -194,26 +216,27 @@ st.markdown('<div class="main-header">🌿 Agri-Agent Command Center</div>', uns
 st.markdown('<div class="sub-header">AI-Driven Pest Diagnostics & Resource Optimization Engine</div>', unsafe_allow_html=True)
 
 
-# --- MAIN APP LOGIC ---
-if run_btn and uploaded_file:
-    
-    # 1. SAVE IMAGE
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp_file:
-        tmp_file.write(uploaded_file.getvalue())
-        temp_image_path = tmp_file.name
-
-    # 2. RUN THE AI PIPELINE (with status spinner)
-    with st.spinner("Processing Field Data... Organizing Sustainability Protocols..."):
-        initial_state = {
-            "image_path": temp_image_path,
-            "location": location,
-            "month": month,
-            "crop": crop,
-            "recommended_pesticides": [],
-            "environmental_impact_report": None,
-            "subsidy_info": []
-        }
-        final_state = app.invoke(initial_state)
+# --- PROGRESS OF THE BACKGROUND RUN (polled without re-running the page) ---
+@st.fragment(run_every=1.0)
+def show_progress(run_id: str):
+    run = DIAGNOSIS_RUNNER.get(run_id)
+    if run is None or not run.active:
+        st.rerun()
+    step = run.completed_nodes[-1].replace("_", " ") if run.completed_nodes else "queued"
+    st.progress(run.progress, text=f"Processing Field Data... Organizing Sustainability Protocols... "
+                                   f"({len(run.completed_nodes)}/{len(PIPELINE_NODES)} steps, last: {step})")
+    if st.button("✖ Cancel Analysis"):
+        run.cancel("cancelled by the user")
+        st.rerun()
+
+
+def render_results(final_state: Dict[str, Any], images: List[Any], location: str, month: str, crop: str):
+    # Unusable photos: the quality gate stopped the run before any AI call
+    if final_state.get("retake_advice"):
+        st.warning("📷 **Please retake the photo.** " + final_state.get("error", ""))
+        for tip in final_state["retake_advice"]:
+            st.markdown(f"- {tip}")
+        return
 
     # 3. EXTRACT DATA FOR DASHBOARD
     pest_name = final_state.get("confirmed_pest", "Unknown")
@@ -222,6 +245,7 @@ if run_btn and uploaded_file:
     treatments = final_state.get("recommended_pesticides", [])
     eco_report = final_state.get("environmental_impact_report")
     subsidies = final_state.get("subsidy_info", [])
+    degradations = final_state.get("degradations", [])
 
     # 4. TOP KPI STATUS BAR
     st.markdown(f"""
@@ -241,6 +265,9 @@ if run_btn and uploaded_file:
         </div>
     """, unsafe_allow_html=True)
 
+    if degradations:
+        st.caption("⏱️ Faster paths taken to meet the response-time budget: " + "; ".join(degradations))
+
     # 5. MAIN ASYMMETRICAL LAYOUT (1/4 Left, 3/4 Right)
     col_diag, col_decision = st.columns([1, 3], gap="medium")
 
@@ -249,7 +276,13 @@ if run_btn and uploaded_file:
         st.markdown('<div class="section-header">📋 Case File</div>', unsafe_allow_html=True)
         with st.container(border=False):
             st.markdown('<div class="diagnosis-card">', unsafe_allow_html=True)
-            st.image(uploaded_file, caption="Visual Evidence", use_container_width=True)
+            st.image(
+                [bytes(image) for image in images],
+                caption=[f"Visual Evidence {i}" + ("" if final_state.get("usable_images") in (None, [])
+                                                   or i in final_state["usable_images"] else " (not analysed: poor quality)")
+                         for i in range(1, len(images) + 1)],
+                use_container_width=True
+            )
             
             st.markdown("#### 🕵️ Verification Summary")
             st.info(reasoning.split('.')[0] + ".") # Show just the first sentence for crispness
@@ -350,11 +383,34 @@ if run_btn and uploaded_file:
         st.info(f"No specific online schemes registered for {crop} in {location} currently. Contact local Krishi Vigyan Kendra (KVK).")
 
 
-    # Cleanup
-    if 'temp_image_path' in locals():
-        os.remove(temp_image_path)
+# --- MAIN APP LOGIC ---
+if run_btn and uploaded_files:
+    # 1. READ IMAGES (zero-copy views over the upload buffers, no temp files)
+    images = [f.getbuffer() for f in uploaded_files]
 
-elif run_btn and not uploaded_file:
+    # 2. START THE AI PIPELINE IN THE BACKGROUND (replaces this session's previous run)
+    if len(images) == 1:
+        initial_state = build_initial_state(location, month, crop, image_bytes=images[0], budget_s=DEFAULT_BUDGET_S)
+    else:
+        initial_state = build_initial_state(location, month, crop, images=images, budget_s=DEFAULT_BUDGET_S)
+    try:
+        run = DIAGNOSIS_RUNNER.submit(session_id, initial_state)
+    except RunnerBusy:
+        st.error("⏳ Many farmers are being served right now. Please try again in a minute.")
+        st.stop()
+    st.session_state["run_id"] = run.id
+    st.session_state["run_inputs"] = {"images": images, "location": location, "month": month, "crop": crop}
+elif run_btn and not uploaded_files:
     st.warning("⚠️ Please upload a field image to initiate analysis.")
+
+run = DIAGNOSIS_RUNNER.get(st.session_state.get("run_id"))
+if run is None:
+    st.info("👈 awaiting input parameters to initialize command center...")
+elif run.active:
+    show_progress(run.id)
+elif run.status == DONE:
+    render_results(run.final_state, **st.session_state["run_inputs"])
+elif run.status == CANCELLED:
+    st.info(f"🛑 Analysis cancelled ({run.error}). Submit again to restart it.")
 else:
-    st.info("👈 awaiting input parameters to initialize command center...")
\ No newline at end of file
+    st.error(f"❌ Analysis failed: {run.error}")
\ No newline at end of file
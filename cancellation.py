@@ -0,0 +1,57 @@
+"""
+Cooperative cancellation of a diagnosis run.
+
+A run executes with a CancelToken bound by `cancellable(token)`. The token lives
+in a ContextVar, so it follows the run into LangGraph's worker threads and into
+the speculative treatment lookup. `check_cancelled()` raises RunCancelled once
+the token is cancelled; it is called before every node (graph.timed), every
+model call (structured_repair.RepairingStructuredModel) and every provider
+search (search_backends.TavilyBackend). A call already in flight finishes, but
+nothing after it is started.
+
+RunCancelled derives from BaseException (like asyncio.CancelledError), so the
+nodes' `except Exception` fallbacks do not turn a cancellation into a degraded
+answer.
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+class RunCancelled(BaseException):
+    pass
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+_current: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar("agri_cancel_token", default=None)
+
+
+@contextmanager
+def cancellable(token: CancelToken) -> Iterator[CancelToken]:
+    """Binds `token` to the current context (and every context copied from it)."""
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+def check_cancelled() -> None:
+    token = _current.get()
+    if token is not None and token.cancelled:
+        raise RunCancelled(token.reason)
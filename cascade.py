@@ -0,0 +1,156 @@
+"""
+Per-node model cascades.
+
+Each text node first asks the cheap model and escalates to the stronger one only
+when the answer fails the node's validation (low confidence, invalid category,
+empty list, ...). The chain of a node can be overridden with a comma-separated
+env var, e.g. AGRI_CASCADE_PEST_DETECTOR="gemini-2.5-flash" to always use flash.
+
+Usage:
+    python cascade.py   # print the configured cascades
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from clients import get_structured_model
+from deadline import fits, pick_model, LIGHT_MODEL, STEP_ESTIMATES_S
+from prompt_cache import CONTEXT_CACHES, PROMPT_CACHE_STATS, PromptPrefix, find_prefix, message_tokens
+
+STRONG_MODEL = "gemini-2.5-flash"
+
+# Cheapest model first
+DEFAULT_CASCADES: Dict[str, List[str]] = {
+    "pest_detector": [LIGHT_MODEL, STRONG_MODEL],
+    "pesticide_finder": [LIGHT_MODEL, STRONG_MODEL],
+    "sustainability_analyzer": [LIGHT_MODEL, STRONG_MODEL],
+    "subsidy_finder": [LIGHT_MODEL, STRONG_MODEL],
+}
+
+# pest_detector escalates verdicts below this confidence
+MIN_CONFIDENCE = float(os.getenv("AGRI_CASCADE_MIN_CONFIDENCE", "0.6"))
+
+# A validator returns None for an acceptable answer, else the reason to escalate
+Validator = Callable[[Any], Optional[str]]
+
+
+def cascade_models(node: str) -> List[str]:
+    override = os.getenv(f"AGRI_CASCADE_{node.upper()}")
+    if override:
+        return [model.strip() for model in override.split(",") if model.strip()]
+    return DEFAULT_CASCADES.get(node, [STRONG_MODEL])
+
+
+class CascadeStats:
+    """Process-wide escalation counts and model latencies per node."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_node: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, node: str, calls: List[Tuple[str, float]], escalated: bool) -> None:
+        with self._lock:
+            entry = self.by_node.setdefault(node, {"runs": 0, "escalations": 0, "models": {}})
+            entry["runs"] += 1
+            entry["escalations"] += int(escalated)
+            for model, seconds in calls:
+                totals = entry["models"].setdefault(model, {"calls": 0, "seconds": 0.0})
+                totals["calls"] += 1
+                totals["seconds"] += seconds
+
+    def total_calls(self) -> int:
+        """Model calls made by this process across all nodes (quota accounting)."""
+        with self._lock:
+            return sum(m["calls"] for entry in self.by_node.values() for m in entry["models"].values())
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Escalation rate and estimated latency saved per node. The baseline is every
+        run on the node's strongest model (its measured mean, else the static estimate).
+        """
+        report = {}
+        with self._lock:
+            for node, entry in self.by_node.items():
+                strongest = cascade_models(node)[-1]
+                strong = entry["models"].get(strongest)
+                strong_mean = (strong["seconds"] / strong["calls"] if strong and strong["calls"]
+                               else STEP_ESTIMATES_S.get(strongest, 0.0))
+                actual = sum(m["seconds"] for m in entry["models"].values())
+                report[node] = {
+                    "runs": entry["runs"],
+                    "escalations": entry["escalations"],
+                    "escalation_rate": round(entry["escalations"] / entry["runs"], 3),
+                    "model_calls": {model: m["calls"] for model, m in entry["models"].items()},
+                    "latency_saved_s_est": round(entry["runs"] * strong_mean - actual, 2),
+                }
+        return report
+
+
+CASCADE_STATS = CascadeStats()
+
+
+def invoke_model(node: str, model: str, schema: Type[BaseModel], messages: List[Dict],
+                 prefix: Optional[PromptPrefix]) -> Any:
+    """One structured call; a registered static prefix is sent by context-cache handle when possible."""
+    handle = CONTEXT_CACHES.handle(model, prefix) if prefix else None
+    if handle:
+        start = time.perf_counter()
+        try:
+            response = get_structured_model(model, schema, cached_content=handle).invoke(messages[1:])
+            PROMPT_CACHE_STATS.record(node, message_tokens(messages[1:]), prefix.tokens_est, time.perf_counter() - start)
+            return response
+        except Exception as e:
+            print(f"   ⚠️ Context cache rejected for {node} on {model} ({e}); sending the full prompt.")
+            CONTEXT_CACHES.reject(model, prefix)
+    start = time.perf_counter()
+    response = get_structured_model(model, schema).invoke(messages)
+    PROMPT_CACHE_STATS.record(node, message_tokens(messages), 0, time.perf_counter() - start)
+    return response
+
+
+def run_cascade(state: Dict, node: str, schema: Type[BaseModel], messages: List[Dict],
+                validate: Validator) -> Tuple[Any, List[str]]:
+    """
+    Invokes the node's cascade and returns (response, degradations). Escalates while
+    `validate` rejects the answer (or the cheaper model errors) and the next model
+    still fits the deadline. The last model's answer is returned even if rejected.
+    """
+    models = cascade_models(node)
+    first, note = pick_model(state, node, models[0])
+    degradations = [note] if note else []
+    models = [first] + [m for m in models[1:] if m != first]
+
+    calls: List[Tuple[str, float]] = []
+    response, error, reason = None, None, None
+    prefix = find_prefix(messages)
+    try:
+        for i, model in enumerate(models):
+            if i > 0:
+                if not fits(state, node, model):
+                    degradations.append(f"{node}: kept {models[i - 1]} answer ({reason}); no time to escalate to {model}")
+                    break
+                print(f"   ↗️ {models[i - 1]} answer rejected ({reason}); escalating to {model}.")
+
+            start = time.perf_counter()
+            try:
+                response, error = invoke_model(node, model, schema, messages, prefix), None
+                reason = validate(response)
+            except Exception as e:
+                error, reason = e, f"error: {e}"
+            calls.append((model, time.perf_counter() - start))
+            if reason is None:
+                break
+    finally:
+        CASCADE_STATS.record(node, calls, escalated=len(calls) > 1)
+
+    if error is not None and response is None:
+        raise error
+    return response, degradations
+
+
+if __name__ == "__main__":
+    for node in DEFAULT_CASCADES:
+        print(f"{node}: {' -> '.join(cascade_models(node))}")
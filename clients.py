@@ -0,0 +1,62 @@
+import os
+from functools import lru_cache
+from typing import Any, Optional, Type
+
+from pydantic import BaseModel
+
+# ---------------------------------------------------------
+# SHARED LLM CLIENTS (created lazily, reused per process)
+# ---------------------------------------------------------
+# langchain_google_genai pulls in the whole google.genai SDK (~1s of import
+# time), so it is only imported the first time a node actually needs a model.
+#
+# AGRI_LLM_BACKEND=local swaps in the offline stand-in of local_model.py.
+
+LLM_BACKEND = os.getenv("AGRI_LLM_BACKEND", "gemini").lower()
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model: str, temperature: float = 0, cached_content: Optional[str] = None) -> Any:
+    """Returns a process-wide ChatGoogleGenerativeAI client for the given model (and context-cache handle)."""
+    if LLM_BACKEND == "local":
+        from local_model import LocalChatModel
+        return LocalChatModel(model, cached_content)
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(model=model, temperature=temperature, cached_content=cached_content)
+
+
+@lru_cache(maxsize=None)
+def get_structured_model(model: str, schema: Type[BaseModel], temperature: float = 0,
+                         cached_content: Optional[str] = None) -> Any:
+    """
+    Returns a cached structured runnable for (model, schema, context-cache handle).
+    Output that fails the schema is repaired locally (structured_repair.py) before it
+    counts as an error.
+    """
+    from structured_repair import RepairingStructuredModel
+
+    return RepairingStructuredModel(get_chat_model(model, temperature, cached_content), schema)
+
+
+@lru_cache(maxsize=None)
+def _genai_client() -> Any:
+    from google import genai
+
+    return genai.Client()
+
+
+def create_context_cache(model: str, system_instruction: str, ttl_s: float) -> str:
+    """Uploads a static system prompt as provider-side cached content; returns its handle."""
+    if LLM_BACKEND == "local":
+        from local_model import create_cache
+        return create_cache(model, system_instruction, ttl_s)
+
+    from google.genai import types
+
+    cache = _genai_client().caches.create(
+        model=model,
+        config=types.CreateCachedContentConfig(system_instruction=system_instruction, ttl=f"{int(ttl_s)}s"),
+    )
+    return cache.name
@@ -1,5 +1,9 @@
 # constants.py
-from typing import List
+import json
+import os
+from typing import Dict, List
+
+from reference_data import REFERENCE_DATA
 
 VERIFICATION_DOMAINS = [
     "gov.in",
@@ -29,45 +33,29 @@ CENTRAL_SUBSIDY_DOMAINS = [
     "mkisan.gov.in"         
 ]
 
-STATE_SUBSIDY_DOMAINS = {
-   
-    "Punjab": ["agri.punjab.gov.in", "punjab.gov.in"],
-    "Haryana": ["agriharyana.gov.in"],
-    "Uttar Pradesh": ["upagriculture.com", "agriculture.up.nic.in"],
-    "Himachal Pradesh": ["agriculture.hp.gov.in"],
-    "Uttarakhand": ["agriculture.uk.gov.in"],
-    "Delhi": ["agri.delhi.gov.in"],
-    
-    
-    "Rajasthan": ["agriculture.rajasthan.gov.in", "rajkisan.rajasthan.gov.in"],
-    "Gujarat": ["agri.gujarat.gov.in", "ikhedut.gujarat.gov.in"],
-    "Maharashtra": ["krishi.maharashtra.gov.in"],
-    "Goa": ["agri.goa.gov.in"],
-    
-  
-    "Karnataka": ["raitamitra.karnataka.gov.in"],
-    "Tamil Nadu": ["tnagrisnet.tn.gov.in", "tnhorticulture.tn.gov.in"],
-    "Andhra Pradesh": ["agri.ap.gov.in", "rythubharosa.ap.gov.in"],
-    "Telangana": ["agri.telangana.gov.in", "rythubandhu.telangana.gov.in"],
-    "Kerala": ["keralaagriculture.gov.in", "karshakasree.com"],
-    
-    
-    "Bihar": ["krishi.bihar.gov.in", "farmech.bihar.gov.in"],
-    "West Bengal": ["matirkatha.net", "wb.gov.in"],
-    "Odisha": ["agri.odisha.gov.in", "kalia.odisha.gov.in"],
-    "Jharkhand": ["agri.jharkhand.gov.in"],
-    "Chhattisgarh": ["agriportal.cg.nic.in"],
-    
-   
-    "Assam": ["diragri.assam.gov.in"],
-    "Sikkim": ["sikkim.gov.in"],
-    "Meghalaya": ["megagriculture.gov.in"],
-    "Manipur": ["agrimanipur.mn.gov.in"],
-    "Mizoram": ["agriculturemizoram.nic.in"],
-    "Nagaland": ["agriculture.nagaland.gov.in"],
-    "Tripura": ["agri.tripura.gov.in"],
-    "Arunachal Pradesh": ["agri.arunachal.gov.in"]
-}
+# State portals live in state_domains.json (hot-reloaded, see reference_data.py)
+STATE_DOMAINS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state_domains.json")
+
+def load_state_domains(path: str) -> Dict[str, List[str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        domains = json.load(f)
+    if not isinstance(domains, dict) or not all(
+        isinstance(v, list) and all(isinstance(d, str) for d in v) for v in domains.values()
+    ):
+        raise ValueError("state_domains.json must map each state to a list of domains.")
+    return domains
+
+REFERENCE_DATA.register("state_domains", STATE_DOMAINS_PATH, load_state_domains)
+
+def get_state_subsidy_domains() -> Dict[str, List[str]]:
+    """Current state -> portal domains map."""
+    return REFERENCE_DATA.get("state_domains")
+
+def __getattr__(name: str):
+    # Keeps `from constants import STATE_SUBSIDY_DOMAINS` working (always the live version)
+    if name == "STATE_SUBSIDY_DOMAINS":
+        return get_state_subsidy_domains()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_subsidy_domains(user_state: str) -> List[str]:
     """
@@ -84,8 +72,50 @@ def get_subsidy_domains(user_state: str) -> List[str]:
     clean_state = user_state.strip().title()
     
    
-    if clean_state in STATE_SUBSIDY_DOMAINS:
-        specific_domains = STATE_SUBSIDY_DOMAINS[clean_state]
+    state_domains = get_state_subsidy_domains()
+    if clean_state in state_domains:
+        specific_domains = state_domains[clean_state]
         allowed_domains.extend(specific_domains)
         
-    return allowed_domains
\ No newline at end of file
+    return allowed_domains
+
+# Broad agro-climatic zone per state: pesticide persistence and runoff risk depend
+# on rainfall and temperature more than on the exact state, so eco assessments are
+# shared across the states of one zone.
+CLIMATE_ZONES = {
+    "Rajasthan": "arid",
+    "Gujarat": "semi-arid",
+    "Punjab": "semi-arid",
+    "Haryana": "semi-arid",
+    "Delhi": "semi-arid",
+    "Maharashtra": "semi-arid",
+    "Karnataka": "semi-arid",
+    "Telangana": "semi-arid",
+    "Andhra Pradesh": "tropical-wet-dry",
+    "Tamil Nadu": "tropical-wet-dry",
+    "Madhya Pradesh": "tropical-wet-dry",
+    "Chhattisgarh": "tropical-wet-dry",
+    "Odisha": "tropical-wet-dry",
+    "Jharkhand": "tropical-wet-dry",
+    "Kerala": "tropical-wet",
+    "Goa": "tropical-wet",
+    "Uttar Pradesh": "humid-subtropical",
+    "Bihar": "humid-subtropical",
+    "West Bengal": "humid-subtropical",
+    "Himachal Pradesh": "montane",
+    "Uttarakhand": "montane",
+    "Jammu And Kashmir": "montane",
+    "Ladakh": "montane",
+    "Sikkim": "montane",
+    "Assam": "humid-northeast",
+    "Arunachal Pradesh": "humid-northeast",
+    "Meghalaya": "humid-northeast",
+    "Manipur": "humid-northeast",
+    "Mizoram": "humid-northeast",
+    "Nagaland": "humid-northeast",
+    "Tripura": "humid-northeast",
+}
+
+def get_climate_zone(user_state: str) -> str:
+    """Climate zone of a state ('unknown' when the state is not listed)."""
+    return CLIMATE_ZONES.get((user_state or "").strip().title(), "unknown")
@@ -0,0 +1,54 @@
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# ---------------------------------------------------------
+# PER-REQUEST LATENCY BUDGETS
+# ---------------------------------------------------------
+# Every invocation may carry an absolute `deadline` (epoch seconds) in the state.
+# Nodes ask whether their full path still fits in the remaining budget and fall
+# back to a cheaper one otherwise (lighter model, local corpus, hard-coded
+# fallback, skipped optional search). Each such choice is appended to the
+# `degradations` list of the final state.
+
+DEFAULT_BUDGET_S = float(os.getenv("AGRI_LATENCY_BUDGET_S", "60"))
+LIGHT_MODEL = "gemini-2.5-flash-lite"
+
+# Typical wall time of each kind of step on a slow link
+STEP_ESTIMATES_S = {
+    "gemini-2.5-flash": 15.0,
+    "gemini-2.5-flash-lite": 6.0,
+    "search": 4.0,
+}
+
+# Time kept back for the cheapest path of the nodes that still have to run
+DOWNSTREAM_RESERVE_S = {
+    "image_analyzer": 10.0,
+    "pest_detector": 7.0,
+    "pesticide_finder": 4.0,
+    "sustainability_analyzer": 2.0,
+    "subsidy_finder": 0.0,
+}
+
+
+def deadline_in(budget_s: Optional[float]) -> Optional[float]:
+    """Absolute deadline for a budget starting now (None = unlimited)."""
+    return time.time() + budget_s if budget_s else None
+
+
+def remaining(state: Dict[str, Any]) -> float:
+    deadline = state.get("deadline")
+    return float("inf") if deadline is None else deadline - time.time()
+
+
+def fits(state: Dict[str, Any], node: str, *steps: str) -> bool:
+    """True if the given steps (model names / 'search') fit before the deadline, minus the downstream reserve."""
+    needed = sum(STEP_ESTIMATES_S.get(step, 0.0) for step in steps)
+    return remaining(state) - DOWNSTREAM_RESERVE_S.get(node, 0.0) >= needed
+
+
+def pick_model(state: Dict[str, Any], node: str, preferred: str) -> Tuple[str, Optional[str]]:
+    """Returns (model, degradation note or None): the preferred model if it fits, else the light one."""
+    if preferred == LIGHT_MODEL or fits(state, node, preferred):
+        return preferred, None
+    return LIGHT_MODEL, f"{node}: used {LIGHT_MODEL} instead of {preferred} ({remaining(state):.0f}s left)"
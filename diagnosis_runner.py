@@ -0,0 +1,188 @@
+"""
+Background execution of diagnoses for the Streamlit UI.
+
+The Streamlit script thread only submits a run and polls it; the graph itself
+runs on a bounded thread pool (AGRI_UI_WORKERS, default 4). Submissions beyond
+AGRI_UI_MAX_PENDING queued + running runs are refused with RunnerBusy.
+
+* One active run per session: submitting again cancels the session's previous
+  run, and `cancel_session()` (the "New Session" button) cancels it outright.
+  A cancelled run stops at its next checkpoint and no longer counts as pending.
+* Disconnects: a reaper thread asks `session_alive(session_id)` every
+  REAP_INTERVAL_S and cancels the runs of sessions that are gone.
+* Cancellation is cooperative (see cancellation.py): the run stops before its
+  next node, model call or provider search.
+* Progress: the run streams node updates; `run.completed_nodes` grows as nodes
+  finish. Finished runs stay available for FINISHED_RUN_TTL_S.
+
+Usage (app.py):
+    run = DIAGNOSIS_RUNNER.submit(session_id, initial_state)
+    ...
+    run = DIAGNOSIS_RUNNER.get(run_id)   # poll run.status / run.completed_nodes / run.final_state
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from cancellation import CancelToken, RunCancelled, cancellable
+
+RUNNER_WORKERS = int(os.getenv("AGRI_UI_WORKERS", "4"))
+RUNNER_MAX_PENDING = int(os.getenv("AGRI_UI_MAX_PENDING", "16"))
+REAP_INTERVAL_S = 5.0
+FINISHED_RUN_TTL_S = 600.0
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+# Nodes of a complete run, in order (the progress bar's denominator)
+PIPELINE_NODES = ["image_quality_gate", "image_analyzer", "speculate_treatment", "pest_detector",
+                  "pesticide_finder", "sustainability_analyzer", "subsidy_finder", "history_recorder"]
+
+
+class RunnerBusy(Exception):
+    """Too many diagnoses queued or running."""
+
+
+class DiagnosisRun:
+    def __init__(self, session_id: str, state: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.state = state
+        self.token = CancelToken()
+        self.status = QUEUED
+        self.completed_nodes: List[str] = []
+        self.final_state: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def progress(self) -> float:
+        return min(len(self.completed_nodes) / len(PIPELINE_NODES), 1.0)
+
+    def cancel(self, reason: str) -> None:
+        if self.active:
+            self.token.cancel(reason)
+
+
+class DiagnosisRunner:
+    def __init__(self, workers: int = RUNNER_WORKERS, max_pending: int = RUNNER_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._runs: Dict[str, DiagnosisRun] = {}
+        self._active_by_session: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self.session_alive: Optional[Callable[[str], bool]] = None
+
+    # --- SUBMIT / POLL / CANCEL ---
+    def submit(self, session_id: str, state: Dict[str, Any]) -> DiagnosisRun:
+        """Starts a diagnosis for the session, cancelling the session's previous run if still active."""
+        run = DiagnosisRun(session_id, state)
+        with self._lock:
+            previous = self._runs.get(self._active_by_session.get(session_id, ""))
+            if previous is not None:
+                previous.cancel("superseded by a new submission")
+            # A cancelled run only waits for its next checkpoint; it does not count as pending
+            pending = sum(1 for r in self._runs.values() if r.active and not r.token.cancelled)
+            if pending >= self.max_pending:
+                raise RunnerBusy(f"{pending} diagnoses in progress")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="agri-ui")
+            self._runs[run.id] = run
+            self._active_by_session[session_id] = run.id
+            self._executor.submit(self._execute, run)
+        self._start_reaper()
+        return run
+
+    def get(self, run_id: Optional[str]) -> Optional[DiagnosisRun]:
+        with self._lock:
+            return self._runs.get(run_id or "")
+
+    def cancel_session(self, session_id: str, reason: str = "session reset") -> None:
+        with self._lock:
+            run = self._runs.get(self._active_by_session.pop(session_id, ""))
+        if run is not None:
+            run.cancel(reason)
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for run in self._runs.values() if run.active and not run.token.cancelled)
+
+    # --- WORKER ---
+    def _execute(self, run: DiagnosisRun) -> None:
+        from graph import get_app
+        from profiling import PROFILE_ALWAYS, invoke_graph
+
+        if run.token.cancelled:
+            return self._finish(run, CANCELLED, error=run.token.reason)
+        run.status = RUNNING
+        print(f"   🧵 Diagnosis {run.id[:8]} started (session {run.session_id[:8]}).")
+        try:
+            with cancellable(run.token):
+                if PROFILE_ALWAYS:
+                    final_state = invoke_graph(get_app(), run.state, label="streamlit")
+                else:
+                    final_state = run.state
+                    for mode, chunk in get_app().stream(run.state, stream_mode=["updates", "values"]):
+                        if mode == "values":
+                            final_state = chunk
+                        else:
+                            run.completed_nodes.extend(chunk)
+            self._finish(run, DONE, final_state=final_state)
+        except RunCancelled as e:
+            print(f"   🛑 Diagnosis {run.id[:8]} cancelled ({e}).")
+            self._finish(run, CANCELLED, error=str(e))
+        except Exception as e:
+            print(f"   ❌ Diagnosis {run.id[:8]} failed: {e}")
+            self._finish(run, FAILED, error=str(e))
+
+    def _finish(self, run: DiagnosisRun, status: str, final_state: Optional[Dict[str, Any]] = None,
+                error: Optional[str] = None) -> None:
+        run.final_state, run.error = final_state, error
+        # The photos are not needed once the run is over
+        run.state = None
+        run.finished_at = time.time()
+        run.status = status
+        with self._lock:
+            if self._active_by_session.get(run.session_id) == run.id:
+                del self._active_by_session[run.session_id]
+
+    # --- DISCONNECTS / HOUSEKEEPING ---
+    def _start_reaper(self) -> None:
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_forever, name="agri-ui-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_forever(self) -> None:
+        while True:
+            time.sleep(REAP_INTERVAL_S)
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"   ⚠️ Diagnosis reaper: {e}")
+
+    def reap(self) -> None:
+        """Cancels runs of disconnected sessions and forgets runs finished long ago."""
+        now = time.time()
+        with self._lock:
+            runs = list(self._runs.values())
+        for run in runs:
+            if run.active and self.session_alive is not None and not self.session_alive(run.session_id):
+                run.cancel("session disconnected")
+        with self._lock:
+            for run in runs:
+                if run.finished_at is not None and now - run.finished_at > FINISHED_RUN_TTL_S:
+                    self._runs.pop(run.id, None)
+
+
+DIAGNOSIS_RUNNER = DiagnosisRunner()
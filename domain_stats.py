@@ -0,0 +1,247 @@
+"""
+Per-domain yield statistics and adaptive `site:` filters.
+
+Every search names its query type (`kind`: the retrieval policy, e.g.
+"verification" or "pesticide"). For each kind and configured domain entry
+("ac.in", "cibrc.nic.in", even the bare "org") the statistics record, across
+all searches on this host (SQLite):
+
+    searches    searches whose filter included the domain
+    results     results returned from it
+    chars       their content length
+    citations   results whose content the model's answer used (see cited_results)
+
+select_domains() turns them into an ordered subset for the next search of
+that kind, so the `site:a OR site:b ...` suffix only keeps domains that pay off:
+
+* a domain with fewer than MIN_OBSERVATIONS searches is always kept (explored);
+* the others are ranked by score = results per search (weighted by content
+  length up to USEFUL_CHARS) + CITATION_WEIGHT x citations per search;
+* those scoring below MIN_SCORE are dropped, and at most AGRI_SITE_FILTER_MAX
+  domains (default 4) are kept, best first;
+* a dropped domain is searched again once every REPROBE_EVERY searches of its
+  kind, so a source that improves gets back in.
+
+Without statistics (new host, new kind) the configured list is used unchanged.
+Set AGRI_DOMAIN_STATS=0 to disable, AGRI_DOMAIN_STATS_DB to move the file.
+
+Usage:
+    python domain_stats.py               # statistics and current filter per kind
+    python domain_stats.py pesticide     # one kind
+"""
+import os
+import sqlite3
+import sys
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from evidence_store import domain_matches, domain_of
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DOMAIN_STATS_DB = os.getenv("AGRI_DOMAIN_STATS_DB", os.path.join(BASE_DIR, "data", "domain_stats.sqlite3"))
+DOMAIN_STATS_ENABLED = os.getenv("AGRI_DOMAIN_STATS", "1") != "0"
+MAX_SITE_FILTERS = int(os.getenv("AGRI_SITE_FILTER_MAX", "4"))
+
+MIN_OBSERVATIONS = 5
+MIN_SCORE = 0.1
+CITATION_WEIGHT = 2.0
+USEFUL_CHARS = 1000
+REPROBE_EVERY = 20
+# Row holding the number of searches per kind (reprobe schedule)
+KIND_TOTAL = "*"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS domain_stats (
+    kind          TEXT NOT NULL,
+    domain        TEXT NOT NULL,
+    searches      INTEGER NOT NULL DEFAULT 0,
+    results       INTEGER NOT NULL DEFAULT 0,
+    chars         INTEGER NOT NULL DEFAULT 0,
+    citations     INTEGER NOT NULL DEFAULT 0,
+    last_searched INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, domain)
+);
+"""
+
+
+def matching_entry(url: str, domains: Sequence[str]) -> Optional[str]:
+    """The configured entry a result URL belongs to (the most specific one when several match)."""
+    host = domain_of(url).lower()
+    matches = [d for d in domains if domain_matches(host, [d])]
+    return max(matches, key=len) if matches else None
+
+
+def cited_results(results: Iterable[Dict], terms: Iterable[str]) -> List[Dict]:
+    """
+    Results the model's answer drew on: those whose content mentions one of the
+    answer's distinctive terms (the confirmed pest, the active ingredients...).
+    """
+    terms = [t.lower() for t in terms if t and len(t) >= 4]
+    return [res for res in results if any(t in res.get("content", "").lower() for t in terms)]
+
+
+class DomainStats:
+    def __init__(self, path: str = DEFAULT_DOMAIN_STATS_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection per thread: sqlite3 connections must not be shared across threads
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _rows(self, kind: str) -> Dict[str, sqlite3.Row]:
+        rows = self._conn().execute("SELECT * FROM domain_stats WHERE kind = ?", (kind,))
+        return {row["domain"]: row for row in rows}
+
+    def _bump(self, kind: str, counts: Dict[str, Dict[str, int]]) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for domain, values in counts.items():
+                columns = ", ".join(values)
+                updates = ", ".join(f"{col} = {col} + excluded.{col}" if col != "last_searched"
+                                    else f"{col} = excluded.{col}" for col in values)
+                conn.execute(
+                    f"INSERT INTO domain_stats (kind, domain, {columns}) VALUES (?, ?{', ?' * len(values)}) "
+                    f"ON CONFLICT(kind, domain) DO UPDATE SET {updates}",
+                    (kind, domain, *values.values()),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # --- RECORDING ---
+    def record_search(self, kind: str, domains: Sequence[str], results: List[Dict]) -> None:
+        """A search of `kind` filtered to `domains` returned `results`."""
+        total = self._rows(kind).get(KIND_TOTAL)
+        search_no = (total["searches"] if total else 0) + 1
+        counts = {domain: {"searches": 1, "results": 0, "chars": 0, "last_searched": search_no} for domain in domains}
+        for res in results:
+            entry = matching_entry(res.get("url", ""), domains)
+            if entry:
+                counts[entry]["results"] += 1
+                counts[entry]["chars"] += len(res.get("content", ""))
+        counts[KIND_TOTAL] = {"searches": 1}
+        self._bump(kind, counts)
+
+    def record_citations(self, kind: str, domains: Sequence[str], cited: List[Dict]) -> None:
+        counts: Dict[str, Dict[str, int]] = {}
+        for res in cited:
+            entry = matching_entry(res.get("url", ""), domains)
+            if entry:
+                counts.setdefault(entry, {"citations": 0})["citations"] += 1
+        if counts:
+            self._bump(kind, counts)
+
+    # --- SELECTION ---
+    @staticmethod
+    def score(row: sqlite3.Row) -> float:
+        if not row["searches"]:
+            return 0.0
+        length_weight = min(row["chars"] / row["results"] / USEFUL_CHARS, 1.0) if row["results"] else 0.0
+        return (row["results"] * length_weight + CITATION_WEIGHT * row["citations"]) / row["searches"]
+
+    def select_domains(self, kind: str, domains: Sequence[str]) -> List[str]:
+        """The ordered subset of `domains` to put in the next `site:` filter of this kind."""
+        rows = self._rows(kind)
+        total = rows.get(KIND_TOTAL)
+        search_no = (total["searches"] if total else 0) + 1
+        unexplored = [d for d in domains if d not in rows or rows[d]["searches"] < MIN_OBSERVATIONS]
+        ranked = sorted((d for d in domains if d not in unexplored), key=lambda d: -self.score(rows[d]))
+        useful = [d for d in ranked if self.score(rows[d]) >= MIN_SCORE]
+
+        selected = useful[:max(MAX_SITE_FILTERS - len(unexplored), 1)] + unexplored
+        reprobed = [d for d in ranked if d not in selected and search_no - rows[d]["last_searched"] >= REPROBE_EVERY]
+        selected += reprobed[:1]
+        # Nothing has paid off yet: keep searching everywhere
+        return selected or list(domains)
+
+    def report(self, kind: Optional[str] = None) -> Dict[str, Dict[str, Dict[str, float]]]:
+        sql, params = "SELECT * FROM domain_stats", ()
+        if kind:
+            sql, params = sql + " WHERE kind = ?", (kind,)
+        report: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for row in self._conn().execute(sql + " ORDER BY kind, domain", params):
+            if row["domain"] == KIND_TOTAL:
+                continue
+            report.setdefault(row["kind"], {})[row["domain"]] = {
+                "searches": row["searches"], "results": row["results"], "citations": row["citations"],
+                "avg_chars": row["chars"] // row["results"] if row["results"] else 0,
+                "score": round(self.score(row), 3),
+            }
+        return report
+
+
+_stats: Optional[DomainStats] = None
+_stats_lock = threading.Lock()
+
+def get_domain_stats() -> Optional[DomainStats]:
+    """Process-wide statistics at AGRI_DOMAIN_STATS_DB (None when AGRI_DOMAIN_STATS=0)."""
+    global _stats
+    if not DOMAIN_STATS_ENABLED:
+        return None
+    if _stats is None:
+        with _stats_lock:
+            if _stats is None:
+                _stats = DomainStats()
+    return _stats
+
+
+def select_domains(kind: Optional[str], domains: Optional[List[str]]) -> Optional[List[str]]:
+    """search_web's hook: the adaptive subset, or `domains` unchanged without a kind / statistics."""
+    stats = get_domain_stats()
+    if not (stats and kind and domains):
+        return domains
+    try:
+        selected = stats.select_domains(kind, domains)
+    except Exception as e:
+        print(f"    ⚠️ Domain statistics unavailable: {e}")
+        return domains
+    if len(selected) < len(domains):
+        print(f"    🎯 {kind} filter: {len(selected)}/{len(domains)} domains ({', '.join(selected)})")
+    return selected
+
+
+def record_search(kind: Optional[str], domains: Optional[List[str]], results: List[Dict]) -> None:
+    stats = get_domain_stats()
+    if stats and kind and domains:
+        try:
+            stats.record_search(kind, domains, results)
+        except Exception as e:
+            print(f"    ⚠️ Could not record domain statistics: {e}")
+
+
+def record_citations(kind: str, domains: Sequence[str], results: List[Dict], terms: Iterable[str]) -> None:
+    """Credits the domains of the `results` whose content mentions one of the answer's `terms`."""
+    stats = get_domain_stats()
+    if stats:
+        try:
+            stats.record_citations(kind, domains, cited_results(results, terms))
+        except Exception as e:
+            print(f"    ⚠️ Could not record domain citations: {e}")
+
+
+if __name__ == "__main__":
+    from constants import PESTICIDE_DOMAINS, VERIFICATION_DOMAINS
+
+    stats = get_domain_stats() or DomainStats()
+    configured = {"verification": VERIFICATION_DOMAINS, "pesticide": PESTICIDE_DOMAINS}
+    only = sys.argv[1] if len(sys.argv) > 1 else None
+    report = stats.report(only)
+    for kind in sorted(set(report) | ({only} if only else set(configured))):
+        print(f"\n{kind}")
+        for domain, row in sorted(report.get(kind, {}).items(), key=lambda item: -item[1]["score"]):
+            print(f"   {domain:22} searches={row['searches']:<5} results={row['results']:<5} "
+                  f"citations={row['citations']:<5} avg_chars={row['avg_chars']:<6} score={row['score']}")
+        if kind in configured:
+            print(f"   -> next filter: {' OR '.join(f'site:{d}' for d in stats.select_domains(kind, configured[kind]))}")
@@ -0,0 +1,168 @@
+"""
+Local full-text evidence corpus.
+
+Every result fetched from the network is persisted here (deduplicated by URL, with
+domain and fetch-date metadata) in a SQLite FTS5 index, so slowly-changing
+advisories from VERIFICATION_DOMAINS / PESTICIDE_DOMAINS can be answered locally.
+See search_backends.py for how searches are routed to it.
+
+Usage:
+    python evidence_store.py "fall armyworm maize"   # query the local corpus
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from snippets import tokenize
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_EVIDENCE_DB = os.getenv("AGRI_EVIDENCE_DB", os.path.join(BASE_DIR, "data", "evidence.sqlite3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id         INTEGER PRIMARY KEY,
+    url        TEXT NOT NULL UNIQUE,
+    domain     TEXT NOT NULL,
+    content    TEXT NOT NULL,
+    query      TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_domain ON documents (domain);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    content, content='documents', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE OF content ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO documents_fts (rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+
+def domain_of(url: str) -> str:
+    host = urlparse(url or "").hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def domain_matches(domain: str, allowed: Optional[List[str]]) -> bool:
+    """'site:' semantics: 'ac.in' matches 'pau.ac.in', and a bare 'org' matches any .org host."""
+    if not allowed:
+        return True
+    return any(domain == d or domain.endswith("." + d) for d in allowed)
+
+
+class EvidenceStore:
+    def __init__(self, path: str = DEFAULT_EVIDENCE_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection per thread: sqlite3 connections must not be shared across threads
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def add_results(self, query: str, results: List[Dict]) -> int:
+        """Persists fetched results. Known URLs are refreshed (content, query, fetch date). Returns rows written."""
+        now = time.time()
+        rows = [
+            (res["url"], domain_of(res["url"]), res.get("content", ""), query, now)
+            for res in results if res.get("url") and res.get("content")
+        ]
+        if not rows:
+            return 0
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO documents (url, domain, content, query, fetched_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET content = excluded.content, query = excluded.query, "
+                "fetched_at = excluded.fetched_at",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def search(self, query: str, limit: int = 5, domains: Optional[List[str]] = None,
+               max_age_days: Optional[float] = None) -> List[Dict]:
+        """
+        Full-text search (BM25-ranked). Returns dicts with url, content, domain,
+        fetched_at and `term_coverage` (share of query terms present in the document).
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        params: List = [match]
+        sql = (
+            "SELECT d.url, d.domain, d.content, d.fetched_at FROM documents_fts f "
+            "JOIN documents d ON d.id = f.rowid WHERE documents_fts MATCH ?"
+        )
+        if max_age_days is not None:
+            sql += " AND d.fetched_at >= ?"
+            params.append(time.time() - max_age_days * 86400)
+        # Over-fetch, then apply the domain filter in Python ('site:' suffix semantics)
+        sql += " ORDER BY bm25(documents_fts) LIMIT ?"
+        params.append(limit * 10 if domains else limit)
+
+        found = []
+        for row in self._conn().execute(sql, params):
+            if not domain_matches(row["domain"], domains):
+                continue
+            doc_terms = set(tokenize(row["content"]))
+            found.append({
+                "url": row["url"],
+                "content": row["content"],
+                "domain": row["domain"],
+                "fetched_at": row["fetched_at"],
+                "term_coverage": sum(1 for t in terms if t in doc_terms) / len(terms),
+            })
+            if len(found) >= limit:
+                break
+        return found
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._conn()
+        return {
+            "documents": conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+            "domains": conn.execute("SELECT COUNT(DISTINCT domain) FROM documents").fetchone()[0],
+        }
+
+
+_store: Optional[EvidenceStore] = None
+_store_lock = threading.Lock()
+
+def get_evidence_store() -> EvidenceStore:
+    """Process-wide store at AGRI_EVIDENCE_DB (default data/evidence.sqlite3)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = EvidenceStore()
+    return _store
+
+
+if __name__ == "__main__":
+    store = get_evidence_store()
+    print(store.stats())
+    for doc in store.search(" ".join(sys.argv[1:]) or "pest"):
+        print(f"- [{doc['term_coverage']:.0%}] {doc['url']} ({doc['domain']})\n  {doc['content'][:200]}")
@@ -1,69 +1,141 @@
-from typing import TypedDict, List, Dict, Optional, Any
-from langgraph.graph import StateGraph, START, END
+import threading
+import time
+from typing import List, Dict, Optional, Any, Union
+
+from cancellation import check_cancelled
+from deadline import deadline_in
 
 # --- IMPORT YOUR NODES ---
+from image_quality import image_quality_gate_node, route_after_quality_gate
 from image_analyzer import image_analyze_node
-from pest_detector import pest_detector_node
-from pesticide_finder import pesticide_finder_node
-from sustainability_analyzer import sustainability_analyzer_node  # <-- NEW: Import Node E
-from subsidy_finder import subsidy_finder_node
+from pest_detector import pest_detector_node, PROMPT_VERSION as PEST_DETECTOR_VERSION
+from pesticide_finder import pesticide_finder_node, release_speculation, TREATMENT_CACHE_VERSION
+from sustainability_analyzer import sustainability_analyzer_node, PROMPT_VERSION as ECO_VERSION  # <-- NEW: Import Node E
+from subsidy_finder import subsidy_finder_node, subsidy_memo_version
+from history_store import record_history_node
+from node_memo import MemoSpec, memoized
+from profiling import profiled
+from speculative import speculate_treatment_node
+from state import AgentState
+
+def build_initial_state(location: str, month: str, crop: str,
+                        image_bytes: Optional[Union[bytes, memoryview]] = None,
+                        image_path: Optional[str] = None,
+                        images: Optional[List[Union[bytes, memoryview, str]]] = None,
+                        budget_s: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Creates the input state shared by the Streamlit UI, the HTTP API and the CLI.
+    `budget_s` sets the latency budget (deadline) counted from now; None means unlimited.
+    """
+    return {
+        "image_bytes": image_bytes,
+        "image_path": image_path,
+        "images": images,
+        "location": location,
+        "month": month,
+        "crop": crop,
+        "recommended_pesticides": [],
+        "environmental_impact_report": None,
+        "subsidy_info": [],
+        "deadline": deadline_in(budget_s),
+        "degradations": [],
+        "node_timings": {}
+    }
+
+# Final-state fields returned to API / job clients (inputs such as the raw image are never echoed)
+OUTPUT_FIELDS = [
+    "location", "month", "crop", "image_quality", "usable_images", "retake_advice",
+    "candidate_analysis", "image_evidence", "confirmed_pest", "confidence_score", "decision_reasoning",
+    "recommended_pesticides", "environmental_impact_report", "subsidy_info",
+    "degradations", "node_timings", "profile", "error",
+]
+
+def serialize_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Picks the JSON-safe output fields from a (partial or final) AgentState."""
+    return {key: state[key] for key in OUTPUT_FIELDS if key in state}
 
 # ---------------------------------------------------------
-# 1. STATE DEFINITION (The Shared Memory)
+# 2. BUILD THE GRAPH
 # ---------------------------------------------------------
-class AgentState(TypedDict):
-    
-    # --- INPUTS ---
-    image_path: str
-    location: str
-    month: str
-    crop: str
+# langgraph is imported and the graph compiled on first use (see get_app),
+# so importing this module stays cheap for Streamlit reloads and workers.
+def timed(name: str, node):
+    """Wraps a node so its wall time is merged into `node_timings` (and a cancelled run stops before it)."""
+    def run(state):
+        check_cancelled()
+        start = time.perf_counter()
+        update = node(state)
+        return {**update, "node_timings": {name: round(time.perf_counter() - start, 3)}}
+    return run
 
-    # --- NODE A & B ---
-    candidate_analysis: Dict[str, str]
-    confirmed_pest: Optional[str]    
-    confidence_score: float           
-    decision_reasoning: str           
+# Nodes whose output is a function of a few state keys (see node_memo.py).
+# Verification results follow the web, so they are reused for a day only.
+NODE_MEMOS: Dict[str, MemoSpec] = {
+    "pest_detector": MemoSpec(inputs=("candidate_analysis", "crop", "location", "month"),
+                              version=PEST_DETECTOR_VERSION, ttl_s=86400, backend="tiered"),
+    "pesticide_finder": MemoSpec(inputs=("confirmed_pest", "crop"), version=TREATMENT_CACHE_VERSION,
+                                 on_hit=release_speculation),
+    "sustainability_analyzer": MemoSpec(inputs=("recommended_pesticides", "crop", "location"), version=ECO_VERSION),
+    "subsidy_finder": MemoSpec(inputs=("location",), version=subsidy_memo_version),
+}
 
-    # --- NODE C: Pesticide Finder (Consolidated) ---
-    # Now stores the full dictionaries containing category, dosage, and cost
-    recommended_pesticides: List[Dict[str, Any]] 
+def build_graph():
+    from langgraph.graph import StateGraph, START, END
 
-    # --- NODE E: Sustainability Analyzer (NEW) ---
-    environmental_impact_report: Optional[Dict[str, Any]]
+    workflow = StateGraph(AgentState)
+    add_node = lambda name, node: workflow.add_node(
+        name, timed(name, profiled(name, memoized(name, node, NODE_MEMOS.get(name)))))
 
-    # --- NODE D: Subsidy Finder ---
-    subsidy_info: List[Dict]         
+    # Local quality gate + the 5 Nodes
+    add_node("image_quality_gate", image_quality_gate_node)
+    add_node("image_analyzer", image_analyze_node)
+    add_node("speculate_treatment", speculate_treatment_node)
+    add_node("pest_detector", pest_detector_node)
+    add_node("pesticide_finder", pesticide_finder_node)
+    add_node("sustainability_analyzer", sustainability_analyzer_node) # <-- NEW: Add Node E
+    add_node("subsidy_finder", subsidy_finder_node)
 
-    # --- ERROR TRACKING ---
-    error: Optional[str]
+    # ---------------------------------------------------------
+    # 3. DEFINE THE FLOW 
+    # ---------------------------------------------------------
+    workflow.add_edge(START, "image_quality_gate")
+    # Unusable photos end the run with retake advice before any network call
+    workflow.add_conditional_edges("image_quality_gate", route_after_quality_gate,
+                                   {"analyze": "image_analyzer", "retake": END})
+    # Optional (AGRI_SPECULATIVE=1): start the treatment lookup for the top candidate early
+    workflow.add_edge("image_analyzer", "speculate_treatment")
+    workflow.add_edge("speculate_treatment", "pest_detector")
+    workflow.add_edge("pest_detector", "pesticide_finder")
 
-# ---------------------------------------------------------
-# 2. BUILD THE GRAPH
-# ---------------------------------------------------------
-workflow = StateGraph(AgentState)
+    # <-- NEW: Insert Sustainability between Pesticide and Subsidy
+    workflow.add_edge("pesticide_finder", "sustainability_analyzer") 
+    workflow.add_edge("sustainability_analyzer", "subsidy_finder")
+
+    # Completed diagnoses are buffered into the Parquet history (see history_store.py)
+    workflow.add_node("history_recorder", record_history_node)
+    workflow.add_edge("subsidy_finder", "history_recorder")
+    workflow.add_edge("history_recorder", END)
 
-# Add the 5 Nodes
-workflow.add_node("image_analyzer", image_analyze_node)
-workflow.add_node("pest_detector", pest_detector_node)
-workflow.add_node("pesticide_finder", pesticide_finder_node)
-workflow.add_node("sustainability_analyzer", sustainability_analyzer_node) # <-- NEW: Add Node E
-workflow.add_node("subsidy_finder", subsidy_finder_node)
+    return workflow
 
 # ---------------------------------------------------------
-# 3. DEFINE THE FLOW 
+# 4. COMPILE (once per process, shared by every caller)
 # ---------------------------------------------------------
-workflow.add_edge(START, "image_analyzer")
-workflow.add_edge("image_analyzer", "pest_detector")
-workflow.add_edge("pest_detector", "pesticide_finder")
+_app = None
+_app_lock = threading.Lock()
 
-# <-- NEW: Insert Sustainability between Pesticide and Subsidy
-workflow.add_edge("pesticide_finder", "sustainability_analyzer") 
-workflow.add_edge("sustainability_analyzer", "subsidy_finder")
+def get_app():
+    """Returns the compiled graph, compiling it on first call."""
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = build_graph().compile()
+    return _app
 
-workflow.add_edge("subsidy_finder", END)
 
-# ---------------------------------------------------------
-# 4. COMPILE 
-# ---------------------------------------------------------
-app = workflow.compile()
\ No newline at end of file
+def __getattr__(name: str):
+    # Keeps `from graph import app` working; the import itself triggers compilation.
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,248 @@
+"""
+Columnar diagnosis history (Parquet, hive-partitioned by state and month).
+
+Every completed diagnosis is buffered in memory and appended to the dataset in
+batches (one file per partition per flush), so outbreak analytics such as
+"top pests in Punjab in October" read only one partition and the pest column.
+
+A batch is written once FLUSH_ROWS rows are buffered, or by a daemon timer
+FLUSH_INTERVAL_S after its first row (so a quiet server does not hold rows
+indefinitely), and at normal interpreter exit. A crash or SIGKILL loses at
+most the rows of the last FLUSH_INTERVAL_S seconds.
+
+Set AGRI_HISTORY=0 to disable recording, AGRI_HISTORY_DIR to move the dataset.
+
+Usage:
+    python history_store.py --top Punjab October   # top pests for a state / month
+    python history_store.py --compact              # merge small files per partition
+    python history_store.py --benchmark 2000000    # synthetic rows + query timing
+"""
+import atexit
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HISTORY_DIR = os.getenv("AGRI_HISTORY_DIR", os.path.join(BASE_DIR, "data", "history"))
+HISTORY_ENABLED = os.getenv("AGRI_HISTORY", "1") != "0"
+
+# Flush when this many rows are buffered or the oldest buffered row is this old
+FLUSH_ROWS = 500
+FLUSH_INTERVAL_S = 60.0
+
+PARTITION_COLS = ["state", "month"]
+TIMED_NODES = ["image_quality_gate", "image_analyzer", "pest_detector", "pesticide_finder",
+               "sustainability_analyzer", "subsidy_finder"]
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("diagnosed_at", pa.timestamp("ms", tz="UTC")),
+        ("state", pa.string()),
+        ("month", pa.string()),
+        ("crop", pa.string()),
+        ("pest", pa.string()),
+        ("confidence", pa.float32()),
+        ("treatments", pa.list_(pa.string())),
+        ("eco_score", pa.int16()),
+        ("degraded", pa.bool_()),
+        ("error", pa.string()),
+        ("total_s", pa.float32()),
+        *[(f"{node}_s", pa.float32()) for node in TIMED_NODES],
+    ])
+
+
+def _file_schema():
+    """Schema of the files inside a partition (partition values live in the directory names)."""
+    import pyarrow as pa
+
+    return pa.schema([f for f in _schema() if f.name not in PARTITION_COLS])
+
+
+def history_row(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Flattens a final AgentState into one history row."""
+    report = state.get("environmental_impact_report") or {}
+    timings = state.get("node_timings") or {}
+    return {
+        "diagnosed_at": datetime.now(timezone.utc),
+        "state": (state.get("location") or "Unknown").strip(),
+        "month": (state.get("month") or "Unknown").strip(),
+        "crop": state.get("crop"),
+        "pest": state.get("confirmed_pest"),
+        "confidence": state.get("confidence_score"),
+        "treatments": [t.get("chemical_name", "") for t in state.get("recommended_pesticides") or [] if isinstance(t, dict)],
+        "eco_score": report.get("overall_eco_score"),
+        "degraded": bool(state.get("degradations")),
+        "error": state.get("error"),
+        "total_s": sum(timings.values()) if timings else None,
+        **{f"{node}_s": timings.get(node) for node in TIMED_NODES},
+    }
+
+
+class HistoryStore:
+    def __init__(self, root: str = DEFAULT_HISTORY_DIR, flush_rows: int = FLUSH_ROWS,
+                 flush_interval_s: float = FLUSH_INTERVAL_S):
+        self.root = root
+        self.flush_rows = flush_rows
+        self.flush_interval_s = flush_interval_s
+        self._buffer: List[Dict[str, Any]] = []
+        self._oldest: Optional[float] = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    # --- WRITES ---
+    def append(self, state: Dict[str, Any]) -> None:
+        """Buffers one final state; writes the batch once it is large or old enough."""
+        with self._lock:
+            self._buffer.append(history_row(state))
+            self._oldest = self._oldest or time.time()
+            due = len(self._buffer) >= self.flush_rows or time.time() - self._oldest >= self.flush_interval_s
+            if not due and self._timer is None:
+                # First row of a batch: write it after the interval even if no other row arrives
+                self._timer = threading.Timer(self.flush_interval_s, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def flush(self) -> int:
+        with self._lock:
+            rows, self._buffer, self._oldest = self._buffer, [], None
+            timer, self._timer = self._timer, None
+        if timer:
+            timer.cancel()
+        if rows:
+            self.write_rows(rows)
+        return len(rows)
+
+    def _flush_in_background(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"   ⚠️ Could not write diagnosis history: {e}")
+
+    def write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist(rows, schema=_schema())
+        # Unique basename per flush: concurrent processes never overwrite each other's files
+        pq.write_to_dataset(table, self.root, partition_cols=PARTITION_COLS,
+                            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                            existing_data_behavior="overwrite_or_ignore")
+
+    def compact(self) -> int:
+        """Rewrites every partition as a single file. Run offline (no concurrent writers). Returns partitions merged."""
+        import pyarrow.parquet as pq
+
+        merged = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            files = sorted(f for f in filenames if f.endswith(".parquet"))
+            if len(files) < 2:
+                continue
+            table = pq.read_table([os.path.join(dirpath, f) for f in files], schema=_file_schema())
+            target = os.path.join(dirpath, f"part-{uuid.uuid4().hex}-0.parquet")
+            pq.write_table(table, target)
+            for f in files:
+                os.remove(os.path.join(dirpath, f))
+            merged += 1
+        return merged
+
+    # --- QUERIES ---
+    def dataset(self):
+        import pyarrow.dataset as ds
+
+        return ds.dataset(self.root, format="parquet", partitioning="hive", schema=_schema())
+
+    def top_pests(self, state: str, month: Optional[str] = None, limit: int = 10) -> List[Tuple[str, int]]:
+        """Most frequent confirmed pests for a state (and month). Reads one partition, one column."""
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+
+        if not os.path.isdir(self.root):
+            return []
+        condition = (ds.field("state") == state) & ds.field("pest").is_valid()
+        if month:
+            condition &= ds.field("month") == month
+        pests = self.dataset().to_table(columns=["pest"], filter=condition)["pest"]
+        counts = pc.value_counts(pests)
+        ranked = sorted(((c["values"].as_py(), c["counts"].as_py()) for c in counts), key=lambda x: x[1], reverse=True)
+        return ranked[:limit]
+
+    def top_crop_pests(self, state: str, month: str, limit: int = 20) -> List[Tuple[str, str, int]]:
+        """Most frequent (crop, pest) pairs for a state and month, e.g. last season's demand."""
+        import pyarrow.dataset as ds
+
+        if not os.path.isdir(self.root):
+            return []
+        condition = ((ds.field("state") == state) & (ds.field("month") == month)
+                     & ds.field("pest").is_valid() & ds.field("crop").is_valid())
+        table = self.dataset().to_table(columns=["crop", "pest"], filter=condition)
+        counts = table.group_by(["crop", "pest"]).aggregate([("pest", "count")])
+        ranked = sorted(zip(counts["crop"].to_pylist(), counts["pest"].to_pylist(), counts["pest_count"].to_pylist()),
+                        key=lambda x: x[2], reverse=True)
+        return ranked[:limit]
+
+
+_store: Optional[HistoryStore] = None
+_store_lock = threading.Lock()
+
+def get_history_store() -> HistoryStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = HistoryStore()
+                # Buffered rows are written when the process exits normally
+                atexit.register(_store.flush)
+    return _store
+
+
+def record_history_node(state: Dict) -> Dict:
+    """Final graph node: buffers the finished diagnosis into the history store."""
+    if HISTORY_ENABLED:
+        try:
+            get_history_store().append(state)
+        except Exception as e:
+            # Analytics must never break a diagnosis
+            print(f"   ⚠️ Could not record diagnosis history: {e}")
+    return {}
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Diagnosis history (Parquet)")
+    parser.add_argument("--top", nargs="+", metavar=("STATE", "MONTH"))
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--benchmark", type=int, metavar="ROWS")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        store = HistoryStore(tempfile.mkdtemp(prefix="agri-history-"), flush_rows=100_000)
+        states = ["Punjab", "Haryana", "Maharashtra", "Karnataka", "Tamil Nadu", "Odisha", "Bihar", "Gujarat"]
+        months = ["January", "February", "March", "April", "May", "June", "July",
+                  "August", "September", "October", "November", "December"]
+        pests = ["Aphids", "Fall Armyworm", "Whitefly", "Yellow Stem Borer", "Pink Bollworm", "Thrips", "Jassids"]
+        start = time.perf_counter()
+        for i in range(args.benchmark):
+            store.append({"location": random.choice(states), "month": random.choice(months), "crop": "Wheat",
+                          "confirmed_pest": random.choice(pests), "confidence_score": random.random()})
+        store.flush()
+        store.compact()
+        print(f"Wrote {args.benchmark} rows in {time.perf_counter() - start:.1f}s to {store.root}")
+        start = time.perf_counter()
+        top = store.top_pests("Punjab", "October")
+        print(f"top_pests('Punjab', 'October') in {(time.perf_counter() - start) * 1000:.1f} ms: {top}")
+    elif args.compact:
+        print(f"Compacted {get_history_store().compact()} partition(s).")
+    elif args.top:
+        for pest, count in get_history_store().top_pests(*args.top[:2]):
+            print(f"{count:8d}  {pest}")
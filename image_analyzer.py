@@ -1,9 +1,19 @@
 import os
 import base64
-from typing import Dict, List
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
+import io
+from typing import Any, Dict, List, Union
 from pydantic import BaseModel, Field
+from clients import get_structured_model
+from deadline import pick_model
+from pest_lexicon import canonical_pest_name
+
+MODEL_NAME = "gemini-2.5-flash"
+
+# Several photos of the same field are downscaled and packed into one vision call
+MAX_IMAGES_PER_CALL = 4
+MULTI_IMAGE_MAX_SIDE = 768
+MULTI_IMAGE_JPEG_QUALITY = 85
+MAX_CANDIDATES = 3
 
 
 class PestCandidate(BaseModel):
@@ -13,29 +23,90 @@ class PestCandidate(BaseModel):
 class PestAnalysis(BaseModel):
     candidates: List[PestCandidate] = Field(description="A list of 2-3 potential pests identified.")
 
-# 2. IMAGE HELPER FUNCTION
-def encode_image(image_path):
-    """Encodes a local image file to base64 string."""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+# Multi-image field submissions: every candidate carries per-image evidence
+class ImageObservation(BaseModel):
+    image_index: int = Field(description="The 1-based number of the image (as labelled 'Image N') showing this evidence.")
+    evidence: str = Field(description="The visual symptom of this pest seen in that specific image.")
 
-# 3. THE NODE FUNCTION
-def image_analyze_node(state: Dict) -> Dict:
-    
-    image_path = state.get("image_path")
-    
-    
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash", 
-        temperature=0
-    )
-    
-    
-    structured_llm = llm.with_structured_output(PestAnalysis)
-    
-    base64_image = encode_image(image_path)
-    
-    SYSTEM_PROMPT = """
+class FieldPestCandidate(BaseModel):
+    name: str = Field(description="The name of the potential pest identified across the images.")
+    reasoning: str = Field(description="Overall visual evidence explaining why this pest is a candidate for the field.")
+    observations: List[ImageObservation] = Field(description="One entry per image that shows evidence of this pest.")
+
+class FieldPestAnalysis(BaseModel):
+    candidates: List[FieldPestCandidate] = Field(description="A list of 2-3 potential pests identified across all images.")
+
+# 2. IMAGE HELPER FUNCTIONS
+# Images reach the node either as a local file path (CLI / scripts) or as raw
+# bytes / a memoryview handed over in-memory by the UI, so no temp file is needed.
+ImageInput = Union[str, bytes, bytearray, memoryview]
+
+def load_image_bytes(image: ImageInput) -> Union[bytes, memoryview]:
+    """Returns the raw image bytes. In-memory inputs are passed through without copying."""
+    if isinstance(image, (bytes, memoryview)):
+        return image
+    if isinstance(image, bytearray):
+        return memoryview(image)
+    with open(image, "rb") as image_file:
+        return image_file.read()
+
+def guess_mime_type(data: Union[bytes, memoryview]) -> str:
+    """Sniffs the image format from its magic bytes (defaults to JPEG)."""
+    header = bytes(data[:12])
+    if header.startswith(b"\x89PNG"):
+        return "image/png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+def encode_image(image: ImageInput) -> str:
+    """Encodes an image (local path, bytes or memoryview) to a base64 string."""
+    return base64.b64encode(load_image_bytes(image)).decode("ascii")
+
+def image_to_data_url(image: ImageInput) -> str:
+    """
+    Builds the base64 data URL for the vision model.
+    The prefix is joined on the bytes side and the base64 buffer released before
+    decoding, so at most two encoded copies are alive at any time.
+    """
+    data = load_image_bytes(image)
+    encoded = base64.b64encode(data)
+    data_url = f"data:{guess_mime_type(data)};base64,".encode("ascii") + encoded
+    del encoded
+    return data_url.decode("ascii")
+
+def downscale_image(image: ImageInput, max_side: int = MULTI_IMAGE_MAX_SIDE) -> Union[bytes, memoryview]:
+    """
+    Shrinks an image so its longest side is at most `max_side` and re-encodes it as JPEG.
+    Falls back to the original bytes if Pillow cannot read the image.
+    """
+    data = load_image_bytes(image)
+    try:
+        from PIL import Image
+
+        with Image.open(io.BytesIO(data)) as img:
+            if max(img.size) <= max_side and img.format == "JPEG":
+                return data
+            img.thumbnail((max_side, max_side))
+            output = io.BytesIO()
+            img.convert("RGB").save(output, format="JPEG", quality=MULTI_IMAGE_JPEG_QUALITY)
+            return output.getbuffer()
+    except Exception as e:
+        print(f"   ⚠️ Could not downscale image ({e}); sending original.")
+        return data
+
+def collect_images(state: Dict) -> List[ImageInput]:
+    """All images for this case: `images` (multi-photo submission), else the single image_bytes / image_path."""
+    images = state.get("images")
+    if images:
+        return list(images)
+    image = state.get("image_bytes")
+    if image is None:
+        image = state.get("image_path")
+    return [] if image is None else [image]
+
+# 3. PROMPTS
+SYSTEM_PROMPT = """
 <Role>
 You are an expert Agronomist and Plant Pathologist specialized in visual diagnosis of crop pests and diseases. 
 Your goal is to analyze images of crops to identify potential pest infestations based strictly on visual symptoms.
@@ -71,26 +142,150 @@ For each candidate, provide the "Name" and the "Reasoning".
 3.  **No Location Bias:** Do not assume the location or season yet. Rely only on what the image shows.
 </Constraints>
 """
+
+MULTI_IMAGE_PROMPT = """
+<Role>
+You are an expert Agronomist and Plant Pathologist specialized in visual diagnosis of crop pests and diseases. 
+You are reviewing several photographs (labelled "Image 1", "Image 2", ...) taken by one farmer in the SAME field.
+</Role>
+
+<Visual_Analysis_Guidelines>
+1.  **Scan Each Image:** Look for discoloration, physical damage (holes, chewing), or foreign objects (spots, webs, bugs) in every image.
+2.  **Cross-Reference:** A pest that explains symptoms in several images is a stronger candidate than one seen in a single image.
+3.  **Hypothesize:** Based *only* on these visual cues, what are the top 3 most likely biological causes (pests) for the field?
+</Visual_Analysis_Guidelines>
+
+<Task>
+Identify 2 to 3 potential pest candidates for the field.
+For each candidate, provide the "Name", an overall "Reasoning", and one "observation" per image that shows evidence of it (using the image number).
+</Task>
+
+<Constraints>
+1.  **Visual Evidence Only:** Every observation must cite a visual feature visible in that image.
+2.  **Uncertainty:** If images are blurry, of a non-plant, or show healthy plants, say so, or use "None" / "Healthy Plant" as the candidate.
+3.  **No Location Bias:** Do not assume the location or season yet. Rely only on what the images show.
+</Constraints>
+"""
+
+# 4. THE NODE FUNCTION
+def _analyze_single_image(image: ImageInput, model_name: str, number: int = 1) -> Dict[str, Any]:
+    structured_llm = get_structured_model(model_name, PestAnalysis)
     
-    message = HumanMessage(
-        content=[
+    message = {
+        "role": "user",
+        "content": [
             {"type": "text", "text": SYSTEM_PROMPT},
             {
                 "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
+                "image_url": {"url": image_to_data_url(image)}
             },
         ]
-    )
+    }
+    
+    response: PestAnalysis = structured_llm.invoke([message])
+    
+    candidate_dict = {pest.name: pest.reasoning for pest in response.candidates}
+    image_evidence = {
+        pest.name: [{"image_index": number, "evidence": pest.reasoning}] for pest in response.candidates
+    }
+    return {"candidate_analysis": candidate_dict, "image_evidence": image_evidence}
+
+
+def _analyze_image_batch(images: List[ImageInput], numbers: List[int], model_name: str) -> FieldPestAnalysis:
+    """One multimodal call for up to MAX_IMAGES_PER_CALL downscaled images, labelled with their upload numbers."""
+    structured_llm = get_structured_model(model_name, FieldPestAnalysis)
+    
+    content = [{"type": "text", "text": MULTI_IMAGE_PROMPT}]
+    for i, image in zip(numbers, images):
+        content.append({"type": "text", "text": f"Image {i}:"})
+        content.append({"type": "image_url", "image_url": {"url": image_to_data_url(downscale_image(image))}})
+    
+    return structured_llm.invoke([{"role": "user", "content": content}])
+
+
+def _aggregate_candidates(responses: List[FieldPestAnalysis], numbers: List[int]) -> Dict[str, Any]:
+    """Merges candidates across batches, ranking them by how many images support them."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for response in responses:
+        for pest in response.candidates:
+            entry = merged.setdefault(pest.name.strip().lower(), {"name": pest.name, "reasoning": [], "observations": {}})
+            entry["reasoning"].append(pest.reasoning)
+            for obs in pest.observations:
+                if obs.image_index in numbers:
+                    entry["observations"].setdefault(obs.image_index, obs.evidence)
+
+    ranked = sorted(merged.values(), key=lambda e: len(e["observations"]), reverse=True)[:MAX_CANDIDATES]
+
+    candidate_dict = {}
+    image_evidence = {}
+    for entry in ranked:
+        seen_in = sorted(entry["observations"])
+        summary = " ".join(dict.fromkeys(entry["reasoning"]))
+        if seen_in:
+            summary += f" (Seen in {len(seen_in)} of {len(numbers)} images: {', '.join(str(i) for i in seen_in)}.)"
+        candidate_dict[entry["name"]] = summary
+        image_evidence[entry["name"]] = [
+            {"image_index": i, "evidence": entry["observations"][i]} for i in seen_in
+        ]
+    return {"candidate_analysis": candidate_dict, "image_evidence": image_evidence}
+
+
+def canonicalize_candidates(result: Dict[str, Any], crop: str = None) -> Dict[str, Any]:
+    """Maps candidate names onto the pest lexicon, merging candidates that turn out to be the same pest."""
+    candidate_dict: Dict[str, str] = {}
+    image_evidence: Dict[str, List[Dict[str, Any]]] = {}
+    for name, reasoning in result["candidate_analysis"].items():
+        canonical = canonical_pest_name(name, crop)
+        if canonical in candidate_dict:
+            candidate_dict[canonical] += " " + reasoning
+        else:
+            candidate_dict[canonical] = reasoning
+        evidence = image_evidence.setdefault(canonical, [])
+        seen = {item["image_index"] for item in evidence}
+        evidence.extend(item for item in result["image_evidence"].get(name, []) if item["image_index"] not in seen)
+    return {"candidate_analysis": candidate_dict, "image_evidence": image_evidence}
+
+
+def image_analyze_node(state: Dict) -> Dict:
+    
+    images = collect_images(state)
+    if not images:
+        print("Error in Image Analyzer: no image provided.")
+        return {"candidate_analysis": {}, "error": "No image provided."}
+    # Photos rejected by the quality gate are skipped; the others keep their upload number
+    usable = state.get("usable_images")
+    numbers = [i for i in range(1, len(images) + 1) if usable is None or i in usable]
+    images = [images[i - 1] for i in numbers]
+    
+    # The vision call cannot be skipped; when time is short it runs on the lighter model
+    model_name, note = pick_model(state, "image_analyzer", MODEL_NAME)
+    degradations = [note] if note else []
     
     try:
-        response: PestAnalysis = structured_llm.invoke([message])
-        
-        candidate_dict = {pest.name: pest.reasoning for pest in response.candidates}
+        if len(images) == 1:
+            result = _analyze_single_image(images[0], model_name, numbers[0])
+            return {**canonicalize_candidates(result, state.get("crop")), "degradations": degradations}
         
-        return {"candidate_analysis": candidate_dict}
+        print(f"   -> Packing {len(images)} field images into "
+              f"{-(-len(images) // MAX_IMAGES_PER_CALL)} vision call(s).")
+        responses = [
+            _analyze_image_batch(images[start:start + MAX_IMAGES_PER_CALL],
+                                 numbers[start:start + MAX_IMAGES_PER_CALL], model_name)
+            for start in range(0, len(images), MAX_IMAGES_PER_CALL)
+        ]
+        result = _aggregate_candidates(responses, numbers)
+        return {**canonicalize_candidates(result, state.get("crop")), "degradations": degradations}
         
     except Exception as e:
         
         print(f"Error in Image Analyzer: {e}")
-        return {"candidate_analysis": {}, "error": str(e)}
+        return {"candidate_analysis": {}, "degradations": degradations, "error": str(e)}
+
+
+if __name__ == "__main__":
+    import sys
+    import json
 
+    # CLI usage keeps the path-based input: python image_analyzer.py leaf.jpg
+    result = image_analyze_node({"image_path": sys.argv[1]})
+    print(json.dumps(result, indent=2))
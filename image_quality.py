@@ -0,0 +1,170 @@
+"""
+Local image quality gate (runs before any network call).
+
+Every photo is scored on a small grayscale / RGB thumbnail:
+    resolution  - short side of the original image in pixels
+    sharpness   - variance of the Laplacian (low = blurry)
+    brightness  - mean luminance plus the share of crushed / clipped pixels
+    green_ratio - share of healthy-leaf pixels (excess-green index)
+    plant_ratio - share of plant-coloured pixels: green plus the yellow / brown of
+                  chlorotic or necrotic tissue
+
+Little plant colour alone is only a warning (a mildew-whitened or fully browned
+leaf is exactly what needs a diagnosis); it rejects a photo only together with
+another failed check. Photos that fail a check are skipped by the analyzer
+(the others are listed in `usable_images`, keeping the upload numbering); if
+none is usable the graph ends with a "retake photo" result instead of calling
+the vision model. Thresholds come from AGRI_QC_* env vars; AGRI_QC=0 disables
+the gate.
+
+Usage:
+    python image_quality.py leaf.jpg [more.jpg ...]
+"""
+import io
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from image_analyzer import ImageInput, collect_images, load_image_bytes
+
+QC_ENABLED = os.getenv("AGRI_QC", "1") != "0"
+# Metrics are computed on a thumbnail of this size (keeps the gate in the millisecond range)
+ANALYSIS_MAX_SIDE = 512
+
+
+@dataclass
+class QualityThresholds:
+    min_side: int = int(os.getenv("AGRI_QC_MIN_SIDE", "224"))
+    min_sharpness: float = float(os.getenv("AGRI_QC_MIN_SHARPNESS", "25"))
+    min_brightness: float = float(os.getenv("AGRI_QC_MIN_BRIGHTNESS", "35"))
+    max_brightness: float = float(os.getenv("AGRI_QC_MAX_BRIGHTNESS", "235"))
+    max_dark_fraction: float = float(os.getenv("AGRI_QC_MAX_DARK_FRACTION", "0.8"))
+    max_clipped_fraction: float = float(os.getenv("AGRI_QC_MAX_CLIPPED_FRACTION", "0.6"))
+    # Applied to plant_ratio (the env name predates the yellow / brown hues)
+    min_green_ratio: float = float(os.getenv("AGRI_QC_MIN_GREEN_RATIO", "0.03"))
+
+
+DEFAULT_THRESHOLDS = QualityThresholds()
+
+
+def measure_image(image: ImageInput) -> Dict[str, float]:
+    """Computes the raw quality metrics of one image (raises if Pillow cannot decode it)."""
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(io.BytesIO(load_image_bytes(image))) as img:
+        width, height = img.size
+        # JPEG draft mode decodes straight at a reduced scale
+        img.draft("RGB", (ANALYSIS_MAX_SIDE, ANALYSIS_MAX_SIDE))
+        thumb = img.convert("RGB")
+        thumb.thumbnail((ANALYSIS_MAX_SIDE, ANALYSIS_MAX_SIDE))
+
+    rgb = np.asarray(thumb, dtype=np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    gray = 0.299 * r + 0.587 * g + 0.114 * b
+
+    # 4-neighbour Laplacian
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4 * gray[1:-1, 1:-1])
+
+    return {
+        "width": width,
+        "height": height,
+        "sharpness": float(laplacian.var()) if laplacian.size else 0.0,
+        "brightness": float(gray.mean()),
+        "dark_fraction": float((gray < 25).mean()),
+        "clipped_fraction": float((gray > 245).mean()),
+        "green_ratio": float(((2 * g - r - b) > 20).mean()),
+        "plant_ratio": float((((2 * g - r - b) > 20) | (((r - b) > 30) & ((g - b) > 15))).mean()),
+    }
+
+
+def assess_image(image: ImageInput, thresholds: QualityThresholds = DEFAULT_THRESHOLDS) -> Dict[str, Any]:
+    """
+    Returns {ok, metrics, issues, warnings, advice}; `advice` holds one retake instruction per
+    failed check, `warnings` the soft findings that do not reject the photo on their own.
+    """
+    try:
+        metrics = measure_image(image)
+    except Exception as e:
+        return {"ok": False, "metrics": {}, "issues": ["unreadable"], "warnings": [],
+                "advice": [f"The file could not be read as an image ({e}). Upload a JPEG or PNG photo."]}
+
+    issues, warnings, advice = [], [], []
+    short_side = min(metrics["width"], metrics["height"])
+    if short_side < thresholds.min_side:
+        issues.append("low_resolution")
+        advice.append(f"The photo is only {metrics['width']}x{metrics['height']} px. Use the camera's full "
+                      f"resolution (at least {thresholds.min_side} px on the short side).")
+    if metrics["brightness"] < thresholds.min_brightness or metrics["dark_fraction"] > thresholds.max_dark_fraction:
+        issues.append("underexposed")
+        advice.append("The photo is too dark. Retake it in daylight, facing away from the sun, out of deep shade.")
+    elif metrics["brightness"] > thresholds.max_brightness or metrics["clipped_fraction"] > thresholds.max_clipped_fraction:
+        issues.append("overexposed")
+        advice.append("The photo is washed out by glare. Shade the leaf with your hand or change the angle and retake it.")
+    # Blur and colour cannot be judged on a badly exposed photo; the exposure tip comes first
+    exposed_ok = not issues or issues == ["low_resolution"]
+    if exposed_ok and metrics["sharpness"] < thresholds.min_sharpness:
+        issues.append("blurry")
+        advice.append("The photo is blurry. Hold the phone steady, tap the screen to focus on the damaged leaf and retake it.")
+    if exposed_ok and metrics["plant_ratio"] < thresholds.min_green_ratio:
+        if issues:
+            issues.append("no_vegetation")
+            advice.append("Little or no plant is visible. Fill the frame with the affected leaf, stem or fruit.")
+        else:
+            warnings.append("little_vegetation")
+
+    return {"ok": not issues, "metrics": {k: round(v, 3) for k, v in metrics.items()},
+            "issues": issues, "warnings": warnings, "advice": advice}
+
+
+def image_quality_gate_node(state: Dict) -> Dict:
+    print("\n--- [Gate] Image Quality Check ---")
+
+    images = collect_images(state)
+    if not QC_ENABLED or not images:
+        return {}
+
+    reports = []
+    usable = []
+    for index, image in enumerate(images, 1):
+        report = {"image_index": index, **assess_image(image)}
+        reports.append(report)
+        metrics = report["metrics"]
+        if metrics:
+            print(f"   -> Image {index}: {metrics['width']}x{metrics['height']} px, sharpness {metrics['sharpness']:.0f}, "
+                  f"brightness {metrics['brightness']:.0f}, plant {metrics['plant_ratio']:.0%} "
+                  f"=> {'ok' if report['ok'] else 'rejected: ' + ', '.join(report['issues'])}"
+                  + (f" (warning: {', '.join(report['warnings'])})" if report["warnings"] else ""))
+        else:
+            print(f"   -> Image {index}: rejected (unreadable)")
+        if report["ok"]:
+            usable.append(index)
+
+    if not usable:
+        advice = list(dict.fromkeys(tip for report in reports for tip in report["advice"]))
+        print("   ⛔ No usable photo. Asking the farmer to retake it.")
+        return {
+            "image_quality": reports,
+            "retake_advice": advice,
+            "error": "Photo quality too low for a diagnosis. Please retake the photo.",
+        }
+
+    if len(usable) < len(images):
+        print(f"   ⚠️ Dropping {len(images) - len(usable)} unusable photo(s); analysing {len(usable)}.")
+        # `images` stays as uploaded so evidence, reports and the UI share one numbering
+        return {"image_quality": reports, "usable_images": usable}
+    return {"image_quality": reports}
+
+
+def route_after_quality_gate(state: Dict) -> str:
+    """Conditional edge: stop the run when the gate asked for a retake."""
+    return "retake" if state.get("retake_advice") else "analyze"
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+
+    for path in sys.argv[1:]:
+        print(path, json.dumps(assess_image(path), indent=2))
@@ -0,0 +1,260 @@
+"""
+Durable submit-and-poll job queue for diagnosis requests.
+
+Jobs live in a SQLite database (WAL mode) and move through
+    queued -> running -> done | failed
+A worker claims a job with a time-limited lease and keeps renewing it while the
+graph runs. If a worker dies, its lease expires and the job is re-queued until
+`max_attempts` is reached. Results are stored with the binary state codec of
+state.py (rows written as JSON by older versions are still read).
+
+Usage:
+    python job_queue.py --workers 4          # start a pool of worker processes
+    python job_queue.py --status <job_id>    # inspect one job
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from state import decode_state, encode_state
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.getenv("AGRI_JOBS_DB", os.path.join(BASE_DIR, "data", "jobs.sqlite3"))
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    status       TEXT NOT NULL,
+    location     TEXT NOT NULL,
+    month        TEXT NOT NULL,
+    crop         TEXT NOT NULL,
+    image        BLOB NOT NULL,
+    result       TEXT,
+    error        TEXT,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker_id    TEXT,
+    lease_until  REAL,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+
+def _decode_result(stored: Any) -> Optional[Dict[str, Any]]:
+    if not stored:
+        return None
+    if isinstance(stored, str):
+        return json.loads(stored)
+    return decode_state(stored, allow_schema_drift=True)
+
+
+class JobQueue:
+    def __init__(self, path: str = DEFAULT_DB_PATH,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One short-lived connection per call keeps the queue safe to use from any thread or process.
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # --- PRODUCER SIDE ---
+    def submit(self, location: str, month: str, crop: str, image_bytes: bytes) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, location, month, crop, image, max_attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, location, month, crop, sqlite3.Binary(bytes(image_bytes)),
+                 self.max_attempts, now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the public view of a job (no image), with the decoded result once done."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, status, location, month, crop, result, error, attempts, created_at, updated_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = _decode_result(job["result"])
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    # --- WORKER SIDE ---
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically leases the oldest queued job (after recycling expired leases)."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._recycle_expired(conn, now)
+                row = conn.execute(
+                    "SELECT id, location, month, crop, image, attempts FROM jobs "
+                    "WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker_id = ?, lease_until = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE id = ?",
+                    (RUNNING, worker_id, now + self.lease_seconds, now, row["id"]),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        job = dict(row)
+        job["attempts"] += 1
+        return job
+
+    def _recycle_expired(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = 'Lease expired after final attempt.', worker_id = NULL, "
+            "updated_at = ? WHERE status = ? AND lease_until < ? AND attempts >= max_attempts",
+            (FAILED, now, RUNNING, now),
+        )
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker_id = NULL, updated_at = ? "
+            "WHERE status = ? AND lease_until < ?",
+            (QUEUED, now, RUNNING, now),
+        )
+
+    def renew_lease(self, job_id: str, worker_id: str) -> bool:
+        """Extends the lease; returns False if the job is no longer owned by this worker."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND worker_id = ? AND status = ?",
+                (now + self.lease_seconds, now, job_id, worker_id, RUNNING),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, worker_id = NULL, lease_until = NULL, "
+                "updated_at = ? WHERE id = ? AND worker_id = ?",
+                (DONE, sqlite3.Binary(encode_state(result)), time.time(), job_id, worker_id),
+            )
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> str:
+        """Records a failed attempt: re-queues the job if attempts remain, else marks it failed."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+                "error = ?, worker_id = NULL, lease_until = NULL, updated_at = ? WHERE id = ? AND worker_id = ?",
+                (QUEUED, FAILED, error, time.time(), job_id, worker_id),
+            )
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else FAILED
+
+
+# ---------------------------------------------------------
+# WORKER PROCESSES
+# ---------------------------------------------------------
+def _keep_lease_alive(queue: JobQueue, job_id: str, worker_id: str, stop: threading.Event) -> None:
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.renew_lease(job_id, worker_id):
+            return
+
+
+def run_worker(db_path: str = DEFAULT_DB_PATH, poll_interval: float = 1.0,
+               lease_seconds: float = DEFAULT_LEASE_SECONDS) -> None:
+    """Worker loop: holds one warm compiled graph and processes jobs until interrupted."""
+    from dotenv import load_dotenv
+    load_dotenv()
+    from graph import get_app, build_initial_state, serialize_state
+    from profiling import invoke_graph
+    from reference_data import start_reference_watcher
+
+    worker_id = f"{os.uname().nodename}:{os.getpid()}"
+    queue = JobQueue(db_path, lease_seconds=lease_seconds)
+    graph_app = get_app()
+    start_reference_watcher()
+    print(f"   👷 Worker {worker_id} ready.")
+
+    while True:
+        job = queue.claim(worker_id)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        print(f"   👷 [{worker_id}] Running job {job['id']} (attempt {job['attempts']})")
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_keep_lease_alive, args=(queue, job["id"], worker_id, stop), daemon=True)
+        heartbeat.start()
+        try:
+            state = build_initial_state(job["location"], job["month"], job["crop"], image_bytes=job["image"])
+            final_state = invoke_graph(graph_app, state, label=f"job-{job['id']}")
+            queue.complete(job["id"], worker_id, serialize_state(final_state))
+            print(f"   ✅ [{worker_id}] Job {job['id']} done.")
+        except Exception as e:
+            status = queue.fail(job["id"], worker_id, str(e))
+            print(f"   ❌ [{worker_id}] Job {job['id']} failed ({status}): {e}")
+        finally:
+            stop.set()
+
+
+def start_workers(count: int, db_path: str = DEFAULT_DB_PATH) -> list:
+    """Starts `count` worker processes (spawned, so each builds its own graph and clients)."""
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for _ in range(count):
+        process = context.Process(target=run_worker, args=(db_path,), daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agri-Agent diagnosis job workers")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--status", metavar="JOB_ID", help="Print one job and exit")
+    args = parser.parse_args()
+
+    if args.status:
+        print(json.dumps(JobQueue(args.db).get(args.status), indent=2))
+    else:
+        print(f"🌿 Starting {args.workers} diagnosis workers on {args.db}")
+        workers = start_workers(args.workers, args.db)
+        try:
+            for process in workers:
+                process.join()
+        except KeyboardInterrupt:
+            print("Shutting down workers.")
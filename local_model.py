@@ -0,0 +1,110 @@
+"""
+Offline stand-in for the Gemini chat models (AGRI_LLM_BACKEND=local).
+
+Implements the small part of the provider API the pipeline uses, so prompt
+assembly and context caching can be exercised without network or API key:
+
+* `LocalChatModel(...).with_structured_output(schema).invoke(messages)` returns a
+  schema instance filled with placeholder values.
+* `create_cache(model, system_instruction, ttl_s)` registers a cached prefix and
+  returns its handle. Like the real API it rejects prefixes below the model's
+  minimum size, and a request that uses a handle must not carry its own system
+  message.
+* Latency is simulated as LOCAL_MS_PER_1K_TOKENS per 1k *uncached* input tokens,
+  so a cached prefix shows up as a latency saving in the prompt-cache stats.
+* `with_structured_output(schema, include_raw=True)` returns the provider's
+  {"raw", "parsed", "parsing_error"} dict. AGRI_LOCAL_MALFORMED=1 makes every
+  such response truncated JSON with an out-of-range score, to exercise
+  structured_repair.py.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import typing
+from typing import Any, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+CHARS_PER_TOKEN = 4
+LOCAL_MS_PER_1K_TOKENS = float(os.getenv("AGRI_LOCAL_MS_PER_1K_TOKENS", "40"))
+LOCAL_MIN_CACHE_TOKENS = 1024
+LOCAL_MALFORMED = os.getenv("AGRI_LOCAL_MALFORMED", "0") == "1"
+
+_caches: Dict[str, Dict[str, Any]] = {}
+_caches_lock = threading.Lock()
+
+
+def create_cache(model: str, system_instruction: str, ttl_s: float) -> str:
+    tokens = len(system_instruction) // CHARS_PER_TOKEN
+    if tokens < LOCAL_MIN_CACHE_TOKENS:
+        raise ValueError(f"Cached content is too small: {tokens} < {LOCAL_MIN_CACHE_TOKENS} tokens.")
+    name = "cachedContents/local-" + hashlib.sha256(f"{model}\0{system_instruction}".encode("utf-8")).hexdigest()[:16]
+    with _caches_lock:
+        _caches[name] = {"model": model, "tokens": tokens, "expires_at": time.time() + ttl_s}
+    return name
+
+
+def placeholder(schema: Type[BaseModel]) -> BaseModel:
+    """Schema instance with a neutral value per field (first allowed value, mid-range numbers)."""
+    def value(annotation):
+        origin = typing.get_origin(annotation)
+        if origin is typing.Literal:
+            return typing.get_args(annotation)[0]
+        if origin in (list, List):
+            return [value(typing.get_args(annotation)[0])]
+        if origin is typing.Union:
+            return value(next(a for a in typing.get_args(annotation) if a is not type(None)))
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return placeholder(annotation)
+        return {int: 50, float: 0.9, bool: True, dict: {}}.get(annotation, "stand-in")
+
+    return schema(**{name: value(field.annotation) for name, field in schema.model_fields.items()})
+
+
+class LocalMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+def malformed(instance: BaseModel) -> str:
+    """The instance as JSON with numbers out of range and the last 15% cut off."""
+    text = json.dumps(instance.model_dump()).replace(": 0.9", ": 90").replace(": 50", ": \"150/100\"")
+    return text[:int(len(text) * 0.85)]
+
+
+class LocalStructuredModel:
+    def __init__(self, chat: "LocalChatModel", schema: Type[BaseModel], include_raw: bool = False):
+        self.chat = chat
+        self.schema = schema
+        self.include_raw = include_raw
+
+    def invoke(self, messages: List[Dict], *args, **kwargs) -> Any:
+        tokens = sum(len(str(m.get("content", ""))) for m in messages) // CHARS_PER_TOKEN
+        if self.chat.cached_content:
+            with _caches_lock:
+                cache = _caches.get(self.chat.cached_content)
+            if cache is None or cache["expires_at"] < time.time():
+                raise ValueError(f"CachedContent not found (or expired): {self.chat.cached_content}")
+            if cache["model"] != self.chat.model:
+                raise ValueError(f"Cached content was created for {cache['model']}, not {self.chat.model}.")
+            if any(m.get("role") == "system" for m in messages):
+                raise ValueError("CachedContent can not be used with a request setting system_instruction.")
+        time.sleep(tokens / 1000 * LOCAL_MS_PER_1K_TOKENS / 1000)
+        instance = placeholder(self.schema)
+        if not self.include_raw:
+            return instance
+        if LOCAL_MALFORMED:
+            return {"raw": LocalMessage(malformed(instance)), "parsed": None,
+                    "parsing_error": ValueError(f"Invalid JSON for {self.schema.__name__}")}
+        return {"raw": LocalMessage(instance.model_dump_json()), "parsed": instance, "parsing_error": None}
+
+
+class LocalChatModel:
+    def __init__(self, model: str, cached_content: Optional[str] = None):
+        self.model = model
+        self.cached_content = cached_content
+
+    def with_structured_output(self, schema: Type[BaseModel], include_raw: bool = False) -> LocalStructuredModel:
+        return LocalStructuredModel(self, schema, include_raw)
@@ -0,0 +1,219 @@
+"""
+Declarative memoization of graph nodes.
+
+A node whose output depends only on a few state keys (pesticide_finder on
+`confirmed_pest` + `crop`, subsidy_finder on `location`, ...) is registered in
+graph.py (NODE_MEMOS) with a MemoSpec naming those keys. The wrapper looks the
+node's update up before running it and stores it afterwards:
+
+    "subsidy_finder": MemoSpec(inputs=("location",), version=subsidy_memo_version),
+
+* key      version + node + normalized input values ('Rice ' == 'rice')
+* version  a string, or a callable evaluated per lookup (e.g. the content hash
+           of schemes.json) - a changed prompt / schema / data never hits
+* ttl_s    per node
+* backend  "memory" (per-process LRU), "sqlite" (result_cache.py, shared by all
+           processes using the same AGRI_RESULT_CACHE_DB) or "tiered" (LRU in
+           front of SQLite). More can be added with register_memo_backend().
+
+Updates carrying degradations or an error are never stored, so a run squeezed
+by its deadline does not pin a degraded answer. MEMO_STATS reports hits,
+misses, stores and the hit rate per node.
+
+Set AGRI_NODE_MEMO=0 to disable, AGRI_NODE_MEMO_BACKEND to force one backend for
+every node, AGRI_NODE_MEMO_SIZE for the LRU size per node (default 512).
+
+Usage:
+    python node_memo.py   # show the memoized nodes and their specs
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple, Union
+
+from result_cache import DEFAULT_TTL_S, cached_result, store_result, version_hash
+from state import StateCodecError, decode_state, encode_state
+
+NODE_MEMO_ENABLED = os.getenv("AGRI_NODE_MEMO", "1") != "0"
+NODE_MEMO_BACKEND = os.getenv("AGRI_NODE_MEMO_BACKEND")
+NODE_MEMO_SIZE = int(os.getenv("AGRI_NODE_MEMO_SIZE", "512"))
+
+
+class MemoSpec(NamedTuple):
+    inputs: Tuple[str, ...]
+    version: Union[str, Callable[[], str]] = ""
+    ttl_s: float = DEFAULT_TTL_S
+    backend: str = "memory"
+    # Called with the state on a hit, e.g. to release work started for the node
+    on_hit: Optional[Callable[[Dict], None]] = None
+
+
+# ---------------------------------------------------------
+# BACKENDS
+# ---------------------------------------------------------
+class MemoryBackend:
+    """
+    LRU with per-entry expiry, local to this process. Values are kept encoded
+    (state.py codec): compact, and every hit gets its own copy to mutate.
+    """
+
+    def __init__(self, max_entries: int = NODE_MEMO_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return decode_state(entry[1])
+
+    def put(self, key: str, value: Any, ttl_s: float) -> None:
+        blob = encode_state(value)
+        with self._lock:
+            self._entries[key] = (time.time() + ttl_s, blob)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteBackend:
+    """
+    Entries in the shared result cache, namespace 'memo:<node>', encoded with the
+    state.py codec. Rows from an older AgentState schema (or older JSON rows) are misses.
+    """
+
+    def __init__(self, node: str):
+        self.namespace = f"memo:{node}"
+
+    def get(self, key: str) -> Optional[Any]:
+        blob = cached_result(self.namespace, key)
+        if not isinstance(blob, bytes):
+            return None
+        try:
+            return decode_state(blob)
+        except StateCodecError:
+            return None
+
+    def put(self, key: str, value: Any, ttl_s: float) -> None:
+        store_result(self.namespace, key, encode_state(value), ttl_s)
+
+
+class TieredBackend:
+    """Memory first; SQLite hits are copied into memory."""
+
+    def __init__(self, node: str):
+        self.memory = MemoryBackend()
+        self.shared = SQLiteBackend(node)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is None:
+            value = self.shared.get(key)
+            if value is not None:
+                # The SQLite row keeps its own expiry; a short local copy is enough
+                self.memory.put(key, value, 300.0)
+        return value
+
+    def put(self, key: str, value: Any, ttl_s: float) -> None:
+        self.memory.put(key, value, ttl_s)
+        self.shared.put(key, value, ttl_s)
+
+
+MEMO_BACKENDS: Dict[str, Callable[[str], Any]] = {
+    "memory": lambda node: MemoryBackend(),
+    "sqlite": SQLiteBackend,
+    "tiered": TieredBackend,
+}
+
+
+def register_memo_backend(name: str, factory: Callable[[str], Any]) -> None:
+    """`factory(node)` returns an object with get(key) and put(key, value, ttl_s)."""
+    MEMO_BACKENDS[name] = factory
+
+
+# ---------------------------------------------------------
+# METRICS
+# ---------------------------------------------------------
+class MemoStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_node: Dict[str, Dict[str, int]] = {}
+
+    def record(self, node: str, outcome: str) -> None:
+        with self._lock:
+            entry = self.by_node.setdefault(node, {"hits": 0, "misses": 0, "stores": 0, "not_stored": 0})
+            entry[outcome] += 1
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                node: {**entry, "hit_rate": round(entry["hits"] / (entry["hits"] + entry["misses"]), 3)
+                       if entry["hits"] + entry["misses"] else None}
+                for node, entry in self.by_node.items()
+            }
+
+
+MEMO_STATS = MemoStats()
+
+
+# ---------------------------------------------------------
+# THE WRAPPER
+# ---------------------------------------------------------
+def _normalize(value: Any) -> Any:
+    return value.strip().lower() if isinstance(value, str) else value
+
+
+def memo_key(node: str, spec: MemoSpec, state: Dict) -> str:
+    version = spec.version() if callable(spec.version) else spec.version
+    return version_hash(node, version, [_normalize(state.get(key)) for key in spec.inputs])
+
+
+def memoized(name: str, node: Callable[[Dict], Dict], spec: Optional[MemoSpec]) -> Callable[[Dict], Dict]:
+    """Wraps a node with the lookup / store of `spec` (unchanged when spec is None or memo is off)."""
+    if spec is None or not NODE_MEMO_ENABLED:
+        return node
+    backend = MEMO_BACKENDS[NODE_MEMO_BACKEND or spec.backend](name)
+
+    def run(state):
+        key = memo_key(name, spec, state)
+        try:
+            update = backend.get(key)
+        except Exception as e:
+            print(f"   ⚠️ Memo lookup for {name} failed: {e}")
+            update = None
+        if update is not None:
+            MEMO_STATS.record(name, "hits")
+            print(f"   ♻️ {name}: reused the output of an identical earlier request.")
+            if spec.on_hit:
+                spec.on_hit(state)
+            return update
+
+        MEMO_STATS.record(name, "misses")
+        update = node(state)
+        if update.get("degradations") or update.get("error"):
+            MEMO_STATS.record(name, "not_stored")
+            return update
+        try:
+            backend.put(key, update, spec.ttl_s)
+            MEMO_STATS.record(name, "stores")
+        except Exception as e:
+            print(f"   ⚠️ Could not memoize {name}: {e}")
+        return update
+
+    return run
+
+
+if __name__ == "__main__":
+    from graph import NODE_MEMOS
+
+    for name, spec in NODE_MEMOS.items():
+        version = spec.version() if callable(spec.version) else spec.version
+        print(f"{name:24} inputs={','.join(spec.inputs):40} backend={NODE_MEMO_BACKEND or spec.backend:7} "
+              f"ttl={spec.ttl_s / 3600:.0f}h version={version}")
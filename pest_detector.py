@@ -1,8 +1,20 @@
 from typing import Dict, Optional, List, Any
-from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import BaseModel, Field
-from search import search_web, format_search_results
+from cascade import run_cascade, MIN_CONFIDENCE
+from search import format_search_results
+from retrieval_policy import adaptive_search, VERIFICATION_POLICY
 from constants import VERIFICATION_DOMAINS
+from domain_stats import record_citations
+from pest_lexicon import canonical_pest_name
+from deadline import fits, LIGHT_MODEL
+from prompt_cache import prompt_messages, static_prefix
+from result_cache import version_hash
+
+MODEL_NAME = "gemini-2.5-flash"
+
+# Prompt budget for the evidence of each candidate (extractive, see search.format_search_results)
+EVIDENCE_CHARS_PER_RESULT = 450
+EVIDENCE_CHARS_PER_CANDIDATE = 800
 
 class PestConclusion(BaseModel):
     confirmed_pest: str = Field(
@@ -17,41 +29,7 @@ class PestConclusion(BaseModel):
         description="A concise explanation of why this pest was chosen over others, referencing the search evidence."
     )
 
-def pest_detector_node(state: Dict) -> Dict:
-    print("\n--- [Node B] Pest Detector: Verifying Candidates ---")
-    
-    candidates = state.get("candidate_analysis", {})
-    location = state.get("location")
-    month = state.get("month")
-    crop = state.get("crop")
-    
-    if not candidates:
-        print("   -> No visual candidates provided. Exiting.")
-        return {
-            "confirmed_pest": None, 
-            "confidence_score": 0.0,
-            "decision_reasoning": "No pest candidates were identified from the image."
-        }
-
-    aggregated_evidence = ""
-    print(f"   -> Investigating {len(candidates)} candidates for '{crop}' in '{location}' during '{month}'.")
-    
-    for pest_name, visual_reasoning in candidates.items():
-        query = f"{pest_name} infestation on {crop} in {location} during {month}"
-        
-        results = search_web(query, domains=VERIFICATION_DOMAINS, max_results=2)
-        formatted_results = format_search_results(results)
-        
-        aggregated_evidence += f"\n=== CANDIDATE: {pest_name} ===\n"
-        aggregated_evidence += f"[Visual Evidence from Image]: {visual_reasoning}\n"
-        aggregated_evidence += f"[Search Query Used]: {query}\n"
-        aggregated_evidence += f"[Search Findings]:\n{formatted_results}\n"
-        aggregated_evidence += "================================\n"
-
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0)
-    structured_llm = llm.with_structured_output(PestConclusion)
-    
-    SYSTEM_PROMPT = """
+SYSTEM_PROMPT = """
 <Role>
 You are an expert Agricultural Entomologist and Data Verification Specialist. 
 Your specific task is to cross-reference visual pest identification candidates against environmental facts (Location, Season, Crop) and real-time search evidence.
@@ -107,6 +85,83 @@ Identify the SINGLE most likely pest.
 * **Decision:** You must choose one of the provided candidates or "None".
 </Constraints>
 """
+PROMPT_PREFIX = static_prefix("pest_detector", SYSTEM_PROMPT)
+PROMPT_VERSION = version_hash(SYSTEM_PROMPT, PestConclusion.schema())
+
+def verification_query(pest_name: str, crop: str, location: str, month: str) -> str:
+    """Search query used to verify one candidate (also pre-run by season_warmup.py)."""
+    return f"{pest_name} infestation on {crop} in {location} during {month}"
+
+def validate_conclusion(response: PestConclusion, candidates: Dict[str, str], crop: str = None) -> Optional[str]:
+    """Cascade check: a known candidate with enough confidence, else escalate."""
+    pest = (response.confirmed_pest or "").strip().lower()
+    if pest in ("", "none", "unknown"):
+        return "no pest confirmed"
+    if canonical_pest_name(response.confirmed_pest, crop).lower() not in (name.lower() for name in candidates):
+        return f"'{response.confirmed_pest}' is not a candidate"
+    if response.confidence_score < MIN_CONFIDENCE:
+        return f"confidence {response.confidence_score:.2f} < {MIN_CONFIDENCE}"
+    return None
+
+def pest_detector_node(state: Dict) -> Dict:
+    print("\n--- [Node B] Pest Detector: Verifying Candidates ---")
+    
+    candidates = state.get("candidate_analysis", {})
+    location = state.get("location")
+    month = state.get("month")
+    crop = state.get("crop")
+    
+    if not candidates:
+        print("   -> No visual candidates provided. Exiting.")
+        return {
+            "confirmed_pest": None, 
+            "confidence_score": 0.0,
+            "decision_reasoning": "No pest candidates were identified from the image."
+        }
+
+    aggregated_evidence = ""
+    # Raw results per candidate; pesticide_finder reuses those of the confirmed pest
+    verification_evidence = {}
+    degradations = []
+    print(f"   -> Investigating {len(candidates)} candidates for '{crop}' in '{location}' during '{month}'.")
+    
+    for pest_name, visual_reasoning in candidates.items():
+        query = verification_query(pest_name, crop, location, month)
+        
+        # Verification searches are optional: without time for one search plus a verdict, skip them
+        if fits(state, "pest_detector", "search", LIGHT_MODEL):
+            results = adaptive_search(query, VERIFICATION_POLICY, domains=VERIFICATION_DOMAINS,
+                                      required_terms=[crop, location])
+            verification_evidence[pest_name] = [{"url": res.get("url", ""), "content": res.get("content", "")}
+                                                for res in results]
+            formatted_results = format_search_results(
+                results, query=query, focus_terms=[pest_name, crop, location, month],
+                per_result_chars=EVIDENCE_CHARS_PER_RESULT, total_chars=EVIDENCE_CHARS_PER_CANDIDATE
+            )
+        else:
+            print(f"   ⏱️ Time budget low. Skipping verification search for '{pest_name}'.")
+            degradations.append(f"pest_detector: skipped verification search for '{pest_name}'")
+            formatted_results = "Search skipped (response-time budget)."
+        
+        aggregated_evidence += f"\n=== CANDIDATE: {pest_name} ===\n"
+        aggregated_evidence += f"[Visual Evidence from Image]: {visual_reasoning}\n"
+        aggregated_evidence += f"[Search Query Used]: {query}\n"
+        aggregated_evidence += f"[Search Findings]:\n{formatted_results}\n"
+        aggregated_evidence += "================================\n"
+
+    if not fits(state, "pest_detector", LIGHT_MODEL):
+        fallback_pest = list(candidates.keys())[0]
+        print("   ⏱️ Time budget exhausted. Falling back to top visual candidate.")
+        degradations.append("pest_detector: skipped LLM verification, used top visual candidate")
+        return {
+            "confirmed_pest": fallback_pest,
+            "confidence_score": 0.4,
+            "decision_reasoning": f"Verification skipped to meet the response-time budget. Defaulting to visual diagnosis: {fallback_pest}.",
+            "verification_evidence": verification_evidence,
+            "degradations": degradations,
+            "error": None
+        }
+
     
     user_message = f"""
     <Context>
@@ -124,10 +179,10 @@ Identify the SINGLE most likely pest.
 
     try:
         print("   -> Asking AI to make the final decision...")
-        response = structured_llm.invoke([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_message}
-        ])
+        response, notes = run_cascade(state, "pest_detector", PestConclusion,
+                                      prompt_messages(PROMPT_PREFIX, user_message),
+                                      validate=lambda r: validate_conclusion(r, candidates, crop))
+        degradations += notes
         
         final_pest = response.confirmed_pest
         confidence = response.confidence_score
@@ -139,6 +194,13 @@ Identify the SINGLE most likely pest.
             final_pest = list(candidates.keys())[0]
             confidence = 0.4 
             reasoning += f" (Note: Verification inconclusive. Defaulting to most likely visual diagnosis: {final_pest}.)"
+        else:
+            # The verdict may spell the candidate differently ("Aphid" vs "Aphids")
+            final_pest = canonical_pest_name(final_pest, crop)
+            # Sources that back the verdict count towards their domain's yield (domain_stats.py)
+            for candidate, results in verification_evidence.items():
+                if canonical_pest_name(candidate, crop) == final_pest:
+                    record_citations(VERIFICATION_POLICY.name, VERIFICATION_DOMAINS, results, [final_pest])
             
         print(f"   ✅ Final Decision: {final_pest} (Confidence: {confidence:.2f})")
 
@@ -146,6 +208,8 @@ Identify the SINGLE most likely pest.
             "confirmed_pest": final_pest,
             "confidence_score": confidence,
             "decision_reasoning": reasoning,
+            "verification_evidence": verification_evidence,
+            "degradations": degradations,
             "error": None
         }
 
@@ -160,5 +224,7 @@ Identify the SINGLE most likely pest.
             "confirmed_pest": fallback_pest,
             "confidence_score": 0.1,
             "decision_reasoning": f"System error during verification ({str(e)}). Defaulting to visual diagnosis: {fallback_pest}.",
+            "verification_evidence": verification_evidence,
+            "degradations": degradations,
             "error": str(e)
         }
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+Canonical pest names.
+
+The vision model returns free-form names ("Aphid", "aphids (Aphis gossypii)",
+"FAW"). Before they reach search queries, caches or the treatment lookup they
+are mapped onto the entries of pests.json (canonical name, scientific names,
+synonyms, crops) by `canonical_pest_name()`:
+
+1. exact match of a normalized alias (also tried on the text inside / outside brackets)
+2. an alias whose tokens are all contained in the name ("fall armyworm larvae");
+   a single-word alias only when the rest of the name is descriptive
+   ("aphid infestation", but not "termite mound")
+3. fuzzy match: trigram index -> Levenshtein similarity on the best candidates
+
+When an alias is shared by several pests ("stem borer"), the one recorded for
+the crop wins. Names that match nothing are returned unchanged (stripped).
+
+Usage:
+    python pest_lexicon.py "aphids (Aphis gossypii)" "Fall army worm" --crop maize
+"""
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from reference_data import REFERENCE_DATA
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PEST_LEXICON_PATH = os.path.join(BASE_DIR, "pests.json")
+
+# Fuzzy matches below this similarity are ignored
+MIN_FUZZY_SCORE = 0.82
+# Fuzzy candidates (best trigram Dice overlap) that get the full edit-distance comparison
+FUZZY_CANDIDATES = 5
+# Words (normalized) that describe a pest without naming it; a single-word alias may be
+# contained in a name only together with these
+DESCRIPTIVE_TOKENS = {
+    "larva", "larvae", "nymph", "adult", "egg", "pupa", "colony", "infestation", "damage",
+    "attack", "symptom", "pest", "insect", "disease", "on", "of", "in", "the", "leaf", "leave", "plant",
+}
+
+
+class PestMatch(NamedTuple):
+    name: str
+    scientific_name: Optional[str]
+    score: float
+    alias: str
+
+
+def _singular(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def normalize(text: str) -> str:
+    """Lower-case, punctuation-free, singular tokens: 'Fruit Flies (B. dorsalis)' -> 'fruit fly b dorsali'."""
+    tokens = re.findall(r"[a-z0-9]+", (text or "").lower())
+    return " ".join(_singular(token) for token in tokens)
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: str, b: str) -> float:
+    """1 - normalized Levenshtein distance."""
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return 1.0 - previous[-1] / max(len(a), len(b))
+
+
+class PestLexicon:
+    def __init__(self, entries: List[Dict]):
+        self.entries = entries
+        self.crops = [{normalize(c) for c in entry.get("crops", [])} for entry in entries]
+        # normalized alias -> entry indexes (an alias may belong to several pests)
+        self.aliases: Dict[str, List[int]] = {}
+        for index, entry in enumerate(entries):
+            for alias in [entry["name"], *entry.get("scientific_names", []), *entry.get("synonyms", [])]:
+                key = normalize(alias)
+                if key and index not in self.aliases.setdefault(key, []):
+                    self.aliases[key].append(index)
+        # token -> aliases containing it (containment matches), trigram -> aliases (fuzzy matches)
+        self.token_index: Dict[str, Set[str]] = {}
+        self.trigram_index: Dict[str, Set[str]] = {}
+        self.trigram_counts: Dict[str, int] = {}
+        for key in self.aliases:
+            for token in key.split():
+                self.token_index.setdefault(token, set()).add(key)
+            self.trigram_counts[key] = len(_trigrams(key))
+            for gram in _trigrams(key):
+                self.trigram_index.setdefault(gram, set()).add(key)
+
+    @classmethod
+    def from_file(cls, path: str = PEST_LEXICON_PATH) -> "PestLexicon":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["pests"])
+
+    def _pick(self, indexes: List[int], crop: Optional[str]) -> int:
+        if crop:
+            crop_key = normalize(crop)
+            for index in indexes:
+                if crop_key in self.crops[index]:
+                    return index
+        return indexes[0]
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, float]]:
+        """Best (alias, score) for one normalized name."""
+        if key in self.aliases:
+            return key, 1.0
+
+        tokens = set(key.split())
+        naming = tokens - DESCRIPTIVE_TOKENS
+        sharing = set().union(*(self.token_index.get(token, ()) for token in tokens))
+        contained = [alias for alias in sharing if set(alias.split()) <= tokens and len(alias) >= 4
+                     and (" " in alias or {alias} == naming)]
+        if contained:
+            alias = max(contained, key=len)
+            return alias, 0.85 + 0.15 * len(alias.split()) / len(tokens)
+
+        grams = _trigrams(key)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for alias in self.trigram_index.get(gram, ()):
+                shared[alias] = shared.get(alias, 0) + 1
+        dice = {alias: 2 * n / (len(grams) + self.trigram_counts[alias]) for alias, n in shared.items()}
+        # The length ratio bounds the Levenshtein similarity, so hopeless candidates are skipped
+        candidates = [alias for alias in sorted(dice, key=dice.get, reverse=True)[:FUZZY_CANDIDATES]
+                      if min(len(alias), len(key)) / max(len(alias), len(key)) >= MIN_FUZZY_SCORE]
+        scored = [(alias, similarity(key, alias)) for alias in candidates]
+        best = max(scored, key=lambda item: item[1], default=None)
+        return best if best and best[1] >= MIN_FUZZY_SCORE else None
+
+    def match(self, raw_name: str, crop: Optional[str] = None) -> Optional[PestMatch]:
+        # "Aphids (Aphis gossypii)": try the whole name, then the parts outside / inside brackets
+        parts = [raw_name, re.sub(r"\(.*?\)", " ", raw_name), *re.findall(r"\((.*?)\)", raw_name)]
+        best = None
+        for part in parts:
+            key = normalize(part)
+            if not key:
+                continue
+            found = self._lookup(key)
+            if found and (best is None or found[1] > best[1]):
+                best = found
+            if best and best[1] == 1.0:
+                break
+        if best is None:
+            return None
+
+        alias, score = best
+        entry = self.entries[self._pick(self.aliases[alias], crop)]
+        scientific = (entry.get("scientific_names") or [None])[0]
+        return PestMatch(entry["name"], scientific, round(score, 3), alias)
+
+
+REFERENCE_DATA.register("pests", PEST_LEXICON_PATH, PestLexicon.from_file)
+
+
+def get_pest_lexicon() -> PestLexicon:
+    """Current lexicon (indexes built on first use, rebuilt when pests.json changes)."""
+    return REFERENCE_DATA.get("pests")
+
+
+@lru_cache(maxsize=4096)
+def canonical_pest_name(raw_name: str, crop: Optional[str] = None) -> str:
+    """Canonical lexicon name for a free-form pest name (unchanged if nothing matches)."""
+    name = (raw_name or "").strip()
+    if not name:
+        return name
+    found = get_pest_lexicon().match(name, crop)
+    if found is None:
+        return name
+    if found.name != name:
+        print(f"   🏷️ Pest name '{name}' -> '{found.name}' ({found.score:.2f})")
+    return found.name
+
+
+# Cached name mappings were computed from the previous lexicon
+REFERENCE_DATA.on_change("pests", canonical_pest_name.cache_clear)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Canonicalize pest names")
+    parser.add_argument("names", nargs="+")
+    parser.add_argument("--crop")
+    args = parser.parse_args()
+    for raw in args.names:
+        print(f"{raw!r:45} -> {get_pest_lexicon().match(raw, args.crop)}")
@@ -1,12 +1,28 @@
-from typing import Dict, List, Any
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import Dict, List, Any, Literal, Optional
 from pydantic import BaseModel, Field
-from search import search_web, format_search_results
+from cascade import run_cascade
+from search import format_search_results
+from retrieval_policy import adaptive_search, in_domains, PESTICIDE_POLICY
 from constants import PESTICIDE_DOMAINS
+from pest_lexicon import canonical_pest_name
+from domain_stats import record_citations
+from deadline import fits, remaining
+from speculative import SPECULATIVE_LOOKUPS
+from prompt_cache import prompt_messages, static_prefix
+from result_cache import cache_key, cached_result, store_result, version_hash
+
+MODEL_NAME = "gemini-2.5-flash-lite"
+VALID_CATEGORIES = ("Biological/Natural", "Synthetic")
+
+# Sentences mentioning dosage / formulation / bio-control are what the extraction needs
+TREATMENT_FOCUS_TERMS = ["dose", "dosage", "ml", "litre", "g", "kg", "ha", "acre", "spray",
+                         "SC", "EC", "WP", "WG", "SL", "GR", "ppm", "neem", "bio", "trap"]
+EVIDENCE_CHARS_PER_RESULT = 500
+EVIDENCE_CHARS_TOTAL = 2400
 
 class PesticideInfo(BaseModel):
     chemical_name: str = Field(description="Active ingredient and formulation (e.g., 'Neem Oil 10000 ppm' or 'Chlorantraniliprole 18.5% SC').")
-    category: str = Field(description="Must be strictly categorized as 'Biological/Natural' or 'Synthetic'.")
+    category: Literal["Biological/Natural", "Synthetic"] = Field(description="Must be strictly categorized as 'Biological/Natural' or 'Synthetic'.")
     brand_name: str = Field(description="Common trade name if mentioned (e.g., 'Coragen'), else 'Generic'.")
     dosage: str = Field(description="Exact precision application rate (e.g., '2ml/Litre'). If not explicitly found, output 'Standard baseline: Consult local dealer'.")
     safety_period: str = Field(description="Waiting period (PHI) in days if available, else 'Follow label'.")
@@ -17,29 +33,7 @@ class PesticideResponse(BaseModel):
     natural_options_status: str = Field(description="Status message: e.g., 'Both Biological and Synthetic options found', or 'Only Synthetic options available for this pest.'")
     disclaimer: str = Field(description="Safety disclaimer (e.g., 'Wear protective gear').")
 
-def pesticide_finder_node(state: Dict) -> Dict:
-    print("\n--- [Node C] Pesticide Finder: Searching IPM & Approved Chemicals ---")
-    
-    confirmed_pest = state.get("confirmed_pest")
-    crop = state.get("crop")
-    
-    if not confirmed_pest:
-        print("   -> No pest confirmed. Skipping pesticide search.")
-        return {
-            "recommended_pesticides": [],
-            "error": "No pest identified to treat."
-        }
-
-    # Broad query to catch sustainable and chemical options simultaneously
-    query = f"Integrated Pest Management and chemical control for {confirmed_pest} in {crop} India"
-    
-    results = search_web(query, domains=PESTICIDE_DOMAINS, max_results=6)
-    evidence = format_search_results(results)
-
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0)
-    structured_llm = llm.with_structured_output(PesticideResponse)
-    
-    SYSTEM_PROMPT = """
+SYSTEM_PROMPT = """
 <Role>
 You are an expert Agricultural Sustainability Officer and Compliance Expert in India. 
 Your mandate is to extract a comprehensive set of crop treatments—capturing BOTH organic/biological methods and synthetic chemical methods—to allow for environmental impact comparisons.
@@ -75,6 +69,93 @@ Scan the Search Evidence for the following specific details:
 Based *strictly* on the provided Search Evidence, generate a structured list of treatments.
 </Task>
 """
+
+PROMPT_PREFIX = static_prefix("pesticide_finder", SYSTEM_PROMPT)
+
+# Cached extractions are only valid for the prompt and schema that produced them
+TREATMENT_CACHE_VERSION = version_hash(SYSTEM_PROMPT, PesticideResponse.schema())
+
+def validate_recommendations(response: PesticideResponse) -> Optional[str]:
+    """Cascade check: at least one recommendation, each with a valid category."""
+    if not response.recommendations:
+        return "no recommendations"
+    invalid = [item.category for item in response.recommendations if item.category not in VALID_CATEGORIES]
+    if invalid:
+        return f"invalid category {invalid[0]!r}"
+    return None
+
+def release_speculation(state: Dict) -> None:
+    """Memo hit (see graph.py): the speculative lookup for this run is not needed."""
+    if state.get("speculation_id"):
+        SPECULATIVE_LOOKUPS.cancel(state["speculation_id"])
+
+def carried_evidence(state: Dict) -> List[Dict]:
+    """
+    The verification results pest_detector found for the confirmed pest, limited to
+    the treatment sources (PESTICIDE_DOMAINS) this node would have searched itself.
+    """
+    pest, crop = state.get("confirmed_pest"), state.get("crop")
+    for candidate, results in (state.get("verification_evidence") or {}).items():
+        if candidate == pest or canonical_pest_name(candidate, crop) == pest:
+            return [res for res in results if in_domains(res.get("url", ""), PESTICIDE_DOMAINS)]
+    return []
+
+def pesticide_finder_node(state: Dict) -> Dict:
+    print("\n--- [Node C] Pesticide Finder: Searching IPM & Approved Chemicals ---")
+    
+    confirmed_pest = state.get("confirmed_pest")
+    crop = state.get("crop")
+    
+    # A lookup for the top visual candidate may already be running (see speculative.py)
+    if state.get("speculation_id"):
+        left = remaining(state)
+        hit, result = SPECULATIVE_LOOKUPS.claim(state["speculation_id"], confirmed_pest,
+                                                timeout=None if left == float("inf") else max(left, 1.0))
+        if hit:
+            return result
+
+    if not confirmed_pest:
+        print("   -> No pest confirmed. Skipping pesticide search.")
+        return {
+            "recommended_pesticides": [],
+            "error": "No pest identified to treat."
+        }
+
+    # Extractions depend only on pest and crop; popular ones are pre-computed by season_warmup.py
+    treatment_key = cache_key(TREATMENT_CACHE_VERSION, confirmed_pest, crop)
+    cached = cached_result("treatments", treatment_key)
+    if cached is not None:
+        print(f"   🗃️ Treatments for '{confirmed_pest}' on {crop} served from the result cache.")
+        return {"recommended_pesticides": cached, "error": None}
+
+    if not fits(state, "pesticide_finder", MODEL_NAME):
+        print("   ⏱️ Time budget exhausted. Skipping treatment extraction.")
+        return {
+            "recommended_pesticides": [],
+            "degradations": ["pesticide_finder: skipped treatment lookup (response-time budget)"],
+            "error": None
+        }
+
+    degradations = []
+    # Without time for a network search, answer from the locally cached evidence corpus
+    offline = not fits(state, "pesticide_finder", "search", MODEL_NAME)
+    if offline:
+        print("   ⏱️ Time budget low. Using local evidence corpus only.")
+        degradations.append("pesticide_finder: used cached local evidence instead of a web search")
+
+    # Broad query to catch sustainable and chemical options simultaneously
+    query = f"Integrated Pest Management and chemical control for {confirmed_pest} in {crop} India"
+    
+    # Verification results that already carry dosages and formulations make the search unnecessary;
+    # otherwise one search fetches 6 results and the prompt gets 3, or all 6 if those details are missing
+    prior = carried_evidence(state)
+    if prior:
+        print(f"   -> Reusing {len(prior)} verification result(s) for '{confirmed_pest}'.")
+    results = adaptive_search(query, PESTICIDE_POLICY, domains=PESTICIDE_DOMAINS, offline=offline, prior=prior)
+    evidence = format_search_results(
+        results, query=query, focus_terms=[confirmed_pest, crop, *TREATMENT_FOCUS_TERMS],
+        per_result_chars=EVIDENCE_CHARS_PER_RESULT, total_chars=EVIDENCE_CHARS_TOTAL
+    )
     
     user_message = f"""
     Context:
@@ -88,18 +169,25 @@ Based *strictly* on the provided Search Evidence, generate a structured list of
     """
 
     try:
-        response: PesticideResponse = structured_llm.invoke([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_message}
-        ])
+        response, notes = run_cascade(state, "pesticide_finder", PesticideResponse,
+                                      prompt_messages(PROMPT_PREFIX, user_message),
+                                      validate=validate_recommendations)
+        degradations += notes
         
         detailed_info = [item.dict() for item in response.recommendations]
         
         print(f"   ✅ Found {len(detailed_info)} options.")
+        # Sources naming a recommended active ingredient count towards their domain's yield
+        record_citations(PESTICIDE_POLICY.name, PESTICIDE_DOMAINS, results,
+                         [item.chemical_name.split()[0] for item in response.recommendations if item.chemical_name])
         print(f"   🌱 Status: {response.natural_options_status}")
+        # Degraded answers (local evidence only, no time to escalate) are not worth keeping
+        if not degradations:
+            store_result("treatments", treatment_key, detailed_info)
 
         return {
             "recommended_pesticides": detailed_info, 
+            "degradations": degradations,
             "error": None
         }
 
@@ -107,6 +195,7 @@ Based *strictly* on the provided Search Evidence, generate a structured list of
         print(f"   ❌ Error in Pesticide Finder: {e}")
         return {
             "recommended_pesticides": [], 
+            "degradations": degradations,
             "error": str(e)
         }
 
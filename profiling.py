@@ -0,0 +1,186 @@
+"""
+Opt-in profiling of a single graph invocation.
+
+Enable with AGRI_PROFILE=1 (every run) or per request (`"profile": true` on
+POST /diagnose). A profiled run records per node the wall time, CPU time
+(thread_time) and tracemalloc allocations, runs cProfile around every node and
+writes to AGRI_PROFILE_DIR (default data/profiles):
+
+    <timestamp>-<label>.prof   cProfile stats of all nodes (open with pstats / snakeviz)
+    <timestamp>-<label>.txt    per-node table, top functions, top allocation sites
+
+When profiling is off the node hook is a single ContextVar lookup.
+
+Concurrency: profiled runs may overlap (AGRI_PROFILE=1 on a worker pool,
+several `"profile": true` requests). tracemalloc is process-wide, so:
+* it is started by the first profiled run and stopped only when the last one
+  ends (reference count); it is left alone if something else started it;
+* allocation figures of overlapping runs include each other's allocations
+  (and those of unprofiled requests), and per-node peaks are reset by
+  whichever node starts last - treat them as upper bounds;
+* cProfile, wall and CPU times are per thread and stay accurate.
+A profiling failure (snapshot, report file) is logged and never fails the run.
+"""
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.getenv("AGRI_PROFILE_DIR", os.path.join(BASE_DIR, "data", "profiles"))
+PROFILE_ALWAYS = os.getenv("AGRI_PROFILE", "0") == "1"
+
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 15
+TRACEMALLOC_FRAMES = 5
+
+
+class RunProfile:
+    """Collects node measurements of one invocation (nodes may run on worker threads)."""
+
+    def __init__(self, label: str):
+        self.label = re.sub(r"[^A-Za-z0-9_.-]", "_", label)[:60]
+        self.nodes: List[Dict[str, Any]] = []
+        self.stats: Optional[pstats.Stats] = None
+        self._lock = threading.Lock()
+
+    def add(self, node: str, profiler: cProfile.Profile, measures: Dict[str, Any]) -> None:
+        with self._lock:
+            self.nodes.append({"node": node, **measures})
+            if self.stats is None:
+                self.stats = pstats.Stats(profiler)
+            else:
+                self.stats.add(profiler)
+
+
+_active: contextvars.ContextVar[Optional[RunProfile]] = contextvars.ContextVar("agri_profile", default=None)
+
+
+def profiled(name: str, node):
+    """Node hook (applied at graph registration): measures the node only while a profiled run is active."""
+    def run(state):
+        profile = _active.get()
+        if profile is None:
+            return node(state)
+
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            mem_before = tracemalloc.get_traced_memory()[0]
+        profiler = cProfile.Profile()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        profiler.enable()
+        try:
+            return node(state)
+        finally:
+            profiler.disable()
+            measures = {"wall_s": time.perf_counter() - wall, "cpu_s": time.thread_time() - cpu}
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                measures.update(alloc_kb=(current - mem_before) / 1024, peak_kb=(peak - mem_before) / 1024)
+            profile.add(name, profiler, measures)
+    return run
+
+
+# Profiled runs currently using tracemalloc; the first one starts it, the last one stops it
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_owned = False
+
+
+def _acquire_tracing() -> None:
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        if _tracing_users == 0:
+            _tracing_owned = not tracemalloc.is_tracing()
+            if _tracing_owned:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracing_users += 1
+
+
+def _release_tracing() -> None:
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_owned:
+            tracemalloc.stop()
+
+
+def _snapshot() -> Optional[tracemalloc.Snapshot]:
+    try:
+        return tracemalloc.take_snapshot()
+    except Exception as e:
+        print(f"   ⚠️ Allocation snapshot failed: {e}")
+        return None
+
+
+def profiled_invoke(app, state: Dict[str, Any], label: str = "run") -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Runs `app.invoke(state)` with profiling. Returns (final state, summary incl. file paths)."""
+    profile = RunProfile(label)
+    _acquire_tracing()
+    try:
+        before = _snapshot()
+        token = _active.set(profile)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            final_state = app.invoke(state)
+        finally:
+            total = {"wall_s": time.perf_counter() - wall, "cpu_s": time.process_time() - cpu}
+            _active.reset(token)
+        after = _snapshot()
+    finally:
+        _release_tracing()
+
+    try:
+        allocations = after.compare_to(before, "lineno")[:TOP_ALLOCATIONS] if before and after else []
+        summary = write_profile(profile, total, allocations)
+    except Exception as e:
+        print(f"   ⚠️ Could not write the profile: {e}")
+        summary = {"total": {k: round(v, 3) for k, v in total.items()}, "error": str(e)}
+    return final_state, summary
+
+
+def write_profile(profile: RunProfile, total: Dict[str, float], allocations: List) -> Dict[str, Any]:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{profile.label}")
+
+    lines = [f"Profile '{profile.label}': wall {total['wall_s']:.3f}s, process CPU {total['cpu_s']:.3f}s", "",
+             f"{'node':<26}{'wall s':>9}{'cpu s':>9}{'alloc KiB':>12}{'peak KiB':>12}"]
+    for entry in profile.nodes:
+        lines.append(f"{entry['node']:<26}{entry['wall_s']:>9.3f}{entry['cpu_s']:>9.3f}"
+                     f"{entry.get('alloc_kb', 0):>12.1f}{entry.get('peak_kb', 0):>12.1f}")
+
+    if profile.stats is not None:
+        profile.stats.dump_stats(stem + ".prof")
+        buffer = io.StringIO()
+        profile.stats.stream = buffer
+        profile.stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        lines += ["", f"--- Top {TOP_FUNCTIONS} functions (cumulative) ---", buffer.getvalue().strip()]
+
+    lines += ["", f"--- Top {TOP_ALLOCATIONS} allocation sites (net) ---"]
+    lines += [str(stat) for stat in allocations]
+    with open(stem + ".txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    print(f"   🔬 Profile written to {stem}.txt")
+    return {
+        "total": {k: round(v, 3) for k, v in total.items()},
+        "nodes": [{k: round(v, 3) if isinstance(v, float) else v for k, v in entry.items()} for entry in profile.nodes],
+        "summary_path": stem + ".txt",
+        "stats_path": stem + ".prof" if profile.stats is not None else None,
+    }
+
+
+def invoke_graph(app, state: Dict[str, Any], profile: bool = False, label: str = "run") -> Dict[str, Any]:
+    """`app.invoke(state)`, profiled when requested or AGRI_PROFILE=1 (the summary goes to `state['profile']`)."""
+    if not (profile or PROFILE_ALWAYS):
+        return app.invoke(state)
+    final_state, summary = profiled_invoke(app, state, label)
+    return {**final_state, "profile": summary}
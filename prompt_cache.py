@@ -0,0 +1,211 @@
+"""
+Static prompt prefixes and provider-side context caching.
+
+Every text node sends a large constant system prompt (the subsidy node also the
+central scheme list) followed by a small per-request part. Nodes declare the
+static part once with `static_prefix(node, text)` and build their messages with
+`prompt_messages(prefix, user_content)`; the static text always comes first and
+byte-identical, so providers that cache prefixes implicitly can reuse it.
+
+When a prefix is large enough for the model's explicit cache, `run_cascade`
+uploads it once per process and model (`clients.create_context_cache`) and then
+sends only the per-request messages together with the cache handle. Handles are
+renewed before they expire; when the provider rejects one, the call is repeated
+with the full prompt and the prefix is not retried for CONTEXT_CACHE_RETRY_S.
+
+PROMPT_CACHE_STATS reports per node the input tokens sent, the prefix tokens
+served from a cache and the latency difference between cached and full calls.
+
+Set AGRI_CONTEXT_CACHE=0 to always send the full prompt.
+
+Usage:
+    python prompt_cache.py --calls 20   # offline measurement with the local stand-in model
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+CONTEXT_CACHE_ENABLED = os.getenv("AGRI_CONTEXT_CACHE", "1") != "0"
+CONTEXT_CACHE_TTL_S = float(os.getenv("AGRI_CONTEXT_CACHE_TTL_S", "3600"))
+# Renew a handle this long before it expires, so no request races the expiry
+CONTEXT_CACHE_RENEW_S = 120.0
+# After a failed upload / rejected handle, send full prompts for this long
+CONTEXT_CACHE_RETRY_S = 600.0
+
+# Smallest prefix the provider accepts as cached content
+MIN_CACHE_TOKENS = {
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-flash-lite": 1024,
+    "gemini-2.5-pro": 4096,
+}
+DEFAULT_MIN_CACHE_TOKENS = 4096
+CHARS_PER_TOKEN = 4
+
+
+class PromptPrefix(NamedTuple):
+    node: str
+    text: str
+    digest: str
+    tokens_est: int
+
+
+_prefixes: Dict[str, PromptPrefix] = {}
+_prefixes_lock = threading.Lock()
+
+
+def static_prefix(node: str, text: str) -> PromptPrefix:
+    """Registers (once per distinct text) the static part of a node's prompt."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    prefix = _prefixes.get(digest)
+    if prefix is None:
+        with _prefixes_lock:
+            prefix = _prefixes.setdefault(digest, PromptPrefix(node, text, digest, len(text) // CHARS_PER_TOKEN))
+    return prefix
+
+
+def prompt_messages(prefix: PromptPrefix, user_content: str) -> List[Dict[str, str]]:
+    """Messages with the static prefix as the (first) system message."""
+    return [{"role": "system", "content": prefix.text}, {"role": "user", "content": user_content}]
+
+
+def find_prefix(messages: List[Dict[str, Any]]) -> Optional[PromptPrefix]:
+    """The registered prefix the messages start with, if any."""
+    if not messages or messages[0].get("role") != "system":
+        return None
+    text = messages[0].get("content")
+    if not isinstance(text, str):
+        return None
+    return _prefixes.get(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16])
+
+
+# ---------------------------------------------------------
+# PROVIDER-SIDE CACHE HANDLES
+# ---------------------------------------------------------
+class ContextCaches:
+    def __init__(self, enabled: bool = CONTEXT_CACHE_ENABLED, ttl_s: float = CONTEXT_CACHE_TTL_S):
+        self.enabled = enabled
+        self.ttl_s = ttl_s
+        # (model, digest) -> (handle, expires_at); a None handle marks a failure until expires_at
+        self._handles: Dict[Tuple[str, str], Tuple[Optional[str], float]] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def cacheable(self, model: str, prefix: PromptPrefix) -> bool:
+        return self.enabled and prefix.tokens_est >= MIN_CACHE_TOKENS.get(model, DEFAULT_MIN_CACHE_TOKENS)
+
+    def handle(self, model: str, prefix: PromptPrefix) -> Optional[str]:
+        """Cache handle for the prefix on this model, uploading it on first use (None = send the full prompt)."""
+        if not self.cacheable(model, prefix):
+            return None
+        key = (model, prefix.digest)
+        with self._lock:
+            handle, expires_at = self._handles.get(key, (None, 0.0))
+            if handle is None and expires_at > time.time():
+                return None
+            if handle is not None and expires_at - CONTEXT_CACHE_RENEW_S > time.time():
+                return handle
+            # Concurrent requests send the full prompt until the upload finishes
+            self._handles[key] = (None, time.time() + CONTEXT_CACHE_RETRY_S)
+
+        from clients import create_context_cache
+        try:
+            handle = create_context_cache(model, prefix.text, self.ttl_s)
+        except Exception as e:
+            print(f"   ⚠️ Context cache for {prefix.node} on {model} not created: {e}")
+            return None
+        with self._lock:
+            self._handles[key] = (handle, time.time() + self.ttl_s)
+            self.created += 1
+        print(f"   🧊 Cached {prefix.node} prompt prefix on {model} (~{prefix.tokens_est} tokens): {handle}")
+        return handle
+
+    def reject(self, model: str, prefix: PromptPrefix) -> None:
+        """The provider refused the handle (evicted, expired early): full prompts for a while."""
+        with self._lock:
+            self._handles[(model, prefix.digest)] = (None, time.time() + CONTEXT_CACHE_RETRY_S)
+
+
+CONTEXT_CACHES = ContextCaches()
+
+
+# ---------------------------------------------------------
+# MEASUREMENTS
+# ---------------------------------------------------------
+class PromptCacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_node: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, node: str, input_tokens: int, cached_tokens: int, seconds: float) -> None:
+        with self._lock:
+            entry = self.by_node.setdefault(node, {"calls": 0, "cached_calls": 0, "input_tokens": 0,
+                                                   "cached_tokens": 0, "cached_s": 0.0, "full_s": 0.0})
+            entry["calls"] += 1
+            entry["input_tokens"] += input_tokens
+            entry["cached_tokens"] += cached_tokens
+            if cached_tokens:
+                entry["cached_calls"] += 1
+                entry["cached_s"] += seconds
+            else:
+                entry["full_s"] += seconds
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """Token estimates per node; the latency saving compares mean cached vs full-prompt calls."""
+        report = {}
+        with self._lock:
+            for node, entry in self.by_node.items():
+                full_calls = entry["calls"] - entry["cached_calls"]
+                mean_cached = entry["cached_s"] / entry["cached_calls"] if entry["cached_calls"] else None
+                mean_full = entry["full_s"] / full_calls if full_calls else None
+                saved = (mean_full - mean_cached) * entry["cached_calls"] if mean_cached is not None and mean_full is not None else None
+                report[node] = {
+                    "calls": entry["calls"],
+                    "cached_calls": entry["cached_calls"],
+                    "input_tokens_est": entry["input_tokens"],
+                    "prefix_tokens_from_cache_est": entry["cached_tokens"],
+                    "mean_s_cached": round(mean_cached, 3) if mean_cached is not None else None,
+                    "mean_s_full": round(mean_full, 3) if mean_full is not None else None,
+                    "latency_saved_s_est": round(saved, 2) if saved is not None else None,
+                }
+        return report
+
+
+PROMPT_CACHE_STATS = PromptCacheStats()
+
+
+def message_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(str(m.get("content", ""))) for m in messages) // CHARS_PER_TOKEN
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Measure prompt-prefix caching offline (local stand-in model)")
+    parser.add_argument("--calls", type=int, default=20, help="Calls per node with and without the cache")
+    args = parser.parse_args()
+
+    import clients
+    clients.LLM_BACKEND = "local"
+    from cascade import run_cascade
+    from prompt_cache import CONTEXT_CACHES as caches, PROMPT_CACHE_STATS as stats
+    import pest_detector, pesticide_finder, subsidy_finder, sustainability_analyzer
+
+    sample_user = "Location: Punjab\nMonth: October\nCrop: Rice\n" + "Evidence sentence about the pest. " * 40
+    nodes = [
+        ("pest_detector", pest_detector.PestConclusion, pest_detector.PROMPT_PREFIX),
+        ("pesticide_finder", pesticide_finder.PesticideResponse, pesticide_finder.PROMPT_PREFIX),
+        ("sustainability_analyzer", sustainability_analyzer.SustainabilityReport, sustainability_analyzer.PROMPT_PREFIX),
+        ("subsidy_finder", subsidy_finder.SubsidyResponse, subsidy_finder.subsidy_prompt_prefix()),
+    ]
+    for enabled in (False, True):
+        caches.enabled = enabled
+        for node, schema, prefix in nodes:
+            for _ in range(args.calls):
+                run_cascade({}, node, schema, prompt_messages(prefix, sample_user), validate=lambda r: None)
+    for node, schema, prefix in nodes:
+        cacheable = {model: caches.cacheable(model, prefix) for model in MIN_CACHE_TOKENS}
+        print(f"{node}: prefix ~{prefix.tokens_est} tokens, explicitly cacheable on {[m for m, ok in cacheable.items() if ok]}")
+    print(json.dumps(stats.report(), indent=2))
@@ -0,0 +1,158 @@
+"""
+Hot-reloadable reference data (schemes.json, pests.json, state_domains.json).
+
+Each file is registered with a loader that parses *and validates* it into the
+in-memory structure the code uses (dicts, indexes, ...). `get(name)` returns
+the current structure; when the file changes on disk (watchdog) it is rebuilt
+off to the side and swapped in atomically, then only the derived caches
+registered for that file are invalidated. A broken edit is logged and the
+previous version stays live.
+
+Set AGRI_HOT_RELOAD=0 to disable the watcher.
+
+Usage:
+    python reference_data.py   # load and validate every reference file
+"""
+import hashlib
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+HOT_RELOAD = os.getenv("AGRI_HOT_RELOAD", "1") != "0"
+# Editors write a file in several steps; reload once it has been quiet this long
+RELOAD_DEBOUNCE_S = 0.5
+
+
+class ReferenceFile:
+    def __init__(self, name: str, path: str, loader: Callable[[str], Any]):
+        self.name = name
+        self.path = os.path.abspath(path)
+        self.loader = loader
+        self.invalidators: List[Callable[[], None]] = []
+        self.value: Any = None
+        self.digest: Optional[str] = None
+        self.version = 0
+
+
+class ReferenceRegistry:
+    def __init__(self):
+        self._files: Dict[str, ReferenceFile] = {}
+        self._lock = threading.Lock()
+        self._timers: Dict[str, threading.Timer] = {}
+        self._observer = None
+
+    def register(self, name: str, path: str, loader: Callable[[str], Any]) -> None:
+        """Registers a reference file; `loader(path)` must return the parsed structure or raise if invalid."""
+        with self._lock:
+            if name not in self._files:
+                self._files[name] = ReferenceFile(name, path, loader)
+
+    def on_change(self, name: str, invalidator: Callable[[], None]) -> None:
+        """Calls `invalidator()` after every successful reload of `name` (e.g. a derived cache's clear)."""
+        self._files[name].invalidators.append(invalidator)
+
+    def get(self, name: str) -> Any:
+        entry = self._files[name]
+        if entry.value is None:
+            with self._lock:
+                if entry.value is None:
+                    self._load(entry)
+        return entry.value
+
+    def names(self) -> List[str]:
+        return sorted(self._files)
+
+    def version(self, name: str) -> int:
+        return self._files[name].version
+
+    def digest(self, name: str) -> str:
+        """Content hash of the live version (the same in every process reading the same file)."""
+        self.get(name)
+        return self._files[name].digest
+
+    def _load(self, entry: ReferenceFile) -> bool:
+        with open(entry.path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if digest == entry.digest:
+            return False
+        value = entry.loader(entry.path)   # raises on invalid data; the old value stays live
+        entry.value, entry.digest = value, digest
+        entry.version += 1
+        return True
+
+    def reload(self, name: str) -> bool:
+        """Re-reads `name` if its content changed. Returns True when a new version was swapped in."""
+        entry = self._files[name]
+        try:
+            with self._lock:
+                changed = self._load(entry)
+        except Exception as e:
+            print(f"   ⚠️ Reference file '{entry.name}' not reloaded (keeping version {entry.version}): {e}")
+            return False
+        if changed:
+            for invalidate in entry.invalidators:
+                invalidate()
+            print(f"   🔄 Reloaded '{entry.name}' (version {entry.version}).")
+        return changed
+
+    # --- FILE WATCHER ---
+    def _schedule_reload(self, path: str) -> None:
+        path = os.path.abspath(path)
+        for entry in list(self._files.values()):
+            if entry.path == path and entry.value is not None:
+                timer = self._timers.pop(entry.name, None)
+                if timer:
+                    timer.cancel()
+                timer = threading.Timer(RELOAD_DEBOUNCE_S, self.reload, args=(entry.name,))
+                timer.daemon = True
+                self._timers[entry.name] = timer
+                timer.start()
+
+    def start_watcher(self) -> None:
+        """Starts (once per process) a watchdog observer on the directories of the registered files."""
+        if not HOT_RELOAD or self._observer is not None:
+            return
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        registry = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # Ignore reads (opened / closed_no_write), including the reload's own
+                if event.is_directory or event.event_type not in ("created", "modified", "moved", "closed"):
+                    return
+                # Atomic saves (write temp file + rename) show up as a move onto the target
+                for path in (event.src_path, getattr(event, "dest_path", None)):
+                    if path:
+                        registry._schedule_reload(path)
+
+        with self._lock:
+            if self._observer is not None:
+                return
+            observer = Observer()
+            for directory in {os.path.dirname(entry.path) for entry in self._files.values()}:
+                observer.schedule(Handler(), directory, recursive=False)
+            observer.daemon = True
+            observer.start()
+            self._observer = observer
+        print(f"   👀 Watching reference data: {', '.join(self.names())}")
+
+
+REFERENCE_DATA = ReferenceRegistry()
+
+
+def start_reference_watcher() -> None:
+    """Registers every reference file (by importing its owner) and starts the watcher."""
+    import constants, pest_lexicon, subsidy_finder  # noqa: F401  (register on import)
+    REFERENCE_DATA.start_watcher()
+
+
+if __name__ == "__main__":
+    import constants, pest_lexicon, subsidy_finder  # noqa: F401
+    # The owners registered with the imported module, not with this __main__ copy
+    from reference_data import REFERENCE_DATA as registry
+
+    for name in registry.names():
+        registry.get(name)
+        print(f"{name}: ok (version {registry.version(name)})")
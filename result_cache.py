@@ -0,0 +1,166 @@
+"""
+Persistent cache of node results (SQLite, shared by every process on the host).
+
+Expensive, slowly-changing answers are stored here so that a request, a worker
+process or the season warm-up job (season_warmup.py) can reuse them:
+
+    treatments   pesticide_finder extraction per (pest, crop)
+    eco          per-chemical sustainability assessments (behind the in-memory LRU)
+    subsidies    explained subsidy schemes per state
+
+Keys include a version hash of the prompt / schema / input data that produced
+the value, so a changed prompt or schemes.json never serves stale answers.
+Entries expire after AGRI_RESULT_CACHE_TTL_DAYS (default 14). Set
+AGRI_RESULT_CACHE=0 to disable, AGRI_RESULT_CACHE_DB to move the file.
+
+Usage:
+    python result_cache.py            # entries per namespace
+    python result_cache.py --purge    # delete expired entries
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULT_CACHE_DB = os.getenv("AGRI_RESULT_CACHE_DB", os.path.join(BASE_DIR, "data", "results.sqlite3"))
+RESULT_CACHE_ENABLED = os.getenv("AGRI_RESULT_CACHE", "1") != "0"
+DEFAULT_TTL_S = float(os.getenv("AGRI_RESULT_CACHE_TTL_DAYS", "14")) * 86400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    namespace  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_results_expires ON results (expires_at);
+"""
+
+
+def version_hash(*parts: Any) -> str:
+    """Short stable hash of prompts / schemas / data (anything JSON-serializable)."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def cache_key(*parts: Any) -> str:
+    """Key from names that users spell inconsistently ('Rice ' and 'rice' are the same crop)."""
+    return "|".join(str(part).strip().lower() for part in parts)
+
+
+class ResultCache:
+    def __init__(self, path: str = DEFAULT_RESULT_CACHE_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection per thread: sqlite3 connections must not be shared across threads
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, namespace: str, outcome: str) -> None:
+        with self._lock:
+            entry = self.counts.setdefault(namespace, {"hits": 0, "misses": 0, "writes": 0})
+            entry[outcome] += 1
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT value FROM results WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, key, time.time()),
+        ).fetchone()
+        self._count(namespace, "hits" if row else "misses")
+        if row is None:
+            return None
+        return row[0] if isinstance(row[0], bytes) else json.loads(row[0])
+
+    def put(self, namespace: str, key: str, value: Any, ttl_s: float = DEFAULT_TTL_S) -> None:
+        """Stores `value` as JSON; bytes (e.g. a state.py blob) are stored and returned as they are."""
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO results (namespace, key, value, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, value if isinstance(value, bytes) else json.dumps(value), now, now + ttl_s),
+        )
+        self._count(namespace, "writes")
+
+    def contains(self, namespace: str, key: str) -> bool:
+        """Like get() but without counting a hit / miss (used by the warm-up planner)."""
+        return self._conn().execute(
+            "SELECT 1 FROM results WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, key, time.time()),
+        ).fetchone() is not None
+
+    def purge_expired(self) -> int:
+        return self._conn().execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Live entries per namespace plus this process's hit / miss counts."""
+        rows = self._conn().execute(
+            "SELECT namespace, COUNT(*) FROM results WHERE expires_at > ? GROUP BY namespace", (time.time(),)
+        ).fetchall()
+        with self._lock:
+            report = {ns: {"entries": 0, **counts} for ns, counts in self.counts.items()}
+        for namespace, entries in rows:
+            report.setdefault(namespace, {"hits": 0, "misses": 0, "writes": 0})["entries"] = entries
+        return report
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Process-wide cache at AGRI_RESULT_CACHE_DB, or None when disabled."""
+    global _cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
+
+
+def cached_result(namespace: str, key: str) -> Optional[Any]:
+    """get() that never raises: a broken cache must not break a diagnosis."""
+    cache = get_result_cache()
+    if cache is None:
+        return None
+    try:
+        return cache.get(namespace, key)
+    except Exception as e:
+        print(f"   ⚠️ Result cache unavailable: {e}")
+        return None
+
+
+def store_result(namespace: str, key: str, value: Any, ttl_s: float = DEFAULT_TTL_S) -> None:
+    cache = get_result_cache()
+    if cache is None:
+        return
+    try:
+        cache.put(namespace, key, value, ttl_s)
+    except Exception as e:
+        print(f"   ⚠️ Could not write to result cache: {e}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    cache = ResultCache()
+    if "--purge" in sys.argv[1:]:
+        print(f"Deleted {cache.purge_expired()} expired entries.")
+    for namespace, entry in sorted(cache.stats().items()):
+        print(f"{namespace:12} {entry['entries']:8d} entries")
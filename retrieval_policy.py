@@ -0,0 +1,143 @@
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Pattern, Sequence
+
+from evidence_store import domain_matches, domain_of
+from search import search_web
+
+# ---------------------------------------------------------
+# ADAPTIVE RETRIEVAL (start small, use more only when evidence is thin)
+# ---------------------------------------------------------
+# Verification needs evidence that mentions the crop and location; treatment
+# extraction needs dosage and formulation details. One search fetches up to the
+# policy maximum; the prompt gets the first `start` results and is widened step
+# by step (locally, without another request) only while those are missing.
+# Month names rarely appear in advisories, so they are not required. Results already in hand
+# (e.g. the verification evidence pest_detector found) count as evidence too:
+# when they cover everything, no search is issued at all.
+
+DOSAGE_PATTERN = re.compile(
+    r"\d+(?:\.\d+)?\s*(?:ml|g|gm|kg|l|litre|liter|lit)\s*(?:/|per)\s*(?:l|litre|liter|lit|acre|ha|hectare|tank)\b",
+    re.IGNORECASE,
+)
+FORMULATION_PATTERN = re.compile(
+    r"\d+(?:\.\d+)?\s*%\s*(?:SC|EC|WP|WG|WDG|SL|SP|GR|G|CS|OD|FS|DP)\b|\d+\s*ppm\b",
+    re.IGNORECASE,
+)
+# Rough prompt-token estimate used for the savings log
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class RetrievalPolicy:
+    name: str
+    start: int              # results used at first
+    step: int               # extra results per escalation
+    maximum: int            # results fetched by the one search (never more than baseline)
+    baseline: int           # the old fixed max_results (for savings accounting)
+    chars_per_result: int   # prompt characters one result costs (for token estimates)
+    required_patterns: Sequence[Pattern] = field(default_factory=list)
+
+
+VERIFICATION_POLICY = RetrievalPolicy("verification", start=1, step=1, maximum=2, baseline=2, chars_per_result=450)
+PESTICIDE_POLICY = RetrievalPolicy("pesticide", start=3, step=3, maximum=6, baseline=6, chars_per_result=500,
+                                   required_patterns=[DOSAGE_PATTERN, FORMULATION_PATTERN])
+
+
+def missing_evidence(results: List[Dict], required_terms: Sequence[str] = (),
+                     required_patterns: Sequence[Pattern] = ()) -> List[str]:
+    """Returns the required terms / patterns that none of the results mention."""
+    text = " ".join(res.get("content", "") for res in results).lower()
+    missing = [term for term in required_terms if term and term.lower() not in text]
+    missing += [pattern.pattern[:20] + "..." for pattern in required_patterns if not pattern.search(text)]
+    return missing
+
+
+def in_domains(url: str, domains: Sequence[str]) -> bool:
+    """True when the URL's host is one of `domains` or a subdomain of one."""
+    return bool(domains) and domain_matches(domain_of(url).lower(), list(domains))
+
+
+def merge_results(*groups: Sequence[Dict]) -> List[Dict]:
+    """Concatenates result lists, keeping the first result per URL."""
+    seen, merged = set(), []
+    for group in groups:
+        for res in group:
+            url = res.get("url") or id(res)
+            if url not in seen:
+                seen.add(url)
+                merged.append(res)
+    return merged
+
+
+class RetrievalStats:
+    """Process-wide counters of adaptive searches versus the fixed baseline."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_policy: Dict[str, Dict[str, int]] = {}
+
+    def record(self, policy: RetrievalPolicy, calls: int, results: int, reused: int = 0) -> Dict[str, int]:
+        # Reused evidence on top of a full search can exceed the baseline; that is not a saving
+        saved_results = max(policy.baseline - results, 0)
+        entry = {
+            "requests": 1,
+            "search_calls": calls,
+            "baseline_calls": 1,
+            "calls_saved": 1 - calls,
+            "searches_skipped": int(calls == 0),
+            "results": results,
+            "reused_results": reused,
+            "baseline_results": policy.baseline,
+            "tokens_saved_est": saved_results * policy.chars_per_result // CHARS_PER_TOKEN,
+        }
+        with self._lock:
+            totals = self.by_policy.setdefault(policy.name, dict.fromkeys(entry, 0))
+            for key, value in entry.items():
+                totals[key] += value
+        return entry
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {**totals, "calls_per_request": round(totals["search_calls"] / totals["requests"], 3)}
+                for name, totals in self.by_policy.items()
+            }
+
+
+RETRIEVAL_STATS = RetrievalStats()
+
+
+def adaptive_search(query: str, policy: RetrievalPolicy, domains: Optional[List[str]] = None,
+                    required_terms: Sequence[str] = (), widen: bool = True,
+                    offline: bool = False, prior: Sequence[Dict] = ()) -> List[Dict]:
+    """
+    One search for `policy.maximum` results, of which the first `policy.start` are used; more are
+    added `policy.step` at a time only while the evidence lacks a required term / pattern (no
+    further provider requests). Logs calls and savings vs baseline.
+    `widen=False` keeps the first `start` results; `offline=True` uses only the local corpus.
+    `prior` results are merged in front; if they already cover the required terms / patterns
+    they are returned without searching.
+    """
+    prior = list(prior)
+    if prior and not missing_evidence(prior, required_terms, policy.required_patterns):
+        print(f"    🔁 {len(prior)} earlier result(s) already cover the {policy.name} evidence; search skipped.")
+        calls, results = 0, prior
+    else:
+        maximum = min(policy.maximum, policy.baseline)
+        fetched = search_web(query, domains=domains, max_results=maximum, offline=offline, kind=policy.name)
+        calls = 1
+        used = policy.start
+        results = merge_results(prior, fetched[:used])
+        missing = missing_evidence(results, required_terms, policy.required_patterns)
+        while widen and missing and used < min(maximum, len(fetched)):
+            used = min(used + policy.step, maximum)
+            print(f"    ↗️ Evidence lacks {missing}; widening to {used} of the fetched results.")
+            results = merge_results(prior, fetched[:used])
+            missing = missing_evidence(results, required_terms, policy.required_patterns)
+
+    entry = RETRIEVAL_STATS.record(policy, calls, len(results), reused=len(prior))
+    print(f"    📉 Adaptive {policy.name} search: {calls}/1 call(s), {len(results)}/{policy.baseline} results "
+          f"({len(prior)} reused, ~{entry['tokens_saved_est']} prompt tokens saved vs fixed budget)")
+    return results
@@ -1,50 +1,65 @@
 import os
-from typing import List, Dict, Optional
-from langchain_community.tools.tavily_search import TavilySearchResults
+from typing import Iterable, List, Dict, Optional
+from snippets import build_query_terms, extract_relevant_snippets
+from search_backends import get_search_backend, get_search_tool, LocalIndexBackend, MAX_RAW_CONTENT_CHARS
+from domain_stats import record_search, select_domains
 
+# Prompts get query-aware extracts of the raw content (see format_search_results)
+SNIPPET_CHARS_PER_RESULT = 500
+SNIPPET_CHARS_PER_PROMPT = 2500
 
-def search_web(query: str, max_results: int = 3, domains: Optional[List[str]] = None) -> List[Dict]:
+
+def search_web(query: str, max_results: int = 3, domains: Optional[List[str]] = None,
+               offline: bool = False, kind: Optional[str] = None) -> List[Dict]:
     """
     Executes a web search optimized for LLM consumption.
+    Depending on AGRI_SEARCH_MODE the answer may come from the local evidence corpus.
     
     Args:
         query (str): The search string.
         max_results (int): How many sources to return.
         domains (List[str]): Optional list of domains to restrict search to (e.g., ["gov.in"]).
+        offline (bool): Answer from the local evidence corpus only (no network call).
+        kind (str): Query type (e.g. "pesticide"). With it, `domains` is narrowed to the ones
+            that pay off for this kind and the results feed the statistics (see domain_stats.py).
     
     Returns:
-        List[Dict]: A list of results containing 'url' and 'content'.
+        List[Dict]: A list of results containing 'url' and 'content' (untrimmed up to
+        MAX_RAW_CONTENT_CHARS; use format_search_results to build prompt text).
     """
     
-    if domains:
-        domain_str = " OR ".join([f"site:{d}" for d in domains])
-        final_query = f"{query} {domain_str}"
-    else:
-        final_query = query
-
-    print(f"    🔍 Searching: '{final_query}'")
-
+    # Routed to Tavily, the local evidence corpus or both (see search_backends.py)
     try:
-        
-        tool = TavilySearchResults(max_results=max_results)
-        
-        results = tool.invoke({"query": final_query})
-        
-        clean_results = []
-        for res in results:
-            clean_results.append({
-                "url": res.get("url"),
-                "content": res.get("content", "")[:500]
-            })
-            
-        return clean_results
+        backend = LocalIndexBackend() if offline else get_search_backend()
+        domains = select_domains(kind, domains)
+        results = backend.search(query, max_results, domains)
+        record_search(kind, domains, results)
+        return results
 
     except Exception as e:
         print(f"    ❌ Search Error: {e}")
         return []
 
-def format_search_results(results: List[Dict]) -> str:
-    """Helper to turn list of dicts into a single string for the Prompt."""
+def format_search_results(results: List[Dict], query: Optional[str] = None,
+                          focus_terms: Optional[Iterable[str]] = None,
+                          per_result_chars: int = SNIPPET_CHARS_PER_RESULT,
+                          total_chars: int = SNIPPET_CHARS_PER_PROMPT) -> str:
+    """
+    Helper to turn list of dicts into a single string for the Prompt.
+
+    With a `query` and/or `focus_terms` (pest, crop, location...), each result is cut down
+    to its most relevant sentences (BM25) within the per-result / per-prompt character
+    budgets, and near-duplicate passages across results are removed. Without them the
+    content is simply truncated to `per_result_chars`.
+    """
+    if not results:
+        return "No search results found."
+
+    query_terms = build_query_terms(query, focus_terms)
+    if query_terms:
+        results = extract_relevant_snippets(results, query_terms, per_result_chars, total_chars)
+    else:
+        results = [{**res, "content": res["content"][:per_result_chars]} for res in results]
     if not results:
         return "No search results found."
         
@@ -58,7 +73,7 @@ if __name__ == "__main__":
     # Test 1: General Search
     print("--- Test 1: General Search ---")
     res1 = search_web("symptoms of Fall Armyworm in Maize")
-    print(format_search_results(res1))
+    print(format_search_results(res1, query="symptoms of Fall Armyworm in Maize"))
     
     # Test 2: Targeted Government Search
     print("\n--- Test 2: Gov Search ---")
@@ -0,0 +1,146 @@
+"""
+Pluggable search backends used by search.search_web.
+
+AGRI_SEARCH_MODE selects the routing:
+    network  - always Tavily (results are still persisted to the local corpus)
+    hybrid   - answer from the local evidence corpus when coverage is good enough,
+               otherwise fall back to Tavily and persist what it returns (default)
+    offline  - local corpus only (benchmarks, low-connectivity deployments)
+"""
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from cancellation import check_cancelled
+from evidence_store import get_evidence_store
+
+SEARCH_MODE = os.getenv("AGRI_SEARCH_MODE", "hybrid").lower()
+# Local answers must be this fresh and match this share of the query terms on average
+LOCAL_MAX_AGE_DAYS = float(os.getenv("AGRI_LOCAL_MAX_AGE_DAYS", "30"))
+LOCAL_MIN_TERM_COVERAGE = float(os.getenv("AGRI_LOCAL_MIN_COVERAGE", "0.6"))
+# Raw page content kept per result (prompts get extracts, see search.format_search_results)
+MAX_RAW_CONTENT_CHARS = 4000
+
+
+@lru_cache(maxsize=None)
+def get_search_tool(max_results: int = 3):
+    """Creates (once per max_results) the Tavily tool; the langchain_community import is deferred to first use."""
+    from langchain_community.tools.tavily_search import TavilySearchResults
+
+    return TavilySearchResults(max_results=max_results)
+
+
+class SearchBackend:
+    name = "base"
+
+    def search(self, query: str, max_results: int, domains: Optional[List[str]]) -> List[Dict]:
+        raise NotImplementedError
+
+
+class TavilyBackend(SearchBackend):
+    name = "tavily"
+    # Provider requests made by this process (quota accounting, see season_warmup.py)
+    requests = 0
+    _requests_lock = threading.Lock()
+
+    def __init__(self, persist: bool = True):
+        self.persist = persist
+
+    def search(self, query: str, max_results: int, domains: Optional[List[str]]) -> List[Dict]:
+        if domains:
+            domain_str = " OR ".join([f"site:{d}" for d in domains])
+            final_query = f"{query} {domain_str}"
+        else:
+            final_query = query
+
+        check_cancelled()
+        print(f"    🔍 Searching: '{final_query}'")
+        with TavilyBackend._requests_lock:
+            TavilyBackend.requests += 1
+        results = get_search_tool(max_results).invoke({"query": final_query})
+
+        clean_results = [
+            {"url": res.get("url"), "content": res.get("content", "")[:MAX_RAW_CONTENT_CHARS]}
+            for res in results
+        ]
+        if self.persist:
+            try:
+                get_evidence_store().add_results(query, clean_results)
+            except Exception as e:
+                print(f"    ⚠️ Could not persist results to evidence store: {e}")
+        return clean_results
+
+
+class LocalIndexBackend(SearchBackend):
+    name = "local"
+
+    def __init__(self, max_age_days: Optional[float] = None):
+        self.max_age_days = max_age_days
+
+    def search(self, query: str, max_results: int, domains: Optional[List[str]]) -> List[Dict]:
+        docs = get_evidence_store().search(query, limit=max_results, domains=domains,
+                                           max_age_days=self.max_age_days)
+        print(f"    📚 Local corpus: {len(docs)} hit(s) for '{query}'")
+        return docs
+
+
+class HybridBackend(SearchBackend):
+    """Local corpus first; the network only when local coverage is insufficient."""
+    name = "hybrid"
+
+    def __init__(self, local: SearchBackend, network: SearchBackend,
+                 min_term_coverage: float = LOCAL_MIN_TERM_COVERAGE):
+        self.local = local
+        self.network = network
+        self.min_term_coverage = min_term_coverage
+        self.local_hits = 0
+        self.network_calls = 0
+        self._lock = threading.Lock()
+
+    def has_coverage(self, docs: List[Dict], max_results: int) -> bool:
+        if len(docs) < max_results:
+            return False
+        return sum(d["term_coverage"] for d in docs) / len(docs) >= self.min_term_coverage
+
+    def search(self, query: str, max_results: int, domains: Optional[List[str]]) -> List[Dict]:
+        try:
+            docs = self.local.search(query, max_results, domains)
+        except Exception as e:
+            print(f"    ⚠️ Local corpus unavailable: {e}")
+            docs = []
+        if self.has_coverage(docs, max_results):
+            with self._lock:
+                self.local_hits += 1
+            return docs
+        with self._lock:
+            self.network_calls += 1
+        return self.network.search(query, max_results, domains)
+
+
+_backend: Optional[SearchBackend] = None
+_backend_lock = threading.Lock()
+
+def build_search_backend(mode: str = SEARCH_MODE) -> SearchBackend:
+    if mode == "network":
+        return TavilyBackend()
+    if mode == "offline":
+        return LocalIndexBackend()
+    if mode == "hybrid":
+        return HybridBackend(LocalIndexBackend(max_age_days=LOCAL_MAX_AGE_DAYS), TavilyBackend())
+    raise ValueError(f"Unknown AGRI_SEARCH_MODE '{mode}' (expected network, hybrid or offline).")
+
+
+def get_search_backend() -> SearchBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = build_search_backend()
+    return _backend
+
+
+def set_search_backend(backend: SearchBackend) -> None:
+    """Overrides the process-wide backend (e.g. offline benchmarks)."""
+    global _backend
+    _backend = backend
@@ -0,0 +1,229 @@
+"""
+Season-ahead cache warming.
+
+Demand follows the cropping calendar: the same crops, states and pests spike
+every Kharif and Rabi season. For the coming month this job pre-runs the
+expensive steps of likely diagnoses so peak-day requests hit warm data:
+
+    subsidies      subsidy explanation per state                 -> result cache
+    treatments     pesticide_finder extraction per crop x pest   -> result cache
+    eco            sustainability grading per climate zone       -> eco cache (result cache)
+    verification   pest_detector searches per state x crop x pest -> evidence corpus
+
+Likely crop x pest pairs per state come from last year's history for that
+month (history_store.top_crop_pests) first, then from pests.json entries for
+the crops in season. Tasks are interleaved by priority across states and run
+until the provider quota (searches / LLM calls) is used up, at no more than
+`--rate` provider calls per minute. Entries that are already warm cost nothing.
+
+Schedule it a few days before each month starts, e.g. (cron):
+    0 2 25 * *  cd /srv/agri && python season_warmup.py --max-llm-calls 300 --max-searches 600
+
+Usage:
+    python season_warmup.py --dry-run                        # plan for next month
+    python season_warmup.py --month November --states Punjab Haryana --rate 20
+"""
+import calendar
+import time
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from cascade import CASCADE_STATS, cascade_models
+from constants import VERIFICATION_DOMAINS, get_climate_zone, get_state_subsidy_domains
+from search_backends import SEARCH_MODE, TavilyBackend
+
+# Crops in the field (and under pest pressure) per season
+SEASON_CROPS = {
+    "Kharif": ["Rice", "Cotton", "Maize", "Soybean", "Groundnut", "Sorghum", "Bajra", "Pigeonpea", "Sugarcane", "Chilli"],
+    "Rabi": ["Wheat", "Mustard", "Chickpea", "Barley", "Potato", "Pea", "Tomato", "Cabbage", "Cauliflower"],
+    "Zaid": ["Cucumber", "Watermelon", "Melon", "Pumpkin", "Okra", "Mungbean", "Brinjal"],
+}
+MONTH_SEASONS = {**{m: "Kharif" for m in range(6, 11)}, **{m: "Rabi" for m in (11, 12, 1, 2, 3)}, 4: "Zaid", 5: "Zaid"}
+
+DEFAULT_PAIRS_PER_STATE = 10
+DEFAULT_RATE_PER_MIN = 30.0
+
+
+class WarmTask(NamedTuple):
+    kind: str
+    state: Optional[str] = None
+    crop: Optional[str] = None
+    pest: Optional[str] = None
+
+
+def task_cost(task: WarmTask) -> Tuple[int, int]:
+    """Worst-case (searches, LLM calls) of a task, checked against the remaining quota."""
+    # adaptive_search makes a single request (none when prior evidence covers the query)
+    if task.kind == "subsidies":
+        return 0, len(cascade_models("subsidy_finder"))
+    if task.kind == "treatments":
+        return 1, len(cascade_models("pesticide_finder"))
+    if task.kind == "eco":
+        return 0, len(cascade_models("sustainability_analyzer"))
+    return 1, 0
+
+
+# ---------------------------------------------------------
+# 1. WHAT TO WARM
+# ---------------------------------------------------------
+def month_after(now: Optional[datetime] = None) -> str:
+    now = now or datetime.now()
+    return calendar.month_name[now.month % 12 + 1]
+
+
+def season_crops(month: str) -> List[str]:
+    return SEASON_CROPS[MONTH_SEASONS[list(calendar.month_name).index(month.title())]]
+
+
+def likely_crop_pests(state: str, month: str, limit: int = DEFAULT_PAIRS_PER_STATE) -> List[Tuple[str, str]]:
+    """(crop, pest) pairs for a state and month, most likely first."""
+    from history_store import get_history_store
+    from pest_lexicon import get_pest_lexicon
+
+    pairs: List[Tuple[str, str]] = []
+    try:
+        pairs += [(crop.strip().title(), pest) for crop, pest, _ in get_history_store().top_crop_pests(state, month, limit)]
+    except Exception as e:
+        print(f"   ⚠️ No history for {state} / {month}: {e}")
+
+    # Calendar fallback: pests recorded for the crops in season, widespread pests first
+    in_season = {crop.lower() for crop in season_crops(month)}
+    entries = sorted(get_pest_lexicon().entries, key=lambda entry: len(entry.get("crops", [])), reverse=True)
+    for rank in range(max((len(e.get("crops", [])) for e in entries), default=0)):
+        for entry in entries:
+            crops = [c for c in entry.get("crops", []) if c.lower() in in_season]
+            if rank < len(crops):
+                pairs.append((crops[rank].title(), entry["name"]))
+
+    unique = list(dict.fromkeys((crop, pest) for crop, pest in pairs))
+    return unique[:limit]
+
+
+def plan_tasks(month: str, states: List[str], pairs_per_state: int = DEFAULT_PAIRS_PER_STATE) -> List[WarmTask]:
+    """Subsidies first, then crop x pest tasks round-robin across states by priority."""
+    tasks = [WarmTask("subsidies", state) for state in states]
+    pairs = {state: likely_crop_pests(state, month, pairs_per_state) for state in states}
+    seen = set()
+    for rank in range(pairs_per_state):
+        for state in states:
+            if rank >= len(pairs[state]):
+                continue
+            crop, pest = pairs[state][rank]
+            # Treatments are shared by all states, eco grades by the states of one climate zone
+            for task, key in ((WarmTask("treatments", None, crop, pest), ("treatments", crop, pest)),
+                              (WarmTask("eco", state, crop, pest), ("eco", get_climate_zone(state), crop, pest)),
+                              (WarmTask("verification", state, crop, pest), ("verification", state, crop, pest))):
+                if key not in seen:
+                    seen.add(key)
+                    tasks.append(task)
+    return tasks
+
+
+# ---------------------------------------------------------
+# 2. QUOTA AND RATE
+# ---------------------------------------------------------
+class WarmupQuota:
+    """Provider usage of this process since the job started, against the job's limits."""
+
+    def __init__(self, max_searches: int, max_llm_calls: int, rate_per_min: float = DEFAULT_RATE_PER_MIN):
+        self.max_searches = max_searches
+        self.max_llm_calls = max_llm_calls
+        self.rate_per_min = rate_per_min
+        self.started = time.time()
+        self._base = (TavilyBackend.requests, CASCADE_STATS.total_calls())
+
+    def used(self) -> Tuple[int, int]:
+        return TavilyBackend.requests - self._base[0], CASCADE_STATS.total_calls() - self._base[1]
+
+    def allows(self, searches: int, llm_calls: int) -> bool:
+        used_searches, used_llm = self.used()
+        return used_searches + searches <= self.max_searches and used_llm + llm_calls <= self.max_llm_calls
+
+    def pace(self) -> None:
+        """Sleeps until the calls made so far are within `rate_per_min`."""
+        if self.rate_per_min <= 0:
+            return
+        due = self.started + sum(self.used()) * 60.0 / self.rate_per_min
+        if due > time.time():
+            time.sleep(due - time.time())
+
+
+# ---------------------------------------------------------
+# 3. RUNNING THE TASKS
+# ---------------------------------------------------------
+def run_task(task: WarmTask, month: str, treatments: Dict[Tuple[str, str], List]) -> None:
+    if task.kind == "subsidies":
+        from subsidy_finder import subsidy_finder_node
+        subsidy_finder_node({"location": task.state})
+    elif task.kind == "treatments":
+        from pesticide_finder import pesticide_finder_node
+        result = pesticide_finder_node({"confirmed_pest": task.pest, "crop": task.crop})
+        treatments[(task.crop, task.pest)] = result.get("recommended_pesticides") or []
+    elif task.kind == "eco":
+        from sustainability_analyzer import sustainability_analyzer_node
+        recommended = treatments.get((task.crop, task.pest))
+        if recommended:
+            sustainability_analyzer_node({"recommended_pesticides": recommended, "crop": task.crop,
+                                          "location": task.state})
+    else:
+        from pest_detector import verification_query
+        from retrieval_policy import adaptive_search, VERIFICATION_POLICY
+        adaptive_search(verification_query(task.pest, task.crop, task.state, month), VERIFICATION_POLICY,
+                        domains=VERIFICATION_DOMAINS, required_terms=[task.crop, task.state])
+
+
+def warm_season(month: str, states: List[str], quota: WarmupQuota,
+                pairs_per_state: int = DEFAULT_PAIRS_PER_STATE, dry_run: bool = False) -> Dict[str, Dict[str, int]]:
+    """Runs the plan within the quota. Returns per kind: warmed, already warm, skipped (quota), failed."""
+    tasks = plan_tasks(month, states, pairs_per_state)
+    if SEARCH_MODE == "offline":
+        print("   ⚠️ AGRI_SEARCH_MODE=offline: verification searches are not warmed.")
+        tasks = [task for task in tasks if task.kind != "verification"]
+    print(f"🌾 Season warm-up for {month} ({', '.join(season_crops(month))}): {len(tasks)} task(s).")
+
+    summary = {kind: {"warmed": 0, "warm": 0, "quota": 0, "failed": 0}
+               for kind in ("subsidies", "treatments", "eco", "verification")}
+    treatments: Dict[Tuple[str, str], List] = {}
+    if dry_run:
+        for task in tasks:
+            print(f"   -> {task.kind:<13}{task.state or '':<20}{task.crop or '':<12}{task.pest or ''}")
+        return summary
+
+    for task in tasks:
+        if not quota.allows(*task_cost(task)):
+            summary[task.kind]["quota"] += 1
+            continue
+        quota.pace()
+        before = quota.used()
+        try:
+            run_task(task, month, treatments)
+        except Exception as e:
+            print(f"   ❌ Warm-up task {task} failed: {e}")
+            summary[task.kind]["failed"] += 1
+            continue
+        summary[task.kind]["warmed" if quota.used() != before else "warm"] += 1
+
+    searches, llm_calls = quota.used()
+    print(f"✅ Warm-up finished: {searches}/{quota.max_searches} searches, {llm_calls}/{quota.max_llm_calls} LLM calls.")
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Pre-compute likely diagnoses for the coming month")
+    parser.add_argument("--month", default=month_after(), help="Month to warm (default: next month)")
+    parser.add_argument("--states", nargs="+", help="Default: every state in state_domains.json")
+    parser.add_argument("--pairs-per-state", type=int, default=DEFAULT_PAIRS_PER_STATE)
+    parser.add_argument("--max-searches", type=int, default=200)
+    parser.add_argument("--max-llm-calls", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE_PER_MIN, help="Provider calls per minute (0 = unlimited)")
+    parser.add_argument("--dry-run", action="store_true", help="Print the plan without calling any provider")
+    args = parser.parse_args()
+
+    states = args.states or list(get_state_subsidy_domains())
+    quota = WarmupQuota(args.max_searches, args.max_llm_calls, args.rate)
+    summary = warm_season(args.month.title(), states, quota, args.pairs_per_state, args.dry_run)
+    if not args.dry_run:
+        print(json.dumps(summary, indent=2))
@@ -0,0 +1,374 @@
+"""
+Headless HTTP JSON API around the compiled diagnosis graph (for the mobile field app).
+
+Endpoints:
+    GET  /health            -> service / worker pool status, model-cascade, speculation and cache stats
+    POST /diagnose          -> runs the full pipeline, returns the final state as JSON
+    POST /diagnose/stream   -> same, but streams one NDJSON line per finished node
+    POST /jobs              -> queue a diagnosis for the worker pool (with --jobs-db)
+    GET  /jobs/<id>         -> poll a queued diagnosis
+
+Request body is either multipart/form-data (field `image` + form fields) or JSON
+with `image_base64` (or `images_base64`, a list of photos of the same field;
+multipart accepts repeated `image` parts). Common fields: location, month, crop, optional timeout (s)
+and, for /diagnose, `profile` (true = cProfile / tracemalloc run, see profiling.py).
+
+A run whose request times out or whose client disconnects is cancelled: it stops
+before its next node, model call or search (see cancellation.py) and frees its worker.
+
+Usage:
+    python server.py --port 8080 --workers 4
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import tornado.iostream
+import tornado.web
+
+from cancellation import CancelToken, RunCancelled, cancellable
+from graph import get_app, build_initial_state, serialize_state
+from job_queue import JobQueue
+from cascade import CASCADE_STATS
+from speculative import SPECULATION_STATS
+from sustainability_analyzer import ECO_CACHE
+from result_cache import get_result_cache
+from prompt_cache import PROMPT_CACHE_STATS
+from structured_repair import REPAIR_STATS
+from node_memo import MEMO_STATS
+from retrieval_policy import RETRIEVAL_STATS
+from domain_stats import get_domain_stats
+from profiling import invoke_graph
+from reference_data import start_reference_watcher
+
+DEFAULT_WORKERS = int(os.getenv("AGRI_API_WORKERS", "4"))
+# Requests waiting beyond this many in-flight + queued runs are rejected with 503
+DEFAULT_MAX_PENDING = int(os.getenv("AGRI_API_MAX_PENDING", "16"))
+DEFAULT_TIMEOUT_S = float(os.getenv("AGRI_API_TIMEOUT_S", "120"))
+MAX_TIMEOUT_S = 600.0
+# Share of the HTTP timeout given to the pipeline as its latency budget; the rest absorbs the
+# last in-flight call so clients get a (degraded) answer instead of a 504
+PIPELINE_BUDGET_SHARE = 0.8
+
+
+class RequestError(Exception):
+    """Invalid client input, reported as HTTP 400."""
+
+
+# ---------------------------------------------------------
+# 1. WORKER POOL (shared compiled graph, bounded concurrency)
+# ---------------------------------------------------------
+class DiagnosisService:
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agri-api")
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    def _submit(self, token: CancelToken, fn, *args) -> "asyncio.Future":
+        """
+        Runs `fn` on a worker with `token` bound (see cancellation.py); a cancelled run resolves to None.
+        The slot is held until the worker really stops, which a cancelled run does at its next checkpoint.
+        """
+        def run():
+            with cancellable(token):
+                try:
+                    return fn(*args)
+                except RunCancelled as e:
+                    print(f"   🛑 Run cancelled ({e}).")
+                    return None
+
+        future = self.executor.submit(run)
+        future.add_done_callback(lambda _: self.release())
+        return asyncio.wrap_future(future)
+
+    def invoke(self, state: Dict[str, Any], token: CancelToken, profile: bool = False,
+               label: str = "run") -> "asyncio.Future":
+        return self._submit(token, invoke_graph, get_app(), state, profile, label)
+
+    def stream(self, state: Dict[str, Any], token: CancelToken, queue: asyncio.Queue,
+               loop: asyncio.AbstractEventLoop) -> "asyncio.Future":
+        """
+        Runs `graph.stream` on a worker, forwarding (node, update) pairs to `queue` and, as
+        (None, state), the full state after each step (merged by the graph's reducers); None marks the end.
+        """
+        def run():
+            try:
+                for mode, chunk in get_app().stream(state, stream_mode=["updates", "values"]):
+                    if mode == "values":
+                        loop.call_soon_threadsafe(queue.put_nowait, (None, chunk))
+                        continue
+                    for node_name, update in chunk.items():
+                        loop.call_soon_threadsafe(queue.put_nowait, (node_name, update))
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        return self._submit(token, run)
+
+
+# ---------------------------------------------------------
+# 2. HANDLERS
+# ---------------------------------------------------------
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, service: DiagnosisService, jobs: Optional[JobQueue] = None):
+        self.service = service
+        self.jobs = jobs
+
+    def prepare(self):
+        self.request_id = self.request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        self.set_header("X-Request-ID", self.request_id)
+        self.set_header("Content-Type", "application/json")
+
+    def write_json(self, status: int, payload: Dict[str, Any]) -> None:
+        self.set_status(status)
+        self.finish(json.dumps({"request_id": self.request_id, **payload}, default=str))
+
+    def write_error(self, status_code: int, **kwargs):
+        self.finish(json.dumps({"request_id": getattr(self, "request_id", None), "error": self._reason}))
+
+    def parse_request(self) -> Dict[str, Any]:
+        content_type = self.request.headers.get("Content-Type", "")
+        if content_type.startswith("application/json"):
+            try:
+                body = json.loads(self.request.body or b"{}")
+            except ValueError:
+                raise RequestError("Body is not valid JSON.")
+            encoded = body.get("images_base64") or ([body["image_base64"]] if body.get("image_base64") else [])
+            try:
+                images = [base64.b64decode(item, validate=True) for item in encoded]
+            except (TypeError, ValueError):
+                raise RequestError("'image_base64' / 'images_base64' is not valid base64.")
+            fields = body
+        else:
+            images = [f["body"] for f in self.request.files.get("image") or []]
+            fields = {key: self.get_body_argument(key, None) for key in ("location", "month", "crop", "timeout", "profile")}
+
+        images = [image for image in images if image]
+        if not images:
+            raise RequestError("An 'image' is required.")
+        missing = [key for key in ("location", "month", "crop") if not fields.get(key)]
+        if missing:
+            raise RequestError(f"Missing fields: {', '.join(missing)}.")
+
+        try:
+            timeout = min(float(fields.get("timeout") or DEFAULT_TIMEOUT_S), MAX_TIMEOUT_S)
+        except (TypeError, ValueError):
+            raise RequestError("'timeout' must be a number of seconds.")
+
+        budget_s = timeout * PIPELINE_BUDGET_SHARE
+        if len(images) == 1:
+            state = build_initial_state(fields["location"], fields["month"], fields["crop"],
+                                        image_bytes=images[0], budget_s=budget_s)
+        else:
+            state = build_initial_state(fields["location"], fields["month"], fields["crop"],
+                                        images=images, budget_s=budget_s)
+        profile = str(fields.get("profile", "")).lower() in ("1", "true", "yes")
+        return {"state": state, "timeout": timeout, "profile": profile}
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        self.write_json(200, {
+            "status": "ok",
+            "workers": self.service.workers,
+            "pending": self.service.pending,
+            "max_pending": self.service.max_pending,
+            "model_cascade": CASCADE_STATS.report(),
+            "speculation": SPECULATION_STATS.report(),
+            "eco_cache": ECO_CACHE.report(),
+            "result_cache": get_result_cache().stats() if get_result_cache() else None,
+            "prompt_cache": PROMPT_CACHE_STATS.report(),
+            "structured_repair": REPAIR_STATS.report(),
+            "node_memo": MEMO_STATS.report(),
+            "retrieval": RETRIEVAL_STATS.report(),
+            "domain_stats": get_domain_stats().report() if get_domain_stats() else None,
+        })
+
+
+class DiagnoseHandler(BaseHandler):
+    token: Optional[CancelToken] = None
+
+    def on_connection_close(self):
+        # An abandoned request stops at its next checkpoint instead of holding a worker and search quota
+        if self.token is not None:
+            self.token.cancel("client disconnected")
+
+    async def post(self):
+        try:
+            request = self.parse_request()
+        except RequestError as e:
+            return self.write_json(400, {"error": str(e)})
+
+        if not self.service.try_acquire():
+            return self.write_json(503, {"error": "Server busy, retry shortly."})
+
+        started = time.perf_counter()
+        print(f"   🌐 [{self.request_id}] /diagnose accepted (timeout {request['timeout']:g}s)")
+        self.token = CancelToken()
+        try:
+            final_state = await asyncio.wait_for(self.service.invoke(request["state"], self.token, request["profile"],
+                                                                     self.request_id),
+                                               request["timeout"])
+        except asyncio.TimeoutError:
+            # The client gets a prompt answer; the worker stops at its next checkpoint.
+            self.token.cancel("deadline exceeded")
+            return self.write_json(504, {"error": f"Deadline of {request['timeout']:g}s exceeded."})
+        except Exception as e:
+            print(f"   ❌ [{self.request_id}] Pipeline error: {e}")
+            return self.write_json(500, {"error": str(e)})
+        if final_state is None:
+            print(f"   ⚠️ [{self.request_id}] Client disconnected; run cancelled.")
+            return
+
+        self.write_json(200, {
+            "elapsed_s": round(time.perf_counter() - started, 3),
+            "result": serialize_state(final_state),
+        })
+
+
+class DiagnoseStreamHandler(DiagnoseHandler):
+    """Streams NDJSON: one {"node", "update"} line per finished node, then a final {"event": "done"} line."""
+
+    async def post(self):
+        try:
+            request = self.parse_request()
+        except RequestError as e:
+            return self.write_json(400, {"error": str(e)})
+
+        if not self.service.try_acquire():
+            return self.write_json(503, {"error": "Server busy, retry shortly."})
+
+        self.set_header("Content-Type", "application/x-ndjson")
+        started = time.perf_counter()
+        deadline = time.monotonic() + request["timeout"]
+        queue: asyncio.Queue = asyncio.Queue()
+        final_state = dict(request["state"])
+        self.token = CancelToken()
+        worker = self.service.stream(request["state"], self.token, queue, asyncio.get_running_loop())
+
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = await asyncio.wait_for(queue.get(), max(remaining, 0))
+                except asyncio.TimeoutError:
+                    self.token.cancel("deadline exceeded")
+                    await self._send_line({"event": "error", "error": f"Deadline of {request['timeout']:g}s exceeded."})
+                    return self.finish()
+                if item is None:
+                    break
+                node_name, update = item
+                if node_name is None:
+                    final_state = update
+                    continue
+                await self._send_line({"event": "node", "node": node_name, "update": serialize_state(update or {})})
+
+            try:
+                await worker
+            except Exception as e:
+                await self._send_line({"event": "error", "error": str(e)})
+                return self.finish()
+
+            await self._send_line({
+                "event": "done",
+                "elapsed_s": round(time.perf_counter() - started, 3),
+                "result": serialize_state(final_state),
+            })
+            self.finish()
+        except tornado.iostream.StreamClosedError:
+            self.token.cancel("client disconnected")
+            print(f"   ⚠️ [{self.request_id}] Client disconnected mid-stream; run cancelled.")
+
+    async def _send_line(self, payload: Dict[str, Any]) -> None:
+        self.write(json.dumps({"request_id": self.request_id, **payload}, default=str) + "\n")
+        await self.flush()
+
+
+class JobsHandler(BaseHandler):
+    """POST /jobs: queue a diagnosis for the worker pool and return its id immediately (202)."""
+
+    def post(self):
+        try:
+            request = self.parse_request()
+        except RequestError as e:
+            return self.write_json(400, {"error": str(e)})
+
+        state = request["state"]
+        if state["image_bytes"] is None:
+            return self.write_json(400, {"error": "Queued jobs accept a single image; use /diagnose for multi-image submissions."})
+        job_id = self.jobs.submit(state["location"], state["month"], state["crop"], state["image_bytes"])
+        self.set_header("Location", f"/jobs/{job_id}")
+        self.write_json(202, {"job_id": job_id, "status": "queued"})
+
+
+class JobHandler(BaseHandler):
+    """GET /jobs/<id>: poll a queued diagnosis."""
+
+    def get(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return self.write_json(404, {"error": f"Unknown job '{job_id}'."})
+        self.write_json(200, {"job": job})
+
+
+# ---------------------------------------------------------
+# 3. APPLICATION
+# ---------------------------------------------------------
+def make_app(service: Optional[DiagnosisService] = None, jobs: Optional[JobQueue] = None) -> tornado.web.Application:
+    service = service or DiagnosisService()
+    handler_args = {"service": service, "jobs": jobs}
+    routes = [
+        (r"/health", HealthHandler, handler_args),
+        (r"/diagnose", DiagnoseHandler, handler_args),
+        (r"/diagnose/stream", DiagnoseStreamHandler, handler_args),
+    ]
+    if jobs is not None:
+        routes += [
+            (r"/jobs", JobsHandler, handler_args),
+            (r"/jobs/([0-9a-f]+)", JobHandler, handler_args),
+        ]
+    return tornado.web.Application(routes)
+
+
+async def main(port: int, workers: int, max_pending: int, jobs_db: Optional[str] = None) -> None:
+    service = DiagnosisService(workers=workers, max_pending=max_pending)
+    jobs = JobQueue(jobs_db) if jobs_db else None
+    # Compile the shared graph before accepting traffic
+    get_app()
+    start_reference_watcher()
+    make_app(service, jobs).listen(port)
+    print(f"🌿 Agri-Agent API listening on :{port} ({workers} workers, max {max_pending} pending)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Agri-Agent HTTP JSON API")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8080")))
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING)
+    parser.add_argument("--jobs-db", default=None, help="Enable /jobs backed by this SQLite queue (see job_queue.py)")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.port, args.workers, args.max_pending, args.jobs_db))
@@ -0,0 +1,139 @@
+import re
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+# ---------------------------------------------------------
+# QUERY-AWARE EXTRACTIVE SNIPPETS
+# ---------------------------------------------------------
+# Instead of blindly keeping the first N characters of every search result, the
+# sentences of all results are scored with BM25 against the query / focus terms
+# and the best ones are kept within a per-result and per-prompt character budget.
+# Near-identical passages (mirrored advisories, syndicated PDFs) are dropped.
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?।])\s+|\s*\n+\s*|\s+\|\s+")
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "were", "with", "which",
+    "during", "india", "site", "org", "gov", "nic", "ac", "www", "http", "https",
+}
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+MIN_SENTENCE_CHARS = 25
+DUPLICATE_JACCARD = 0.8
+SNIPPET_JOINER = " … "
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def split_sentences(text: str, max_chars: Optional[int] = None) -> List[str]:
+    """Splits text into sentences; run-on 'sentences' (tables, scraped PDFs) are cut into max_chars word windows."""
+    sentences = []
+    for sentence in _SENTENCE_SPLIT.split(text or ""):
+        sentence = sentence.strip()
+        while max_chars and len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            sentences.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        sentences.append(sentence)
+    return [s for s in sentences if len(s) >= MIN_SENTENCE_CHARS]
+
+
+def build_query_terms(query: Optional[str] = None, focus_terms: Optional[Iterable[str]] = None) -> List[str]:
+    """Query tokens plus focus-term tokens; focus terms (pest, crop, location...) count twice."""
+    terms = tokenize(query or "")
+    for term in focus_terms or []:
+        if term:
+            terms.extend(tokenize(str(term)) * 2)
+    return terms
+
+
+class BM25:
+    """Minimal Okapi BM25 over a list of pre-tokenized documents (here: sentences)."""
+
+    def __init__(self, documents: List[List[str]], k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(doc) for doc in documents]
+        self.lengths = [len(doc) for doc in documents]
+        self.avg_length = (sum(self.lengths) / len(documents)) if documents else 0.0
+        doc_freq = Counter(term for doc in documents for term in set(doc))
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def score(self, query_terms: List[str], index: int) -> float:
+        freqs = self.term_freqs[index]
+        norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1))
+        total = 0.0
+        for term, weight in Counter(query_terms).items():
+            tf = freqs.get(term)
+            if tf:
+                total += weight * self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+        return total
+
+
+def _is_duplicate(tokens: Set[str], kept: List[Set[str]], threshold: float) -> bool:
+    if not tokens:
+        return True
+    for other in kept:
+        union = len(tokens | other)
+        if union and len(tokens & other) / union >= threshold:
+            return True
+    return False
+
+
+def extract_relevant_snippets(results: List[Dict], query_terms: List[str],
+                              per_result_chars: int = 500, total_chars: int = 2500,
+                              duplicate_threshold: float = DUPLICATE_JACCARD) -> List[Dict]:
+    """
+    Returns copies of `results` whose 'content' is reduced to the most query-relevant
+    sentences. Results are processed in search-rank order until `total_chars` is spent;
+    results left with nothing new to say are dropped.
+    """
+    per_result = [split_sentences(res.get("content", ""), per_result_chars) for res in results]
+    flat_tokens = [tokenize(sentence) for sentences in per_result for sentence in sentences]
+    bm25 = BM25(flat_tokens)
+
+    kept_token_sets: List[Set[str]] = []
+    trimmed = []
+    remaining_budget = total_chars
+    offset = 0
+    for res, sentences in zip(results, per_result):
+        if remaining_budget <= 0:
+            break
+        indices = range(offset, offset + len(sentences))
+        offset += len(sentences)
+
+        # Best-scoring first, ties keep document order. Sentences with no query overlap are
+        # boilerplate; they are only used (lead sentence first) when nothing else matches.
+        scores = {i: bm25.score(query_terms, i) for i in indices}
+        ranked = sorted((i for i in indices if scores[i] > 0), key=lambda i: (-scores[i], i))
+        if not ranked:
+            ranked = list(indices)
+        budget = min(per_result_chars, remaining_budget)
+        chosen = []
+        for i in ranked:
+            sentence = sentences[i - indices.start]
+            if len(sentence) > budget:
+                continue
+            token_set = set(flat_tokens[i])
+            if _is_duplicate(token_set, kept_token_sets, duplicate_threshold):
+                continue
+            chosen.append(i)
+            kept_token_sets.append(token_set)
+            budget -= len(sentence) + len(SNIPPET_JOINER)
+            if budget <= MIN_SENTENCE_CHARS:
+                break
+
+        if not chosen:
+            continue
+        content = SNIPPET_JOINER.join(sentences[i - indices.start] for i in sorted(chosen))
+        remaining_budget -= len(content)
+        trimmed.append({**res, "content": content})
+    return trimmed
@@ -0,0 +1,148 @@
+"""
+Speculative treatment lookup.
+
+The pest detector's verdict usually equals the top visual candidate. With
+AGRI_SPECULATIVE=1, the treatment search + extraction for that candidate starts
+on a background thread as soon as `candidate_analysis` exists, overlapping
+with the verification searches and LLM verdict. `pesticide_finder_node`
+commits the speculative result when the confirmed pest matches and discards it
+otherwise. SPECULATION_STATS reports the hit rate, the time saved and the work
+wasted on misses.
+"""
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+SPECULATIVE_ENABLED = os.getenv("AGRI_SPECULATIVE", "0") == "1"
+SPECULATION_WORKERS = int(os.getenv("AGRI_SPECULATION_WORKERS", "4"))
+# Lookups nobody claims (crashed / abandoned runs) are forgotten after this long
+SPECULATION_TTL_S = 600.0
+
+
+class SpeculationStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"started": 0, "hits": 0, "misses": 0, "unclaimed": 0}
+        self.saved_s = 0.0
+        self.wasted_s = 0.0
+
+    def record(self, outcome: str, saved_s: float = 0.0, wasted_s: float = 0.0) -> None:
+        with self._lock:
+            self.counts[outcome] += 1
+            self.saved_s += saved_s
+            self.wasted_s += wasted_s
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            claimed = self.counts["hits"] + self.counts["misses"]
+            return {
+                **self.counts,
+                "hit_rate": round(self.counts["hits"] / claimed, 3) if claimed else None,
+                "saved_s": round(self.saved_s, 2),
+                "wasted_s": round(self.wasted_s, 2),
+            }
+
+
+SPECULATION_STATS = SpeculationStats()
+
+
+class _Lookup:
+    def __init__(self, pest: str, future: Future):
+        self.pest = pest
+        self.future = future
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+
+class SpeculativeLookups:
+    def __init__(self, workers: int = SPECULATION_WORKERS):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._workers = workers
+        self._lookups: Dict[str, _Lookup] = {}
+        self._lock = threading.Lock()
+
+    def start(self, pest: str, lookup: Callable[[], Dict[str, Any]]) -> str:
+        """Runs `lookup()` in the background for `pest`; returns the id to claim it with."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self._workers, thread_name_prefix="agri-speculative")
+            self._expire()
+            speculation_id = uuid.uuid4().hex
+            entry = _Lookup(pest, None)
+
+            def run():
+                try:
+                    return lookup()
+                finally:
+                    entry.finished = time.perf_counter()
+
+            # The lookup belongs to the run that started it: cancelling that run cancels it too
+            entry.future = self._executor.submit(contextvars.copy_context().run, run)
+            self._lookups[speculation_id] = entry
+        SPECULATION_STATS.record("started")
+        return speculation_id
+
+    def _expire(self) -> None:
+        now = time.perf_counter()
+        for key in [k for k, e in self._lookups.items() if now - e.started > SPECULATION_TTL_S]:
+            entry = self._lookups.pop(key)
+            entry.future.cancel()
+            SPECULATION_STATS.record("unclaimed", wasted_s=(entry.finished or now) - entry.started)
+
+    def claim(self, speculation_id: str, confirmed_pest: Optional[str],
+              timeout: Optional[float] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        (hit, result). On a hit, waits for the lookup (at most `timeout` s) and returns its result.
+        On a miss the lookup is cancelled if it has not started, otherwise left to finish unused.
+        """
+        with self._lock:
+            entry = self._lookups.pop(speculation_id, None)
+        if entry is None:
+            return False, None
+
+        claimed_at = time.perf_counter()
+        if not confirmed_pest or confirmed_pest.strip().lower() != entry.pest.strip().lower():
+            entry.future.cancel()
+            SPECULATION_STATS.record("misses", wasted_s=(entry.finished or claimed_at) - entry.started)
+            print(f"   🎲 Speculative lookup for '{entry.pest}' discarded (confirmed: {confirmed_pest}).")
+            return False, None
+
+        try:
+            result = entry.future.result(timeout=timeout)
+        except Exception as e:
+            print(f"   ⚠️ Speculative lookup failed ({e}); running it again.")
+            SPECULATION_STATS.record("misses", wasted_s=(entry.finished or time.perf_counter()) - entry.started)
+            return False, None
+        # Time saved = the part of the lookup that ran before the pesticide node needed it
+        SPECULATION_STATS.record("hits", saved_s=min(claimed_at, entry.finished) - entry.started)
+        print(f"   🎯 Speculative lookup for '{entry.pest}' committed.")
+        return True, result
+
+    def cancel(self, speculation_id: str) -> None:
+        """Drops a lookup whose result is no longer needed (e.g. the node output was memoized)."""
+        with self._lock:
+            entry = self._lookups.pop(speculation_id, None)
+        if entry is not None:
+            entry.future.cancel()
+            SPECULATION_STATS.record("unclaimed", wasted_s=(entry.finished or time.perf_counter()) - entry.started)
+
+
+SPECULATIVE_LOOKUPS = SpeculativeLookups()
+
+
+def speculate_treatment_node(state: Dict) -> Dict:
+    """Graph node after the image analyzer: starts the treatment lookup for the top visual candidate."""
+    candidates = state.get("candidate_analysis") or {}
+    if not SPECULATIVE_ENABLED or not candidates:
+        return {}
+    # Imported here: pesticide_finder imports this module for claim()
+    from pesticide_finder import pesticide_finder_node
+
+    top = next(iter(candidates))
+    hypothesis = {**state, "confirmed_pest": top, "speculation_id": None}
+    print(f"   🎲 Speculatively looking up treatments for '{top}'.")
+    return {"speculation_id": SPECULATIVE_LOOKUPS.start(top, lambda: pesticide_finder_node(hypothesis))}
@@ -1,21 +1,263 @@
-from typing import TypedDict, Dict, List, Optional
+"""
+The canonical AgentState and its binary codec.
 
+AgentState is the one schema of the graph's shared memory (graph.py builds the
+StateGraph from it). encode_state / decode_state turn a state - or any partial
+state / node update - into compact bytes for job results, node memos and any
+other store:
+
+    header   b"AGST" | codec version (1 byte) | flags (1 byte) | schema hash (8 bytes)
+    payload  MessagePack (ormsgpack), zstd-compressed when larger than
+             COMPRESS_MIN_BYTES
+
+Round trip: decode_state(encode_state(s)) == normalize_state(s). The only
+normalizations are memoryview -> bytes, tuple / set -> list, Pydantic models
+and numpy values -> plain Python. Anything else that is not plain data raises
+StateCodecError instead of being stringified. `encode_state(..., verify=True)`
+checks the round trip on the spot.
+
+A blob written by a different codec version is rejected; one written for a
+different AgentState schema is rejected unless `allow_schema_drift=True` (job
+results written before a deploy are still readable, caches treat it as a miss).
+
+Usage:
+    python state.py --iterations 200   # encode / decode time and bytes vs JSON
+"""
+import hashlib
+import operator
+import re
+import threading
+from typing import Annotated, Any, Dict, List, Optional, Tuple, TypedDict, Union
+
+import ormsgpack
+import zstandard
+
+def merge_timings(current: Dict[str, float], update: Dict[str, float]) -> Dict[str, float]:
+    return {**(current or {}), **(update or {})}
+
+# ---------------------------------------------------------
+# 1. STATE DEFINITION (The Shared Memory)
+# ---------------------------------------------------------
 class AgentState(TypedDict):
-    
-    image_path: str
-    location: str       # e.g., "Punjab"
-    month: str          # e.g., "October"
-    crop : str          # e.g wheat 
-    
-    candidate_analysis: Dict[str, str] 
-    
-    confirmed_pest: Optional[str]  
-    confidence_score: float         
-    
-    recommended_pesticides: List[str] 
-    subsidy_info: Dict[str, str]  
-    
-    # --- FLAGS ---
-    error: Optional[str]    
-
-    environmental_impact_report: Optional[Dict]        
\ No newline at end of file
+
+    # --- INPUTS ---
+    # Either raw image bytes (in-memory handoff from the UI) or a file path (CLI)
+    image_bytes: Optional[Union[bytes, memoryview]]
+    image_path: Optional[str]
+    # Several photos of the same field (takes precedence over image_bytes / image_path)
+    images: Optional[List[Union[bytes, memoryview, str]]]
+    location: str
+    month: str
+    crop: str
+
+    # --- QUALITY GATE ---
+    image_quality: List[Dict[str, Any]]   # per-image metrics / issues
+    usable_images: Optional[List[int]]    # 1-based numbers of the photos that passed (None = all)
+    retake_advice: List[str]              # set when no photo is usable (the run stops)
+
+    # --- NODE A & B ---
+    candidate_analysis: Dict[str, str]
+    image_evidence: Dict[str, List[Dict[str, Any]]]   # candidate -> [{image_index, evidence}]
+    speculation_id: Optional[str]    # background treatment lookup for the top candidate
+    verification_evidence: Dict[str, List[Dict[str, Any]]]   # candidate -> search results [{url, content}]
+    confirmed_pest: Optional[str]
+    confidence_score: float
+    decision_reasoning: str
+
+    # --- NODE C: Pesticide Finder (Consolidated) ---
+    # Now stores the full dictionaries containing category, dosage, and cost
+    recommended_pesticides: List[Dict[str, Any]]
+
+    # --- NODE E: Sustainability Analyzer (NEW) ---
+    environmental_impact_report: Optional[Dict[str, Any]]
+
+    # --- NODE D: Subsidy Finder ---
+    subsidy_info: List[Dict]
+
+    # --- LATENCY BUDGET ---
+    deadline: Optional[float]                            # absolute epoch seconds, None = unlimited
+    degradations: Annotated[List[str], operator.add]     # cheaper paths taken to meet the deadline
+
+    # --- TIMINGS ---
+    node_timings: Annotated[Dict[str, float], merge_timings]   # node -> wall seconds
+
+    # --- ERROR TRACKING ---
+    error: Optional[str]
+
+# ---------------------------------------------------------
+# 2. CODEC
+# ---------------------------------------------------------
+MAGIC = b"AGST"
+CODEC_VERSION = 1
+FLAG_ZSTD = 0x01
+HEADER_BYTES = len(MAGIC) + 2 + 8
+COMPRESS_MIN_BYTES = 1024
+ZSTD_LEVEL = 3
+
+# Changes whenever a field is added, removed or retyped (reducer reprs carry a memory
+# address, which is dropped so every process computes the same hash)
+STATE_SCHEMA_HASH = hashlib.sha256(
+    "\n".join(re.sub(r" at 0x[0-9a-f]+", "", f"{name}:{annotation!r}")
+              for name, annotation in sorted(AgentState.__annotations__.items())).encode("utf-8")
+).digest()[:8]
+
+_PACK_OPTIONS = ormsgpack.OPT_NON_STR_KEYS | ormsgpack.OPT_SERIALIZE_NUMPY | ormsgpack.OPT_SERIALIZE_PYDANTIC
+
+
+class StateCodecError(ValueError):
+    pass
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "item") and callable(value.item):   # numpy scalars ormsgpack does not cover
+        return value.item()
+    raise TypeError(f"cannot encode {type(value).__name__} in an agent state")
+
+
+# zstd (de)compressors are not safe to share between threads
+_zstd = threading.local()
+
+def _zstd_codecs() -> Tuple[zstandard.ZstdCompressor, zstandard.ZstdDecompressor]:
+    if not hasattr(_zstd, "codecs"):
+        _zstd.codecs = (zstandard.ZstdCompressor(level=ZSTD_LEVEL), zstandard.ZstdDecompressor())
+    return _zstd.codecs
+
+
+def normalize_state(value: Any) -> Any:
+    """What decode_state returns for `value` (the round-trip reference)."""
+    if isinstance(value, dict):
+        return {key: normalize_state(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [normalize_state(item) for item in value]
+    if isinstance(value, memoryview):
+        return value.tobytes()
+    if hasattr(value, "model_dump"):
+        return normalize_state(value.model_dump())
+    if hasattr(value, "tolist"):   # numpy arrays and scalars
+        return value.tolist()
+    return value
+
+
+def encode_state(state: Dict[str, Any], verify: bool = False) -> bytes:
+    try:
+        payload = ormsgpack.packb(state, default=_default, option=_PACK_OPTIONS)
+    except TypeError as e:
+        raise StateCodecError(str(e)) from e
+    flags = 0
+    if len(payload) >= COMPRESS_MIN_BYTES:
+        compressed = _zstd_codecs()[0].compress(payload)
+        # Photos are already compressed; keep whichever is smaller
+        if len(compressed) < len(payload):
+            payload, flags = compressed, FLAG_ZSTD
+    blob = MAGIC + bytes([CODEC_VERSION, flags]) + STATE_SCHEMA_HASH + payload
+    if verify and decode_state(blob) != normalize_state(state):
+        raise StateCodecError("state does not survive the round trip")
+    return blob
+
+
+def decode_state(blob: bytes, allow_schema_drift: bool = False) -> Dict[str, Any]:
+    blob = bytes(blob)
+    if blob[:len(MAGIC)] != MAGIC or len(blob) < HEADER_BYTES:
+        raise StateCodecError("not an encoded agent state")
+    version, flags = blob[len(MAGIC)], blob[len(MAGIC) + 1]
+    if version != CODEC_VERSION:
+        raise StateCodecError(f"unsupported state codec version {version}")
+    if blob[len(MAGIC) + 2:HEADER_BYTES] != STATE_SCHEMA_HASH and not allow_schema_drift:
+        raise StateCodecError("state was encoded for a different AgentState schema")
+    payload = blob[HEADER_BYTES:]
+    if flags & FLAG_ZSTD:
+        payload = _zstd_codecs()[1].decompress(payload)
+    return ormsgpack.unpackb(payload, option=ormsgpack.OPT_NON_STR_KEYS)
+
+
+# ---------------------------------------------------------
+# 3. BENCHMARK
+# ---------------------------------------------------------
+def sample_state(worst_case: bool = False) -> Dict[str, Any]:
+    """A typical final state, or a worst case with three photos and long evidence / reasoning."""
+    import os
+    import time
+
+    treatments = [
+        {"chemical_name": name, "category": category, "brand_name": "Generic", "dosage": "2 ml/litre",
+         "safety_period": "7 days", "estimated_cost": "Rs. 450 per acre"}
+        for name, category in [("Neem Oil 1500 ppm", "Biological/Natural"), ("Imidacloprid 17.8% SL", "Synthetic"),
+                               ("Beauveria bassiana 1.15% WP", "Biological/Natural"), ("Thiamethoxam 25% WG", "Synthetic")]
+    ]
+    state = {
+        "image_bytes": None, "image_path": None, "images": None,
+        "location": "Punjab", "month": "March", "crop": "Wheat",
+        "image_quality": [{"index": 1, "width": 1600, "height": 1200, "sharpness": 412.7, "brightness": 128.3,
+                           "green_fraction": 0.62, "issues": [], "usable": True}],
+        "retake_advice": [],
+        "candidate_analysis": {"Aphids": "Clusters of small green insects on the underside of leaves.",
+                               "Thrips": "Silvery streaks on the leaf surface."},
+        "image_evidence": {"Aphids": [{"image_index": 1, "evidence": "Colonies along the midrib."}]},
+        "speculation_id": None,
+        "verification_evidence": {"Aphids": [{"url": "https://vikaspedia.in/agriculture/crop-production/wheat",
+                                              "content": "Aphids appear on wheat in Punjab from January to March. " * 10}]},
+        "confirmed_pest": "Aphids", "confidence_score": 0.86,
+        "decision_reasoning": "Aphid infestations on wheat in Punjab peak in February-March; the evidence matches.",
+        "recommended_pesticides": treatments,
+        "environmental_impact_report": {
+            "treatments_analysis": [{"chemical_name": t["chemical_name"], "cost_estimate": t["estimated_cost"],
+                                     "toxicity_grade": "B", "water_risk": "Low", "carbon_impact": "Low",
+                                     "eco_score": 70, "calculation_and_logic": "Short persistence, low dose."}
+                                    for t in treatments],
+            "overall_eco_score": 64, "optimization_tip": "Start with the biological option; spray at dusk.",
+        },
+        "subsidy_info": [{"scheme_name": f"Scheme {i}", "level": "Central", "benefit_details": "50% subsidy on bio-inputs",
+                          "eligibility": "Small and marginal farmers", "explanation": "Covers neem-based pesticides."}
+                         for i in range(5)],
+        "deadline": time.time() + 30, "degradations": [],
+        "node_timings": {"image_analyzer": 2.41, "pest_detector": 3.12, "pesticide_finder": 2.77,
+                         "sustainability_analyzer": 1.52, "subsidy_finder": 1.9},
+        "error": None,
+    }
+    if worst_case:
+        state["images"] = [os.urandom(600_000) for _ in range(3)]
+        state["decision_reasoning"] *= 40
+        state["image_evidence"] = {f"Pest {i}": [{"image_index": j, "evidence": "Visible symptom " * 20} for j in range(1, 4)]
+                                   for i in range(6)}
+        state["recommended_pesticides"] = treatments * 6
+        state["degradations"] = [f"node {i}: degraded path taken to meet the deadline" for i in range(10)]
+    return state
+
+
+if __name__ == "__main__":
+    import argparse
+    import base64
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="Benchmark the agent-state codec against JSON")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    def json_default(value):
+        # What a JSON store has to do with photos
+        if isinstance(value, (bytes, memoryview)):
+            return base64.b64encode(bytes(value)).decode("ascii")
+        return str(value)
+
+    codecs = {
+        "json indent=2": (lambda s: json.dumps(s, indent=2, default=json_default).encode("utf-8"), json.loads),
+        "json compact": (lambda s: json.dumps(s, default=json_default).encode("utf-8"), json.loads),
+        "state codec": (encode_state, decode_state),
+    }
+    for label, worst_case in (("typical", False), ("worst case", True)):
+        state = sample_state(worst_case)
+        encode_state(state, verify=True)
+        print(f"\n{label} state")
+        for name, (encode, decode) in codecs.items():
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                blob = encode(state)
+            encode_ms = (time.perf_counter() - start) / args.iterations * 1000
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                decode(blob)
+            decode_ms = (time.perf_counter() - start) / args.iterations * 1000
+            print(f"   {name:14} {len(blob):>10,d} bytes   encode {encode_ms:8.3f} ms   decode {decode_ms:8.3f} ms")
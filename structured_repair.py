@@ -0,0 +1,316 @@
+"""
+Local repair of structured model output.
+
+`with_structured_output` discards a response as soon as one value does not
+validate (a category outside the enum, a confidence of 85 instead of 0.85,
+JSON cut off by the token limit). `RepairingStructuredModel` asks for the raw
+output as well and, when parsing fails, repairs it locally:
+
+1. lenient JSON: code fences, trailing commas, Python literals, truncated
+   strings / objects / arrays are closed
+2. coercion against the schema: enum values matched by their words
+   ('bio-pesticide' -> 'Biological/Natural'), numbers parsed from text
+   ('72/100', '85%') and clamped to the field's bounds, lists / strings fixed up,
+   invalid list items dropped when valid ones remain
+3. only if fields are still invalid: one re-prompt for just those fields,
+   merged into the repaired answer
+
+REPAIR_STATS counts per schema how many responses parsed cleanly, were repaired
+locally, needed a field re-prompt or could not be saved.
+
+Usage:
+    python structured_repair.py   # repair a few malformed sample outputs
+"""
+import ast
+import json
+import re
+import threading
+import typing
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError, create_model
+
+from cancellation import check_cancelled
+
+# ---------------------------------------------------------
+# 1. LENIENT JSON
+# ---------------------------------------------------------
+def _close_truncated(text: str) -> str:
+    """Closes strings / brackets left open by a truncated response, dropping a dangling key or comma."""
+    stack, in_string, escaped = [], False, False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = text.rstrip()
+    # A key without its value cannot be completed: drop it (and its comma)
+    text = re.sub(r',?\s*"[^"]*"\s*:\s*$', "", text)
+    if stack and stack[-1] == "}":
+        text = re.sub(r'([{,])\s*"[^"]*"$', r"\1", text)
+    text = re.sub(r",\s*$", "", text)
+    return text + "".join(reversed(stack))
+
+
+def lenient_json(text: str) -> Any:
+    """Parses model output that is almost JSON. Raises ValueError if nothing usable is found."""
+    text = re.sub(r"^```(?:json)?\s*|\s*```\s*$", "", (text or "").strip())
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise ValueError("no JSON object in model output")
+    text = text[start:]
+    try:
+        return json.JSONDecoder().raw_decode(text)[0]
+    except ValueError:
+        pass
+    # A Python literal (single quotes, True / None) instead of JSON
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        pass
+    text = re.sub(r"\bTrue\b", "true", re.sub(r"\bFalse\b", "false", re.sub(r"\bNone\b", "null", text)))
+    text = re.sub(r",\s*([}\]])", r"\1", text)
+    try:
+        return json.JSONDecoder().raw_decode(text)[0]
+    except ValueError:
+        return json.loads(re.sub(r",\s*([}\]])", r"\1", _close_truncated(text)))
+
+
+# ---------------------------------------------------------
+# 2. COERCION AGAINST THE SCHEMA
+# ---------------------------------------------------------
+def _words(text: str) -> set:
+    return set(re.findall(r"[a-z]+", str(text).lower()))
+
+
+# Words a model uses for an enum value without using the value itself
+ENUM_SYNONYMS = {
+    "Biological/Natural": {"bio", "biopesticide", "botanical", "organic", "microbial", "ipm", "neem", "pheromone"},
+    "Synthetic": {"chemical", "insecticide", "fungicide", "conventional"},
+}
+
+
+def coerce_choice(value: Any, choices: Tuple[str, ...]) -> Any:
+    """Maps a free-form value onto one of the allowed choices (unchanged if none matches)."""
+    if value in choices:
+        return value
+    text = str(value).strip().lower()
+    for choice in choices:
+        if text == choice.lower():
+            return choice
+    words = _words(text)
+    scored = [(len(words & (_words(choice) | ENUM_SYNONYMS.get(choice, set()))), choice) for choice in choices]
+    best = max(scored, default=(0, None))
+    if best[0] and sum(1 for score, _ in scored if score == best[0]) == 1:
+        return best[1]
+    return value
+
+
+def _bounds(field) -> Tuple[Optional[float], Optional[float]]:
+    low = high = None
+    for meta in field.metadata:
+        low = getattr(meta, "ge", getattr(meta, "gt", low))
+        high = getattr(meta, "le", getattr(meta, "lt", high))
+    return low, high
+
+
+def coerce_number(value: Any, kind: type, low: Optional[float], high: Optional[float]) -> Any:
+    if isinstance(value, str):
+        match = re.search(r"-?\d+(?:\.\d+)?", value)
+        if not match:
+            return value
+        number = float(match.group(0))
+        # '85%' for a 0..1 field
+        if "%" in value and high is not None and high <= 1:
+            number /= 100
+        value = number
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return value
+    # A percentage given for a 0..1 score
+    if high is not None and high <= 1 < value <= 100:
+        value = value / 100
+    if low is not None:
+        value = max(value, low)
+    if high is not None:
+        value = min(value, high)
+    return int(round(value)) if kind is int else float(value)
+
+
+def coerce_value(annotation: Any, field, value: Any) -> Any:
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        options = [a for a in typing.get_args(annotation) if a is not type(None)]
+        return value if value is None else coerce_value(options[0], field, value)
+    if origin is typing.Literal:
+        return coerce_choice(value, typing.get_args(annotation))
+    if origin in (list, List):
+        item_type = typing.get_args(annotation)[0]
+        items = value if isinstance(value, list) else [value]
+        if isinstance(item_type, type) and issubclass(item_type, BaseModel):
+            repaired = [coerce_model(item_type, item) for item in items if isinstance(item, dict)]
+            valid = [item for item in repaired if _is_valid(item_type, item)]
+            return valid or repaired
+        return [coerce_value(item_type, field, item) for item in items]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return coerce_model(annotation, value) if isinstance(value, dict) else value
+    if annotation in (int, float):
+        return coerce_number(value, annotation, *_bounds(field))
+    if annotation is str:
+        if isinstance(value, list):
+            return "; ".join(str(v) for v in value)
+        if isinstance(value, (int, float, bool)):
+            return str(value)
+    return value
+
+
+def coerce_model(schema: Type[BaseModel], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of `data` with every known field coerced towards the schema (unknown keys dropped)."""
+    return {name: coerce_value(field.annotation, field, data[name])
+            for name, field in schema.model_fields.items() if name in data}
+
+
+def _is_valid(schema: Type[BaseModel], data: Dict[str, Any]) -> bool:
+    try:
+        schema.model_validate(data)
+        return True
+    except ValidationError:
+        return False
+
+
+def invalid_fields(schema: Type[BaseModel], data: Dict[str, Any]) -> Dict[str, str]:
+    """Top-level field -> first validation message."""
+    try:
+        schema.model_validate(data)
+        return {}
+    except ValidationError as e:
+        failing = {}
+        for error in e.errors():
+            failing.setdefault(str(error["loc"][0]), error["msg"])
+        return failing
+
+
+def repair(schema: Type[BaseModel], raw: Any) -> Tuple[Optional[BaseModel], Dict[str, Any], Dict[str, str]]:
+    """(instance or None, repaired data, still-invalid fields) for raw text or an already-parsed dict."""
+    data = raw if isinstance(raw, dict) else lenient_json(raw)
+    if isinstance(data, list) and len(schema.model_fields) == 1:
+        data = {next(iter(schema.model_fields)): data}
+    if not isinstance(data, dict):
+        raise ValueError(f"expected a JSON object for {schema.__name__}")
+    data = coerce_model(schema, data)
+    failing = invalid_fields(schema, data)
+    return (None if failing else schema.model_validate(data)), data, failing
+
+
+# ---------------------------------------------------------
+# 3. THE WRAPPER
+# ---------------------------------------------------------
+class RepairStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_schema: Dict[str, Dict[str, int]] = {}
+
+    def record(self, schema: str, outcome: str) -> None:
+        with self._lock:
+            entry = self.by_schema.setdefault(schema, {"ok": 0, "repaired": 0, "reprompted": 0, "failed": 0})
+            entry[outcome] += 1
+
+    def report(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {schema: dict(entry) for schema, entry in self.by_schema.items()}
+
+
+REPAIR_STATS = RepairStats()
+
+
+def _raw_text(raw: Any) -> str:
+    content = getattr(raw, "content", raw)
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content if isinstance(content, str) else json.dumps(content)
+
+
+class RepairingStructuredModel:
+    """`invoke(messages) -> schema instance`, repairing invalid output instead of failing."""
+
+    def __init__(self, chat_model: Any, schema: Type[BaseModel]):
+        self.chat_model = chat_model
+        self.schema = schema
+        self.runnable = chat_model.with_structured_output(schema, include_raw=True)
+
+    def invoke(self, messages: List[Any], *args, **kwargs) -> BaseModel:
+        # Every structured model call passes here: the last point to stop a cancelled run
+        check_cancelled()
+        result = self.runnable.invoke(messages, *args, **kwargs)
+        name = self.schema.__name__
+        if result.get("parsed") is not None:
+            REPAIR_STATS.record(name, "ok")
+            return result["parsed"]
+
+        error = result.get("parsing_error") or ValueError(f"empty {name} response")
+        try:
+            instance, data, failing = repair(self.schema, _raw_text(result.get("raw")))
+        except ValueError:
+            REPAIR_STATS.record(name, "failed")
+            raise error
+        if instance is not None:
+            print(f"   🩹 Repaired malformed {name} output locally.")
+            REPAIR_STATS.record(name, "repaired")
+            return instance
+
+        instance = self._reprompt(messages, data, failing)
+        if instance is None:
+            REPAIR_STATS.record(name, "failed")
+            raise error
+        REPAIR_STATS.record(name, "reprompted")
+        return instance
+
+    def _reprompt(self, messages: List[Any], data: Dict[str, Any], failing: Dict[str, str]) -> Optional[BaseModel]:
+        """Asks only for the still-invalid fields and merges them into the repaired answer."""
+        fields = {name: (self.schema.model_fields[name].annotation, self.schema.model_fields[name])
+                  for name in failing}
+        partial_schema = create_model(f"{self.schema.__name__}Fields", **fields)
+        problems = "; ".join(f"{name}: {message}" for name, message in failing.items())
+        print(f"   🩹 Re-prompting {self.schema.__name__} fields: {', '.join(failing)}")
+        check_cancelled()
+        try:
+            fixed = self.chat_model.with_structured_output(partial_schema).invoke(list(messages) + [
+                {"role": "assistant", "content": json.dumps(data, default=str)[:4000]},
+                {"role": "user", "content": f"These fields of your answer are invalid ({problems}). "
+                                            f"Return only corrected values for them."},
+            ])
+            merged = coerce_model(self.schema, {**data, **fixed.model_dump()})
+            return self.schema.model_validate(merged)
+        except Exception as e:
+            print(f"   ⚠️ Field re-prompt failed: {e}")
+            return None
+
+
+if __name__ == "__main__":
+    from pesticide_finder import PesticideResponse
+    from pest_detector import PestConclusion
+    from sustainability_analyzer import SustainabilityReport
+
+    samples = [
+        (PestConclusion, '```json\n{"confirmed_pest": "Aphids", "confidence_score": 85, "decision_reasoning": "Matches",}\n```'),
+        (PesticideResponse, '{"recommendations": [{"chemical_name": "Neem Oil 1500 ppm", "category": "Bio-pesticide", '
+                            '"brand_name": "Generic", "dosage": "5 ml/L", "safety_period": "3", "estimated_cost": "300"}, '
+                            '{"chemical_name": "Imidacloprid 17.8% SL", "category": "chemical insecticide", "brand_na'),
+        (SustainabilityReport, "{'treatments_analysis': [], 'overall_eco_score': '72/100', 'optimization_tip': None}"),
+    ]
+    for schema, raw in samples:
+        try:
+            instance, data, failing = repair(schema, raw)
+            print(f"{schema.__name__}: {'OK' if instance else 'still invalid ' + str(failing)}\n   {data}")
+        except ValueError as e:
+            print(f"{schema.__name__}: unrecoverable ({e})")
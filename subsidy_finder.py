@@ -1,14 +1,38 @@
 import json
-from typing import Dict, List
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
+from cascade import run_cascade
+from deadline import fits
+from reference_data import REFERENCE_DATA
+from prompt_cache import PromptPrefix, prompt_messages, static_prefix
+from result_cache import cache_key, cached_result, store_result, version_hash
 import os
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SCHEME_PATH = os.path.join(BASE_DIR, "schemes.json")
 
-with open(SCHEME_PATH, "r", encoding="utf-8") as f:
-    SUBSIDY_DB = json.load(f)
+MODEL_NAME = "gemini-2.5-flash-lite"
+
+
+def load_subsidy_db(path: str) -> Dict:
+    """Parses and validates schemes.json (every scheme needs a name)."""
+    with open(path, "r", encoding="utf-8") as f:
+        db = json.load(f)
+    if not isinstance(db.get("central"), list) or not isinstance(db.get("states", {}), dict):
+        raise ValueError("schemes.json needs a 'central' list and a 'states' mapping.")
+    groups = [db["central"], *db.get("states", {}).values(), *db.get("union_territories", {}).values()]
+    for schemes in groups:
+        if not isinstance(schemes, list) or not all(isinstance(s, dict) and s.get("name") for s in schemes):
+            raise ValueError("Every scheme must be an object with a 'name'.")
+    return db
+
+
+REFERENCE_DATA.register("schemes", SCHEME_PATH, load_subsidy_db)
+
+
+def get_subsidy_db() -> Dict:
+    """Current schemes.json contents (parsed on first use, swapped in when the file changes)."""
+    return REFERENCE_DATA.get("schemes")
 
 class ExplainedScheme(BaseModel):
     scheme_name: str
@@ -23,34 +47,7 @@ class SubsidyResponse(BaseModel):
     general_guidance: str
 
 
-def subsidy_finder_node(state: Dict) -> Dict:
-    print("\n--- [Node D] Subsidy Finder: Knowledge Base Mode ---")
-
-    location = state.get("location", "").strip()
-
-    central_schemes = SUBSIDY_DB.get("central", [])
-    state_schemes = SUBSIDY_DB.get("states", {}).get(location, [])
-
-    
-    if not state_schemes:
-        print(f"   ⚠️ No state schemes found for {location}. Falling back to central schemes only.")
-        applicable_schemes = central_schemes
-    else:
-        applicable_schemes = central_schemes + state_schemes
-
-    if not applicable_schemes:
-        return {
-            "subsidy_info": [],
-            "error": "No subsidy schemes available in knowledge base."
-        }
-
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash-lite",
-        temperature=0
-    )
-    structured_llm = llm.with_structured_output(SubsidyResponse)
-
-    SYSTEM_PROMPT = """
+SYSTEM_PROMPT = """
 <Role>
 You are a Government Agricultural Extension Officer AI for India.
 You specialize in explaining subsidy schemes related to pest management, plant protection,
@@ -179,23 +176,110 @@ generate a clear, accurate, farmer-friendly explanation of applicable subsidy sc
 
 """
 
+# Cached explanations are only valid for the prompt and schema that produced them
+SUBSIDY_CACHE_VERSION = version_hash(SYSTEM_PROMPT, SubsidyResponse.schema())
+
+
+def subsidy_memo_version() -> str:
+    """Node-memo version: the prompt plus the content of the live schemes.json."""
+    return f"{SUBSIDY_CACHE_VERSION}.{REFERENCE_DATA.digest('schemes')[:12]}"
+
+
+def subsidy_prompt_prefix() -> PromptPrefix:
+    """Static part of every subsidy prompt: the rules plus the central schemes (the same for all states)."""
+    central_schemes = get_subsidy_db().get("central", [])
+    return static_prefix("subsidy_finder", f"""{SYSTEM_PROMPT}
+<Central Government Schemes (Verified Knowledge Base)>
+{json.dumps(central_schemes, indent=2)}
+</Central Government Schemes>
+""")
+
+
+def schemes_without_explanation(schemes: List[Dict]) -> List[Dict]:
+    """Maps knowledge-base entries straight to ExplainedScheme dicts (no LLM call)."""
+    return [
+        {
+            "scheme_name": scheme.get("name", "Unnamed scheme"),
+            "level": scheme.get("level", ""),
+            "benefit_details": scheme.get("subsidy_rate_or_benefit", "Varies by year and district."),
+            "eligibility": scheme.get("eligibility_criteria", "Subject to department approval."),
+            "explanation": scheme.get("detailed_description", ""),
+        }
+        for scheme in schemes
+    ]
+
+
+def validate_explanations(response: SubsidyResponse, schemes: List[Dict]) -> Optional[str]:
+    """Cascade check: schemes were explained and none was invented."""
+    if not response.schemes:
+        return "no schemes explained"
+    known = [scheme.get("name", "").lower() for scheme in schemes]
+    for explained in response.schemes:
+        name = explained.scheme_name.lower()
+        if not any(name in k or k in name for k in known if k):
+            return f"unknown scheme {explained.scheme_name!r}"
+    return None
+
+
+def subsidy_finder_node(state: Dict) -> Dict:
+    print("\n--- [Node D] Subsidy Finder: Knowledge Base Mode ---")
+
+    location = state.get("location", "").strip()
+
+    subsidy_db = get_subsidy_db()
+    central_schemes = subsidy_db.get("central", [])
+    state_schemes = subsidy_db.get("states", {}).get(location, [])
+
+    
+    if not state_schemes:
+        print(f"   ⚠️ No state schemes found for {location}. Falling back to central schemes only.")
+        applicable_schemes = central_schemes
+    else:
+        applicable_schemes = central_schemes + state_schemes
+
+    if not applicable_schemes:
+        return {
+            "subsidy_info": [],
+            "error": "No subsidy schemes available in knowledge base."
+        }
+
+    # The explanation depends only on the state and its schemes (a schemes.json edit changes the key)
+    subsidy_key = cache_key(SUBSIDY_CACHE_VERSION, location, version_hash(applicable_schemes))
+    cached = cached_result("subsidies", subsidy_key)
+    if cached is not None:
+        print(f"   🗃️ Subsidy explanations for {location or 'central schemes'} served from the result cache.")
+        return {"subsidy_info": cached, "error": None}
+
+    if not fits(state, "subsidy_finder", MODEL_NAME):
+        print("   ⏱️ Time budget exhausted. Returning knowledge-base schemes without explanation.")
+        return {
+            "subsidy_info": schemes_without_explanation(applicable_schemes),
+            "degradations": ["subsidy_finder: listed schemes without LLM explanation"],
+            "error": None
+        }
+
+    # Central schemes travel in the static prefix; only the state's own schemes vary per request
     user_message = f"""
 Farmer Location: {location}
 
-Available Subsidy Schemes (Verified Knowledge Base):
-{json.dumps(applicable_schemes, indent=2)}
+State Government Schemes (Verified Knowledge Base):
+{json.dumps(state_schemes, indent=2) if state_schemes else "None found for this state."}
 
-Explain each scheme clearly and practically for a farmer.
+Explain each central and state scheme clearly and practically for a farmer.
 """
 
     try:
-        response: SubsidyResponse = structured_llm.invoke([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_message}
-        ])
+        response, degradations = run_cascade(state, "subsidy_finder", SubsidyResponse,
+                                             prompt_messages(subsidy_prompt_prefix(), user_message),
+                                             validate=lambda r: validate_explanations(r, applicable_schemes))
+
+        explained = [scheme.dict() for scheme in response.schemes]
+        if not degradations:
+            store_result("subsidies", subsidy_key, explained)
 
         return {
-            "subsidy_info": [scheme.dict() for scheme in response.schemes],
+            "subsidy_info": explained,
+            "degradations": degradations,
             "error": None
         }
 
@@ -1,6 +1,20 @@
-from typing import Dict, List, Any
-from langchain_google_genai import ChatGoogleGenerativeAI
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
 from pydantic import BaseModel, Field
+from cascade import run_cascade
+from constants import get_climate_zone
+from deadline import fits, LIGHT_MODEL
+from retrieval_policy import FORMULATION_PATTERN
+from prompt_cache import prompt_messages, static_prefix
+from result_cache import cache_key, cached_result, store_result, version_hash
+
+MODEL_NAME = "gemini-2.5-flash"
+
+# Per-chemical assessments kept in memory (LRU)
+ECO_CACHE_SIZE = int(os.getenv("AGRI_ECO_CACHE_SIZE", "2048"))
 
 # --- PYDANTIC MODELS FOR STRUCTURED OUTPUT ---
 class TreatmentImpact(BaseModel):
@@ -9,98 +23,292 @@ class TreatmentImpact(BaseModel):
     toxicity_grade: str = Field(description="Grade from A (Bio-safe/Organic) to F (Highly Toxic/Synthetic).")
     water_risk: str = Field(description="Risk level for groundwater contamination (Low, Medium, High).")
     carbon_impact: str = Field(description="Estimated environmental/carbon footprint.")
+    eco_score: int = Field(ge=1, le=100, description="Sustainability score of this treatment alone, from 1 (very harmful) to 100 (harmless).")
     # --- NEW: The Analytical Engine ---
     calculation_and_logic: str = Field(description="Short, clear explanation of WHY these grades were given. Compare trade-offs (e.g., fast action vs. soil persistence) and justify risks based on chemical class, dosage, and location.")
 
 class SustainabilityReport(BaseModel):
     treatments_analysis: List[TreatmentImpact] = Field(description="Analysis of each recommended treatment.")
-    overall_eco_score: int = Field(description="An overall sustainability score from 1 to 100.")
+    overall_eco_score: int = Field(ge=1, le=100, description="An overall sustainability score from 1 to 100.")
     optimization_tip: str = Field(description="One clear, actionable tip. If only chemicals are found, provide a damage control protocol (e.g., buffer zones).")
 
-def sustainability_analyzer_node(state: Dict) -> Dict:
-    print("\n--- [Node E] Sustainability Analyzer: Evaluating Environmental Impact ---")
-    
-    pesticides_data = state.get("recommended_pesticides", [])
-    crop = state.get("crop", "Unknown Crop")
-    location = state.get("location", "Unknown Location")
-    
-    # If no pesticides were found, we skip the deep analysis
-    if not pesticides_data:
-        print("   ⚠️ No pesticides provided to analyze. Returning empty report.")
-        return {"environmental_impact_report": None, "error": None}
-
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0)
-    structured_llm = llm.with_structured_output(SustainabilityReport)
-    
-    # --- UPDATED SYSTEM PROMPT ---
-    SYSTEM_PROMPT = """
+SYSTEM_PROMPT = """
     <Role>
     You are an expert Environmental Agronomist and Sustainability Analyst.
     </Role>
     <Task>
     You will receive a list of proposed pesticide treatments (Biological and Synthetic) and their associated data.
-    Analyze each treatment as a Transparent Decision Engine. 
-    
+    Analyze each treatment as a Transparent Decision Engine.
+
     Crucial Instructions:
     1. For EACH treatment, provide a 'calculation_and_logic' paragraph. Explain the trade-offs (e.g., "Fast action but high persistence in soil (120+ days)" vs "Zero residue but requires 3x more frequent application").
-    2. Justify risks based on the chemical class, dosage provided, and the specific Location's typical climate.
-    3. Assign grades and provide an overall sustainability score (Heavily penalize toxic synthetics if bio-alternatives are available).
+    2. Justify risks based on the chemical class, dosage provided, and the given Climate Zone.
+    3. Assign grades and an 'eco_score' to EACH treatment on its own merits (do not compare it with the other treatments in the list), then provide an overall sustainability score (Heavily penalize toxic synthetics if bio-alternatives are available).
     4. Provide an 'optimization_tip'. If ONLY synthetic options exist, this tip MUST be a strict "Damage Control Protocol" (e.g., Nozzle types, 10-meter water buffer zones).
     </Task>
     """
-    
+
+PROMPT_PREFIX = static_prefix("sustainability_analyzer", SYSTEM_PROMPT)
+
+# Cached assessments are only valid for the prompt and schema that produced them
+PROMPT_VERSION = version_hash(SYSTEM_PROMPT, TreatmentImpact.schema())
+
+BUFFER_ZONE_TIP = "Maintain a 10-meter 'No-Spray Buffer' from water bodies and apply only during low-wind conditions to prevent ecological drift."
+
+# ----------------------------------------------------------------------
+# PER-CHEMICAL ASSESSMENT CACHE
+# ----------------------------------------------------------------------
+def chemical_key(chemical_name: str) -> str:
+    """
+    Active ingredient + formulation, independent of spelling and brand:
+    'Chlorantraniliprole 18.5% SC (Coragen)' -> 'chlorantraniliprole|18.5%sc'.
+    """
+    text = re.sub(r"\(.*?\)", " ", chemical_name or "")
+    formulation = "+".join(re.sub(r"\s+", "", m.group(0)).lower() for m in FORMULATION_PATTERN.finditer(text))
+    ingredient = " ".join(re.findall(r"[a-z0-9]+", FORMULATION_PATTERN.sub(" ", text).lower()))
+    return f"{ingredient}|{formulation}"
+
+
+class EcoAssessmentCache:
+    """
+    Bounded LRU of TreatmentImpact dicts keyed by (prompt version, chemical, climate zone),
+    in front of the persistent result cache (shared with other processes and the warm-up job).
+    """
+
+    def __init__(self, max_entries: int = ECO_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chemical_name: str, zone: str) -> Optional[Dict[str, Any]]:
+        key = (PROMPT_VERSION, chemical_key(chemical_name), zone)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry)
+        entry = cached_result("eco", cache_key(*key))
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(key, entry)
+        return dict(entry)
+
+    def put(self, chemical_name: str, zone: str, assessment: Dict[str, Any]) -> None:
+        key = (PROMPT_VERSION, chemical_key(chemical_name), zone)
+        self._remember(key, assessment)
+        store_result("eco", cache_key(*key), assessment)
+
+    def _remember(self, key: Tuple[str, str, str], assessment: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = dict(assessment)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "prompt_version": PROMPT_VERSION,
+            }
+
+
+ECO_CACHE = EcoAssessmentCache()
+
+
+def validate_report(response: SustainabilityReport, treatment_count: int) -> Optional[str]:
+    """Cascade check: every treatment graded and the eco-scores in range."""
+    if len(response.treatments_analysis) < treatment_count:
+        return f"{len(response.treatments_analysis)}/{treatment_count} treatments analysed"
+    if not 1 <= response.overall_eco_score <= 100:
+        return f"eco-score {response.overall_eco_score} out of range"
+    ungraded = [t.chemical_name for t in response.treatments_analysis if t.toxicity_grade.strip()[:1].upper() not in "ABCDEF"]
+    if ungraded:
+        return f"invalid toxicity grade for {ungraded[0]!r}"
+    unscored = [t.chemical_name for t in response.treatments_analysis if not 1 <= t.eco_score <= 100]
+    if unscored:
+        return f"eco-score out of range for {unscored[0]!r}"
+    return None
+
+def _treatment_fields(p: Any) -> Tuple[str, str, bool]:
+    # FIX: Updated keys to match Node C's Pydantic model
+    name = p.get("chemical_name", "Unknown Chemical") if isinstance(p, dict) else str(p)
+    cost = p.get("estimated_cost", "Data unavailable") if isinstance(p, dict) else "Data unavailable"
+    return name, str(cost), "synthetic" in str(p).lower()
+
+def build_fallback_treatment(p: Any) -> Dict[str, Any]:
+    """Rule-based assessment of one treatment from standard chemical-class profiles."""
+    name, cost, is_synthetic = _treatment_fields(p)
+    return {
+        "chemical_name": name,
+        "cost_estimate": cost,
+        "toxicity_grade": "C (Moderate)" if is_synthetic else "A (Bio-safe)",
+        "water_risk": "High" if is_synthetic else "Low",
+        "carbon_impact": "High footprint" if is_synthetic else "Minimal footprint",
+        "eco_score": 40 if is_synthetic else 80,
+        "calculation_and_logic": f"Fallback Analysis: Based on standard profiles, this {'synthetic chemical' if is_synthetic else 'biological agent'} poses {'moderate ecological risks regarding soil persistence and runoff' if is_synthetic else 'minimal risks to local biodiversity'}."
+    }
+
+def build_fallback_report(pesticides_data: List[Any]) -> Dict[str, Any]:
+    """Rule-based report from standard chemical-class profiles (no LLM call)."""
+    fallback_report = {
+        "treatments_analysis": [build_fallback_treatment(p) for p in pesticides_data],
+        "overall_eco_score": 50,
+        "optimization_tip": BUFFER_ZONE_TIP
+    }
+    return fallback_report
+
+def assemble_report(pesticides_data: List[Any], treatments: List[Dict[str, Any]],
+                    optimization_tip: Optional[str] = None) -> Dict[str, Any]:
+    """Report from per-treatment assessments; the overall score is the mean of the treatment scores."""
+    for p, treatment in zip(pesticides_data, treatments):
+        # Name and cost come from this run's search, not from whoever first assessed the chemical
+        treatment["chemical_name"], treatment["cost_estimate"], _ = _treatment_fields(p)
+    scores = [t["eco_score"] for t in treatments if isinstance(t.get("eco_score"), int)]
+    if optimization_tip is None:
+        has_bio = any(not _treatment_fields(p)[2] for p in pesticides_data)
+        optimization_tip = ("Start with the biological option and keep the synthetic one as a last resort; "
+                            + BUFFER_ZONE_TIP[0].lower() + BUFFER_ZONE_TIP[1:]) if has_bio else BUFFER_ZONE_TIP
+    return {
+        "treatments_analysis": treatments,
+        "overall_eco_score": round(sum(scores) / len(scores)) if scores else 50,
+        "optimization_tip": optimization_tip
+    }
+
+def _ingredient(chemical_name: str) -> str:
+    return chemical_key(chemical_name).split("|")[0]
+
+def _match_assessments(unseen: List[Any], analysed: List[TreatmentImpact]) -> List[Tuple[Dict[str, Any], bool]]:
+    """
+    Pairs LLM assessments with the requested treatments: by normalized name, else by active
+    ingredient alone ('Neem Oil 1500 ppm' ~ 'Neem Oil (Azadirachtin 0.15% EC)'). Each assessment
+    is used once. A leftover one is paired by position but marked unverified (the LLM may have
+    reordered or renamed its answers), so it is shown but never cached. Returns (assessment, verified).
+    """
+    names = [_treatment_fields(p)[0] for p in unseen]
+    found: List[Optional[int]] = [None] * len(unseen)
+    free = list(range(len(analysed)))
+    for key_of in (chemical_key, _ingredient):
+        for i, name in enumerate(names):
+            if found[i] is None:
+                match = next((j for j in free if key_of(analysed[j].chemical_name) == key_of(name)), None)
+                if match is not None:
+                    found[i] = match
+                    free.remove(match)
+    verified = [index is not None for index in found]
+    for i in range(len(unseen)):
+        if found[i] is None and i in free:
+            found[i] = i
+            free.remove(i)
+
+    matched = []
+    for i, p in enumerate(unseen):
+        if found[i] is None:
+            matched.append((build_fallback_treatment(p), False))
+        else:
+            matched.append(({**analysed[found[i]].dict(), "chemical_name": names[i]}, verified[i]))
+    return matched
+
+def sustainability_analyzer_node(state: Dict) -> Dict:
+    print("\n--- [Node E] Sustainability Analyzer: Evaluating Environmental Impact ---")
+
+    pesticides_data = state.get("recommended_pesticides", [])
+    crop = state.get("crop", "Unknown Crop")
+    location = state.get("location", "Unknown Location")
+
+    # If no pesticides were found, we skip the deep analysis
+    if not pesticides_data:
+        print("   ⚠️ No pesticides provided to analyze. Returning empty report.")
+        return {"environmental_impact_report": None, "error": None}
+
+    # --- PER-CHEMICAL CACHE: only unseen chemicals go to the LLM ---
+    zone = get_climate_zone(location)
+    treatments = [ECO_CACHE.get(_treatment_fields(p)[0], zone) for p in pesticides_data]
+    unseen = [i for i, t in enumerate(treatments) if t is None]
+    print(f"   🗃️ {len(pesticides_data) - len(unseen)}/{len(pesticides_data)} treatment assessments cached ({zone} zone).")
+
+    if not unseen:
+        report = assemble_report(pesticides_data, treatments)
+        print(f"   ✅ Eco-Score Assembled from cache: {report['overall_eco_score']}/100")
+        return {"environmental_impact_report": report, "error": None}
+
+    if not fits(state, "sustainability_analyzer", LIGHT_MODEL):
+        print("   ⏱️ Time budget exhausted. Using rule-based sustainability report.")
+        if len(unseen) == len(pesticides_data):
+            report = build_fallback_report(pesticides_data)
+        else:
+            for i in unseen:
+                treatments[i] = build_fallback_treatment(pesticides_data[i])
+            report = assemble_report(pesticides_data, treatments)
+        return {
+            "environmental_impact_report": report,
+            "degradations": ["sustainability_analyzer: rule-based report instead of LLM analysis"],
+            "error": None
+        }
+
+    degradations = []
+    unseen_data = [pesticides_data[i] for i in unseen]
+
     user_message = f"""
     Crop: {crop}
     Location: {location}
-    Proposed Treatments data: {pesticides_data}
-    
+    Climate Zone: {zone}
+    Proposed Treatments data: {unseen_data}
+
     Generate a full analytical sustainability and cost impact report.
     """
 
     try:
-        response: SustainabilityReport = structured_llm.invoke([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_message}
-        ])
-        
-        report_dict = response.dict()
+        response, notes = run_cascade(state, "sustainability_analyzer", SustainabilityReport,
+                                      prompt_messages(PROMPT_PREFIX, user_message),
+                                      validate=lambda r: validate_report(r, len(unseen_data)))
+        degradations += notes
+
+        for i, (assessment, verified) in zip(unseen, _match_assessments(unseen_data, response.treatments_analysis)):
+            treatments[i] = assessment
+            # Only assessments matched by name are shared with other requests, and only answers
+            # kept without escalation (deadline)
+            if verified and not notes:
+                ECO_CACHE.put(assessment["chemical_name"], zone, assessment)
+            elif not verified:
+                print(f"   ⚠️ No assessment named '{assessment['chemical_name']}'; paired by position, not cached.")
+        # A tip written for only part of the list would ignore the cached treatments
+        tip = response.optimization_tip if len(unseen) == len(pesticides_data) else None
+        report_dict = assemble_report(pesticides_data, treatments, tip)
         print(f"   ✅ Eco-Score Calculated: {report_dict['overall_eco_score']}/100")
-        
+
         return {
             "environmental_impact_report": report_dict,
+            "degradations": degradations,
             "error": None
         }
 
     except Exception as e:
         error_msg = f"Error in Sustainability Analyzer LLM call: {e}"
         print(f"   ❌ {error_msg}")
-        
+
         # --- HACKATHON SAFETY NET ---
         print("   ⚠️ Crash detected. Injecting fallback sustainability report.")
-        
-        fallback_treatments = []
-        for p in pesticides_data:
-            # FIX: Updated keys to match Node C's Pydantic model
-            name = p.get("chemical_name", "Unknown Chemical") if isinstance(p, dict) else str(p)
-            cost = p.get("estimated_cost", "Data unavailable") if isinstance(p, dict) else "Data unavailable"
-            is_synthetic = "synthetic" in str(p).lower()
-            
-            fallback_treatments.append({
-                "chemical_name": name,
-                "cost_estimate": str(cost),
-                "toxicity_grade": "C (Moderate)" if is_synthetic else "A (Bio-safe)",
-                "water_risk": "High" if is_synthetic else "Low",
-                "carbon_impact": "High footprint" if is_synthetic else "Minimal footprint",
-                "calculation_and_logic": f"Fallback Analysis: Based on standard profiles, this {'synthetic chemical' if is_synthetic else 'biological agent'} poses {'moderate ecological risks regarding soil persistence and runoff' if is_synthetic else 'minimal risks to local biodiversity'}."
-            })
-
-        fallback_report = {
-            "treatments_analysis": fallback_treatments,
-            "overall_eco_score": 50,
-            "optimization_tip": "Maintain a 10-meter 'No-Spray Buffer' from water bodies and apply only during low-wind conditions to prevent ecological drift."
-        }
-        
+
+        if len(unseen) == len(pesticides_data):
+            fallback_report = build_fallback_report(pesticides_data)
+        else:
+            for i in unseen:
+                treatments[i] = build_fallback_treatment(pesticides_data[i])
+            fallback_report = assemble_report(pesticides_data, treatments)
+
         return {
             "environmental_impact_report": fallback_report,
+            "degradations": degradations,
             "error": str(e)
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,160 @@
+"""
+Cold-start helpers.
+
+* `warm_up()` pre-compiles the graph, loads reference data, opens the LLM /
+  search clients and uploads the cacheable prompt prefixes so the first real
+  request does not pay for them.
+* `start_background_warmup()` runs the same steps on a daemon thread (once per
+  process). Set AGRI_WARMUP=0 to disable it.
+* `profile_imports()` reports the slowest imports of a module using
+  `python -X importtime`.
+
+Usage:
+    python warmup.py                        # run the warm-up and print step timings
+    python warmup.py --profile-imports app  # import-time profile (default: graph)
+"""
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+_warmup_thread: Optional[threading.Thread] = None
+_warmup_lock = threading.Lock()
+
+
+# ---------------------------------------------------------
+# 1. WARM-UP STEPS
+# ---------------------------------------------------------
+def _compile_graph() -> None:
+    from graph import get_app
+    get_app()
+
+
+def _load_reference_data() -> None:
+    from subsidy_finder import get_subsidy_db
+    from pest_lexicon import get_pest_lexicon
+    get_subsidy_db()
+    get_pest_lexicon()
+
+
+def _open_llm_clients() -> None:
+    from clients import get_structured_model
+    from cascade import cascade_models
+    import image_analyzer, pest_detector, pesticide_finder, sustainability_analyzer, subsidy_finder
+
+    get_structured_model(image_analyzer.MODEL_NAME, image_analyzer.PestAnalysis)
+    for node, schema in [
+        ("pest_detector", pest_detector.PestConclusion),
+        ("pesticide_finder", pesticide_finder.PesticideResponse),
+        ("sustainability_analyzer", sustainability_analyzer.SustainabilityReport),
+        ("subsidy_finder", subsidy_finder.SubsidyResponse),
+    ]:
+        # Every model of the node's cascade, so an escalation does not pay for client creation
+        for model_name in cascade_models(node):
+            get_structured_model(model_name, schema)
+
+
+def _register_prompt_prefixes() -> None:
+    from cascade import cascade_models
+    from prompt_cache import CONTEXT_CACHES
+    import pest_detector, pesticide_finder, sustainability_analyzer, subsidy_finder
+
+    for node, prefix in [
+        ("pest_detector", pest_detector.PROMPT_PREFIX),
+        ("pesticide_finder", pesticide_finder.PROMPT_PREFIX),
+        ("sustainability_analyzer", sustainability_analyzer.PROMPT_PREFIX),
+        ("subsidy_finder", subsidy_finder.subsidy_prompt_prefix()),
+    ]:
+        # Uploads the prefixes large enough for provider-side caching (no-op for the others)
+        for model_name in cascade_models(node):
+            CONTEXT_CACHES.handle(model_name, prefix)
+
+
+def _open_search_client() -> None:
+    from search import get_search_tool
+    from evidence_store import get_evidence_store
+    get_evidence_store()
+    from retrieval_policy import VERIFICATION_POLICY, PESTICIDE_POLICY
+    # Every result count the adaptive retrieval policies can request
+    for policy in (VERIFICATION_POLICY, PESTICIDE_POLICY):
+        for max_results in range(policy.start, policy.maximum + 1, policy.step):
+            get_search_tool(max_results)
+
+
+WARMUP_STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("compile_graph", _compile_graph),
+    ("reference_data", _load_reference_data),
+    ("llm_clients", _open_llm_clients),
+    ("prompt_prefixes", _register_prompt_prefixes),
+    ("search_client", _open_search_client),
+]
+
+
+def warm_up() -> Dict[str, float]:
+    """Runs every warm-up step, returning per-step seconds. Failing steps are logged and skipped."""
+    timings = {}
+    for name, step in WARMUP_STEPS:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            # Missing API keys etc. must never break startup; the step will simply run lazily later.
+            print(f"   ⚠️ Warm-up step '{name}' failed: {e}")
+        timings[name] = time.perf_counter() - start
+    print("   🔥 Warm-up done: " + ", ".join(f"{k}={v:.2f}s" for k, v in timings.items()))
+    return timings
+
+
+def start_background_warmup() -> Optional[threading.Thread]:
+    """Starts `warm_up()` on a daemon thread once per process (no-op on Streamlit reruns)."""
+    global _warmup_thread
+    if os.getenv("AGRI_WARMUP", "1") == "0":
+        return None
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warm_up, name="agri-warmup", daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+# ---------------------------------------------------------
+# 2. IMPORT-TIME PROFILING
+# ---------------------------------------------------------
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+def profile_imports(module: str = "graph", top: int = 15) -> List[Tuple[str, float, float]]:
+    """
+    Imports `module` in a fresh interpreter with `-X importtime` and prints the
+    slowest imports as (name, self ms, cumulative ms), sorted by cumulative time.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            rows.append((name, int(self_us) / 1000, int(cumulative_us) / 1000))
+
+    rows.sort(key=lambda row: row[2], reverse=True)
+    print(f"--- Import profile for '{module}' (top {top} by cumulative time) ---")
+    for name, self_ms, cumulative_ms in rows[:top]:
+        print(f"   {cumulative_ms:9.1f} ms  (self {self_ms:7.1f} ms)  {name}")
+    return rows[:top]
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    if "--profile-imports" in sys.argv:
+        index = sys.argv.index("--profile-imports")
+        target = sys.argv[index + 1] if len(sys.argv) > index + 1 else "graph"
+        profile_imports(target)
+    else:
+        warm_up()